@@ -0,0 +1,4 @@
+"""
+Benchmarks for the app's performance-sensitive parts.
+Run them from the repository root, for example: python -m benchmarks.iteration
+"""
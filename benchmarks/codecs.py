@@ -0,0 +1,63 @@
+"""
+Compares the JSON and binary value codecs of KVDatabase:
+encode and decode time for a few kinds of payloads, and how much space they take on disk.
+"""
+import pathlib
+import random
+import sqlite3
+import tempfile
+import time
+
+from steamdeck_robotcontrol.persistence.codecs import BINARY_CODEC, JSON_CODEC
+from steamdeck_robotcontrol.persistence.connection import SharedConnection
+from steamdeck_robotcontrol.persistence.database import KVDatabase
+
+ROWS = 200
+REPEATS = 20
+
+
+def payloads():
+    rng = random.Random(0)
+    return {
+        "server config": {"name": "Robot", "address": "ws://192.168.1.10:8765", "video_transport": "udp"},
+        "latency array (10k floats)": [rng.random() * 0.1 for _ in range(10_000)],
+        "calibration table (64x64)": [[rng.uniform(-1, 1) for _ in range(64)] for _ in range(64)],
+        "frame counters (10k ints)": [rng.randrange(1 << 20) for _ in range(10_000)],
+        "session records": [{"t": i * 0.016, "latency": rng.random(), "dropped": i % 7 == 0} for i in range(1000)],
+    }
+
+
+def per_call(fn, repeats: int = REPEATS) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def file_size(path: pathlib.Path, codec, value) -> int:
+    """Size of a fresh database file holding ROWS copies of the value."""
+    conn = sqlite3.connect(path)
+    db = KVDatabase(SharedConnection(path, conn=conn), "bench")
+    with db.batch():
+        for i in range(ROWS):
+            db.set(f"key{i}", value, codec=codec)
+    conn.execute("VACUUM")
+    conn.close()
+    return path.stat().st_size
+
+
+def main():
+    print(f"{'payload':<28} {'codec':<7} {'bytes':>9} {'encode ms':>10} {'decode ms':>10} {'file KiB':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, value in payloads().items():
+            for codec in (JSON_CODEC, BINARY_CODEC):
+                encoded = codec.encode(value)
+                assert codec.decode(encoded) == value
+                encode = per_call(lambda: codec.encode(value))
+                decode = per_call(lambda: codec.decode(encoded))
+                size = file_size(pathlib.Path(tmp) / f"{codec.name}-{len(encoded)}.sqlite3", codec, value)
+                print(f"{name:<28} {codec.name:<7} {len(encoded):>9} {encode * 1000:>10.3f} {decode * 1000:>10.3f} {size / 1024:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Compares two benchmark result files, such as those written by benchmarks.kvdatabase,
+and exits with status 1 if anything got slower by more than the threshold.
+
+    python -m benchmarks.compare before.json after.json --threshold 0.2
+"""
+import argparse
+import json
+import pathlib
+import sys
+from typing import Dict
+
+
+def load(path: pathlib.Path) -> Dict[str, float]:
+    report = json.loads(path.read_text())
+    return {result["benchmark"]: result["seconds_per_op"] for result in report["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline", type=pathlib.Path)
+    parser.add_argument("current", type=pathlib.Path)
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown that counts as a regression (default 0.2, that is 20%%)")
+    args = parser.parse_args()
+
+    baseline, current = load(args.baseline), load(args.current)
+    regressions = 0
+    print(f"{'benchmark':<44} {'baseline us':>12} {'current us':>12} {'change':>8}")
+    for name in sorted(baseline.keys() | current.keys()):
+        if name not in baseline or name not in current:
+            print(f"{name:<44} {'only in ' + ('current' if name in current else 'baseline'):>34}")
+            continue
+        before, after = baseline[name], current[name]
+        change = (after - before) / before if before else 0.0
+        marker = ""
+        if change > args.threshold:
+            marker = "  REGRESSION"
+            regressions += 1
+        elif change < -args.threshold:
+            marker = "  faster"
+        print(f"{name:<44} {before * 1e6:>12.2f} {after * 1e6:>12.2f} {change:>+8.0%}{marker}")
+
+    if regressions:
+        print(f"{regressions} benchmarks got slower by more than {args.threshold:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
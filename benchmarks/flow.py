@@ -0,0 +1,78 @@
+"""
+Runs the whole app headless through the menu -> connect -> drive flow, against a stand-in robot on loopback,
+and reports the frame times. Each run uses a fresh data directory, so it's repeatable, for example in CI.
+
+    python -m benchmarks.flow
+    python -m benchmarks.flow --timeline session.jsonl --dump-frames 30,200 --output flow_bench.json
+
+A --timeline recorded from a real session (ROBOTCONTROL_RECORD_EVENTS) replaces the scripted drive;
+it must start from the main menu, whose first entry is the stand-in robot.
+"""
+import argparse
+import json
+import os
+import pathlib
+import sys
+import tempfile
+
+from steamdeck_robotcontrol import harness
+
+
+def scripted_drive():
+    """Pick the stand-in in the menu, connect, drive forward, turn, stop, and leave."""
+    timeline = []
+    # In the server list, select the first item with the d-pad and pick it;
+    # then in the server's menu, pick its default item, "Connect to this server"
+    timeline += [harness.hat(0.8, (0, -1)), harness.hat(0.9, (0, 0))]
+    timeline += harness.press(1.0, 0)
+    timeline += harness.press(1.5, 0)
+    # Forward with the left stick, then turn by driving the sides in opposite directions
+    timeline += [harness.axis(3.0, 1, -1.0), harness.axis(5.0, 1, 0.0)]
+    timeline += [harness.axis(5.0, 1, -0.8), harness.axis(5.0, 4, 0.8), harness.axis(7.0, 1, 0.0), harness.axis(7.0, 4, 0.0)]
+    timeline += harness.press(7.5, 9)  # Emergency stop
+    timeline += harness.press(8.0, 6)  # Leave the control screen
+    return timeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--timeline", type=pathlib.Path, help="Recorded event timeline to use instead of the scripted drive")
+    parser.add_argument("--linger", type=float, default=1.0, help="Seconds to keep running after the last event")
+    parser.add_argument("--dump-frames", default="", help="Comma-separated frame numbers to save as PNG")
+    parser.add_argument("--output", type=pathlib.Path, help="Write the results as JSON here")
+    args = parser.parse_args()
+
+    data_directory = tempfile.mkdtemp(prefix="robotcontrol-flow-")
+    os.environ["ROBOTCONTROL_DATA_DIR"] = data_directory
+    harness.use_dummy_drivers()
+    from steamdeck_robotcontrol import persistence
+    from steamdeck_robotcontrol.screens.main_menu import open_servers_config
+    from steamdeck_robotcontrol.server.standin import StandInRobot
+
+    with StandInRobot() as robot:
+        servers = open_servers_config()
+        servers["servers"] = [{"name": "Stand-in", "address": robot.address}]
+        servers.flush()
+
+        timeline = harness.load_timeline(args.timeline) if args.timeline else scripted_drive()
+        dump_frames = [int(number) for number in args.dump_frames.split(",") if number]
+        result = harness.run_app(timeline, args.linger, dump_frames, pathlib.Path(data_directory) / "frames")
+        commands = {kind.decode(): count for kind, count in robot.commands.items()}
+
+    summary = result.summary()
+    print(f"{summary['frames']} frames in {summary.get('seconds', 0):.1f} s")
+    for name in ("fps", "p50_ms", "p95_ms", "p99_ms", "max_ms"):
+        if name in summary:
+            print(f"  {name:<8} {summary[name]:8.2f}")
+    print(f"Commands received by the stand-in: {commands}")
+    for path in result.dumped:
+        print(f"Saved {path}")
+    if args.output:
+        args.output.write_text(json.dumps({"summary": summary, "commands": commands, "frame_seconds": result.frame_seconds}, indent=2))
+    if not commands.get("T"):
+        print("The drive didn't reach the stand-in robot", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Reports what importing the modules on the way to the main menu costs, using python -X importtime in a fresh interpreter,
+and whether any of the heavy modules that are only needed once a connection starts were imported.
+Then runs the app headless in fresh interpreters, and checks how long it takes until the main menu can be used
+(startup.TIMES["interactive"]), which also counts the warm-up tasks that the menu waits for.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --module steamdeck_robotcontrol.screens.control
+    python -m benchmarks.import_time --max-interactive-ms 300     # on a slower machine
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+# What the entrypoint imports before the first frame
+MENU_PATH_MODULES = ["steamdeck_robotcontrol.startup", "steamdeck_robotcontrol.screens.coroutine_screen", "steamdeck_robotcontrol.screens.main_menu"]
+
+# These should only be imported when a connection starts
+HEAVY_MODULES = ["cv2", "websockets", "steamdeck_robotcontrol.screens.control"]
+
+# Launch until the main menu can be used
+DEFAULT_MAX_INTERACTIVE_MS = 150
+INTERACTIVE_RUNS = 3
+
+# Runs the app until it has been interactive for a moment, and prints its startup times
+INTERACTIVE_CODE = """
+import json
+from steamdeck_robotcontrol import harness, startup
+harness.run_app([], linger=0.5)
+print(json.dumps({"milestones": startup.TIMES.milestones, "tasks": startup.TIMES.tasks}))
+"""
+
+
+def measure(modules: List[str]) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """Import the modules in a fresh interpreter; returns the self and cumulative microseconds of every module imported."""
+    code = "; ".join(f"import {module}" for module in modules)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True)
+    self_times, cumulative_times = dict(), dict()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        self_times[name] = int(self_us)
+        cumulative_times[name] = int(cumulative_us)
+    return self_times, cumulative_times
+
+
+def measure_interactive() -> Dict[str, Dict[str, float]]:
+    """Launch the app headless in a fresh interpreter, with a data directory of its own; returns startup.TIMES as seconds."""
+    with tempfile.TemporaryDirectory(prefix="robotcontrol-startup-") as data_directory:
+        env = dict(os.environ, ROBOTCONTROL_DATA_DIR=data_directory)
+        result = subprocess.run([sys.executable, "-c", INTERACTIVE_CODE], capture_output=True, text=True, check=True, env=env)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", action="append", help="Module to import instead of the ones on the way to the main menu (can be repeated)")
+    parser.add_argument("--top", type=int, default=15, help="How many of the slowest modules to show")
+    parser.add_argument("--max-interactive-ms", type=float, default=DEFAULT_MAX_INTERACTIVE_MS, help="Fail if the main menu takes longer than this to become usable")
+    args = parser.parse_args()
+    modules = args.module or MENU_PATH_MODULES
+
+    self_times, cumulative_times = measure(modules)
+    # Packages, whose totals include their submodules (a package can still be imported from inside another one)
+    top_level = {name: cumulative_times[name] for name in cumulative_times if "." not in name or name in modules}
+    print(f"Importing {', '.join(modules)}: {len(self_times)} modules")
+    print(f"{'module':<50} {'self ms':>9} {'total ms':>9}")
+    for name, _ in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<50} {self_times[name] / 1000:>9.1f} {cumulative_times[name] / 1000:>9.1f}")
+    print(f"{'sum of self times':<50} {sum(self_times.values()) / 1000:>9.1f}")
+
+    heavy = [module for module in HEAVY_MODULES if module in self_times]
+    if args.module is not None:
+        return
+    if heavy:
+        print(f"Heavy modules imported on the way to the main menu: {', '.join(heavy)}", file=sys.stderr)
+        sys.exit(1)
+    print("No heavy modules imported on the way to the main menu")
+
+    # The median of a few launches, since one can be slowed down by whatever else the machine is doing
+    runs = sorted((measure_interactive() for _ in range(INTERACTIVE_RUNS)), key=lambda times: times["milestones"]["interactive"])
+    times = runs[len(runs) // 2]
+    interactive_ms = times["milestones"]["interactive"] * 1000
+    print(", ".join(f"{name} after {seconds * 1000:.0f} ms" for name, seconds in times["milestones"].items()))
+    print(", ".join(f"warm-up task {name} took {seconds * 1000:.0f} ms" for name, seconds in times["tasks"].items()))
+    if interactive_ms > args.max_interactive_ms:
+        print(f"The main menu took {interactive_ms:.0f} ms to become usable, over {args.max_interactive_ms:.0f} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compares ways of iterating over a KVDatabase of 10^5 keys:
+the old row-at-a-time fetchone() loop, and items()/keys() with different batch sizes,
+both on a plain connection and through a PersistenceWorker.
+"""
+import json
+import pathlib
+import sqlite3
+import sys
+import tempfile
+import time
+
+from steamdeck_robotcontrol.persistence.connection import SharedConnection
+from steamdeck_robotcontrol.persistence.database import KVDatabase
+from steamdeck_robotcontrol.persistence.worker import PersistenceWorker
+
+KEY_COUNT = 100_000
+BATCH_SIZES = [1, 16, 256, 4096]
+
+
+def fill(path: pathlib.Path):
+    conn = sqlite3.connect(path)
+    db = KVDatabase(SharedConnection(path, conn=conn), "bench")
+    with db.batch():
+        for i in range(KEY_COUNT):
+            db[f"key{i:06}"] = {"index": i, "latency": i / 1000}
+    conn.close()
+
+
+def fetchone_loop(conn: sqlite3.Connection, table: str):
+    """What items() used to do: a round-trip into the sqlite3 module for every row, and decoding."""
+    cursor = conn.execute(f"SELECT key, value_json FROM {table}")
+    count = 0
+    while (row := cursor.fetchone()):
+        json.loads(row[1])
+        count += 1
+    return count
+
+
+def timed(fn):
+    start = time.perf_counter()
+    count = fn()
+    return time.perf_counter() - start, count
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp) / "bench.sqlite3"
+        fill(path)
+
+        results = []
+        conn = sqlite3.connect(path)
+        db = KVDatabase(SharedConnection(path, conn=conn), "bench", perform_init=False)
+        results.append(("fetchone loop (old)", *timed(lambda: fetchone_loop(conn, db.table))))
+        for batch_size in BATCH_SIZES:
+            results.append((f"keys, batch {batch_size}", *timed(lambda: sum(1 for _ in db.keys(batch_size=batch_size)))))
+            results.append((f"items, batch {batch_size}", *timed(lambda: sum(1 for _ in db.items(load_into_cache=False, batch_size=batch_size)))))
+        conn.close()
+
+        worker = PersistenceWorker(path)
+        db = KVDatabase(SharedConnection(path, worker=worker), "bench", perform_init=False)
+        for batch_size in BATCH_SIZES:
+            results.append((f"worker items, batch {batch_size}", *timed(lambda: sum(1 for _ in db.items(load_into_cache=False, batch_size=batch_size)))))
+        worker.close()
+
+    print(f"{'method':<32} {'seconds':>10} {'rows/s':>12}")
+    for name, seconds, count in results:
+        if count != KEY_COUNT:
+            print(f"{name} saw {count} rows instead of {KEY_COUNT}", file=sys.stderr)
+        print(f"{name:<32} {seconds:>10.4f} {count / seconds:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
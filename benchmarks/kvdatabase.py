@@ -0,0 +1,157 @@
+"""
+Micro-benchmarks for KVDatabase operations, written to a JSON file that benchmarks.compare can diff.
+
+Every operation is measured for each dataset size and persistence mode,
+with the cache in the state that matters for it:
+cold (just discarded), warm (the keys used are cached) and complete (after populate_cache()).
+
+    python -m benchmarks.kvdatabase --output before.json
+    python -m benchmarks.kvdatabase --output after.json
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import datetime
+import json
+import pathlib
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from steamdeck_robotcontrol.persistence.connection import SharedConnection
+from steamdeck_robotcontrol.persistence.database import KVDatabase
+from steamdeck_robotcontrol.persistence.worker import PersistenceWorker
+
+SIZES = [100, 1_000, 10_000]
+MODES = ["sync", "write_behind", "background"]
+# Writes in sync mode are committed one by one, so they are measured on fewer keys
+WRITE_COUNT = 200
+REPEATS = 5
+
+
+def open_database(path: pathlib.Path, mode: str) -> KVDatabase:
+    if mode == "background":
+        connection = SharedConnection(path, worker=PersistenceWorker(path))
+    else:
+        commit_interval = 1.0 if mode == "write_behind" else None
+        connection = SharedConnection(path, conn=sqlite3.connect(path, check_same_thread=False), commit_interval=commit_interval)
+    return KVDatabase(connection, "bench")
+
+
+def fill(db: KVDatabase, size: int):
+    with db.batch():
+        for i in range(size):
+            db[f"key{i:06}"] = {"index": i, "name": f"server {i}", "latency": i / 1000}
+    db.flush()
+
+
+def best_time(setup: Callable[[], None], run: Callable[[], int]) -> float:
+    """Seconds per operation, best of REPEATS; run() does the operations and returns how many it did."""
+    best = float("inf")
+    for _ in range(REPEATS):
+        setup()
+        start = time.perf_counter()
+        count = run()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed / max(count, 1))
+    return best
+
+
+def benchmark_database(db: KVDatabase, size: int) -> Dict[str, float]:
+    keys = [f"key{i:06}" for i in range(0, size, max(1, size // 100))]
+    missing = [f"missing{i}" for i in range(len(keys))]
+
+    def cold():
+        db.discard_cache()
+
+    def warm():
+        db.discard_cache()
+        for key in keys:
+            db[key]
+
+    def complete():
+        db.discard_cache()
+        db.populate_cache()
+
+    def get_all():
+        for key in keys:
+            db[key]
+        return len(keys)
+
+    def contains_missing():
+        for key in missing:
+            key in db
+        return len(missing)
+
+    def length():
+        for _ in range(10):
+            len(db)
+        return 10
+
+    def iterate():
+        return sum(1 for _ in db.items())
+
+    def set_some():
+        for i in range(WRITE_COUNT):
+            db[f"written{i}"] = {"index": i}
+        db.flush()
+        return WRITE_COUNT
+
+    def set_in_batch():
+        with db.batch():
+            for i in range(WRITE_COUNT):
+                db[f"written{i}"] = {"index": i}
+        db.flush()
+        return WRITE_COUNT
+
+    results = {}
+    for state, setup in [("cold", cold), ("warm", warm), ("complete", complete)]:
+        results[f"get/{state}"] = best_time(setup, get_all)
+        results[f"contains_missing/{state}"] = best_time(setup, contains_missing)
+        results[f"len/{state}"] = best_time(setup, length)
+    results["iterate/cold"] = best_time(cold, iterate)
+    results["iterate/complete"] = best_time(complete, iterate)
+    results["populate_cache"] = best_time(cold, lambda: (db.populate_cache(), 1)[1])
+    results["set"] = best_time(lambda: None, set_some)
+    results["set/batch"] = best_time(lambda: None, set_in_batch)
+    return results
+
+
+def run(sizes: List[int], modes: List[str]) -> dict:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in modes:
+            for size in sizes:
+                path = pathlib.Path(tmp) / f"{mode}-{size}.sqlite3"
+                db = open_database(path, mode)
+                fill(db, size)
+                for name, seconds in benchmark_database(db, size).items():
+                    results.append({"benchmark": f"{name}/{mode}/{size}", "seconds_per_op": seconds})
+                    print(f"{name + '/' + mode + '/' + str(size):<44} {seconds * 1e6:>12.2f} us/op", file=sys.stderr)
+                db.connection.close()
+    return {
+        "suite": "kvdatabase",
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", "-o", type=pathlib.Path, default=pathlib.Path("kvdatabase_bench.json"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.modes)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"Wrote {len(report['results'])} results to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
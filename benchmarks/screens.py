@@ -0,0 +1,269 @@
+"""
+Measures what each screen's run_frame and handle_event cost, drawing on an offscreen surface the size of the Deck's display,
+and compares the medians with the baselines in screens_baseline.json.
+
+    python -m benchmarks.screens                       # exits with status 1 if a screen got slower than the tolerance
+    python -m benchmarks.screens --update-baseline     # after an intended change
+
+How fast a frame draws depends on the machine, so a fixed reference workload (see calibrate) is timed along with the screens,
+and stored with the baselines; before comparing, the baselines are scaled by how much slower or faster it runs here.
+`make bench` runs this; it isn't part of the unit tests, since wall-clock timings fail whenever the machine is busy.
+"""
+import argparse
+import gc
+import json
+import pathlib
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+import pygame
+import websockets.exceptions
+
+from steamdeck_robotcontrol import harness
+
+BASELINE_PATH = pathlib.Path(__file__).with_name("screens_baseline.json")
+DISPLAY_SIZE = (1280, 800)
+WARMUP_FRAMES = 3
+# Relative slowdown of the median that counts as a regression
+DEFAULT_TOLERANCE = 0.5
+# Smaller differences than this are timer noise rather than regressions, whatever their ratio
+MIN_DIFFERENCE = 10e-6
+LONG_LOG_LINES = 10_000
+
+
+class Case:
+    """A screen to measure: how to make it, the events it is given in turn, and what to do before each frame."""
+
+    def __init__(self, name: str, make_screen: Callable, events: List[pygame.event.Event],
+                 before_frame: Optional[Callable] = None, close: Optional[Callable] = None):
+        self.name = name
+        self.make_screen = make_screen
+        self.events = events
+        self.before_frame = before_frame
+        self.close = close
+
+
+class IdleSocket:
+    """Stands in for the robot's connections: nothing arrives until it is closed."""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def send(self, data):
+        pass
+
+    def recv(self):
+        self.closed.wait()
+        raise websockets.exceptions.ConnectionClosedOK(None, None)
+
+    def close(self):
+        self.closed.set()
+
+
+def menu_case(items: int) -> Case:
+    from steamdeck_robotcontrol.screens.menu import VerticalMenuScreen
+    # Scrolling down one item at a time, which renders each newly selected item's highlighted labels
+    events = [pygame.event.Event(pygame.JOYHATMOTION, hat=0, value=(0, -1)), pygame.event.Event(pygame.JOYHATMOTION, hat=0, value=(0, 0))]
+    return Case(f"menu_{items}_items", lambda: VerticalMenuScreen([(i, f"Item number {i}") for i in range(items)]), events)
+
+
+def text_input_case() -> Case:
+    from steamdeck_robotcontrol.screens.text_input import TextInputScreen
+    events = [pygame.event.Event(pygame.TEXTINPUT, text="a"), pygame.event.Event(pygame.TEXTINPUT, text="b"),
+              pygame.event.Event(pygame.KEYDOWN, key=pygame.K_BACKSPACE, unicode="", mod=0)]
+    return Case("text_input", lambda: TextInputScreen("Server address:", prefill="192.168.1.10:5555"), events)
+
+
+def robot_control_case() -> Case:
+    from steamdeck_robotcontrol.screens.control import RobotControlScreen
+    from steamdeck_robotcontrol.server.standin import synthetic_frames
+    frames = []
+    for jpeg_data in synthetic_frames(640, 480, 80, count=10):
+        image = cv2.imdecode(np.frombuffer(jpeg_data, dtype=np.uint8), 1)
+        frames.append(pygame.image.frombuffer(image.tobytes(), image.shape[1::-1], "BGR"))
+
+    def make_screen():
+        control_screen = RobotControlScreen(IdleSocket(), IdleSocket())
+        # A full latency chart, as after a minute of driving
+        control_screen.latest_video_frame_latencies = [0.02 + 0.01 * np.sin(i / 20) for i in range(1280)]
+        return control_screen
+
+    def before_frame(control_screen, number: int):
+        # As the video thread does when a frame arrives
+        control_screen.latest_video_frame = frames[number % len(frames)]
+        control_screen.latest_video_frame_latencies.append(0.02 + 0.01 * np.sin(number / 20))
+        control_screen.latest_video_frame_latencies.pop(0)
+        control_screen.latest_video_frame_presented = False
+
+    def close(control_screen):
+        control_screen.socket.close()
+        control_screen.control_socket.close()
+
+    events = [pygame.event.Event(pygame.JOYAXISMOTION, axis=axis, value=value, joy=0, instance_id=0)
+              for axis, value in ((1, -0.8), (4, -0.6), (0, 0.3), (3, -0.2))]
+    return Case("robot_control", make_screen, events, before_frame, close)
+
+
+def event_log_case() -> Case:
+    from steamdeck_robotcontrol.screens.sample import EventLogScreen
+    long_log = [str(pygame.event.Event(pygame.JOYAXISMOTION, axis=i % 6, value=i / LONG_LOG_LINES)) for i in range(LONG_LOG_LINES)]
+
+    def before_frame(event_log_screen, number: int):
+        # The screen forgets what doesn't fit after drawing, so give it the long log again every time
+        event_log_screen.log = list(long_log)
+
+    events = [pygame.event.Event(pygame.JOYBUTTONDOWN, button=0, joy=0, instance_id=0)]
+    return Case("event_log_long", EventLogScreen, events, before_frame)
+
+
+def cases() -> List[Case]:
+    return [menu_case(10), menu_case(1000), menu_case(10000), text_input_case(), robot_control_case(), event_log_case()]
+
+
+def setup():
+    """Fonts and a (dummy) window are needed, since some screens check whether it is fullscreen; the screens draw offscreen."""
+    harness.use_dummy_drivers()
+    pygame.display.init()
+    pygame.font.init()
+    if pygame.display.get_surface() is None:
+        pygame.display.set_mode((1, 1))
+
+
+def summarize(seconds: List[float]) -> Dict[str, float]:
+    ordered = sorted(seconds)
+    return {
+        "count": len(ordered), "p50": ordered[len(ordered) // 2], "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "mean": sum(ordered) / len(ordered), "max": ordered[-1],
+    }
+
+
+def measure(case: Case, frames: int, display: pygame.Surface) -> Dict[str, Dict[str, float]]:
+    """Alternate run_frame and handle_event on the case's screen, timing each call. As timeit does, the GC is off meanwhile."""
+    screen = case.make_screen()
+    frame_seconds, event_seconds = [], []
+    gc.collect()
+    gc.disable()
+    try:
+        for number in range(WARMUP_FRAMES + frames):
+            if case.before_frame is not None:
+                case.before_frame(screen, number)
+            started = time.perf_counter()
+            screen.run_frame(display)
+            frame_done = time.perf_counter()
+            screen.handle_event(case.events[number % len(case.events)])
+            event_done = time.perf_counter()
+            if number >= WARMUP_FRAMES:
+                frame_seconds.append(frame_done - started)
+                event_seconds.append(event_done - frame_done)
+    finally:
+        gc.enable()
+        if case.close is not None:
+            case.close(screen)
+    return {"run_frame": summarize(frame_seconds), "handle_event": summarize(event_seconds)}
+
+
+def calibrate(display: pygame.Surface, repeats: int = 50) -> float:
+    """
+    The shortest time of a fixed mix of the drawing the screens do: filling, rendering text, blitting and lines.
+    The shortest, rather than the median, since it's the least disturbed by whatever else the machine is doing.
+    """
+    from steamdeck_robotcontrol import fonts
+    font = fonts.get_font(24)
+    image = pygame.Surface((640, 480))
+    image.fill((40, 80, 120))
+    seconds = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        display.fill("black")
+        display.blit(image, (320, 160))
+        for i in range(40):
+            display.blit(font.render(f"Calibration line {i}", True, "white"), (0, i * 20))
+        for x in range(0, display.get_width(), 2):
+            pygame.draw.line(display, (0, 255, 0), (x, display.get_height()), (x, display.get_height() - 100))
+        seconds.append(time.perf_counter() - started)
+    return min(seconds)
+
+
+def run(frames: int, names: Optional[List[str]] = None) -> dict:
+    """Measure the cases (all of them, or the named ones) and the calibration workload."""
+    setup()
+    display = pygame.Surface(DISPLAY_SIZE)
+    results = {}
+    for case in cases():
+        if names is None or case.name in names:
+            results[case.name] = measure(case, frames, display)
+    return {"calibration_seconds": calibrate(display), "display": list(DISPLAY_SIZE), "frames": frames, "results": results}
+
+
+def compare(baseline: dict, current: dict, tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """
+    The regressions in current, as printable lines: the cases whose median run_frame or handle_event time is over
+    (1 + tolerance) times the baseline's, after scaling the baseline by the calibration times.
+    """
+    scale = current["calibration_seconds"] / baseline["calibration_seconds"]
+    regressions = []
+    for name, phases in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        for phase, stats in phases.items():
+            expected = baseline["results"][name][phase]["p50"] * scale
+            if stats["p50"] > expected * (1 + tolerance) and stats["p50"] - expected > MIN_DIFFERENCE:
+                regressions.append(f"{name} {phase}: median {stats['p50'] * 1000:.3f} ms, expected about {expected * 1000:.3f} ms")
+    return regressions
+
+
+def check(baseline: dict, frames: int, tolerance: float = DEFAULT_TOLERANCE, attempts: int = 3, current: Optional[dict] = None) -> List[str]:
+    """
+    Measure (unless current results are given) and compare with the baseline. The screens that regressed are measured
+    again, up to attempts times in all, and only count if they are slow every time:
+    a real regression is, while a machine that was busy for a moment isn't.
+    """
+    current = current or run(frames)
+    regressions = compare(baseline, current, tolerance)
+    for _ in range(attempts - 1):
+        if not regressions:
+            break
+        names = [line.split()[0] for line in regressions]
+        regressions = compare(baseline, run(frames, names), tolerance)
+    return regressions
+
+
+def load_baseline(path: pathlib.Path = BASELINE_PATH) -> dict:
+    return json.loads(path.read_text())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=200, help="Frames to measure for each screen")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Relative slowdown that counts as a regression (default 0.5, that is 50%%)")
+    parser.add_argument("--baseline", type=pathlib.Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline instead of comparing")
+    parser.add_argument("--output", type=pathlib.Path, help="Write the results as JSON here")
+    args = parser.parse_args()
+
+    current = run(args.frames)
+    print(f"Calibration workload: {current['calibration_seconds'] * 1000:.3f} ms")
+    print(f"{'screen':<20} {'phase':<13} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for name, phases in current["results"].items():
+        for phase, stats in phases.items():
+            print(f"{name:<20} {phase:<13} {stats['p50'] * 1000:>9.3f} {stats['p95'] * 1000:>9.3f} {stats['max'] * 1000:>9.3f}")
+    if args.output:
+        args.output.write_text(json.dumps(current, indent=2))
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(current, indent=2) + "\n")
+        print(f"Wrote the baseline to {args.baseline}")
+        return
+
+    regressions = check(load_baseline(args.baseline), args.frames, args.tolerance, current=current)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Streams synthetic video from a stand-in robot on loopback into a real RobotControlScreen,
+which receives, decodes and converts the frames on its video thread as it does on the Deck,
+while a main loop draws it on an offscreen surface at up to 60 fps.
+Reports the achieved frame rate, the latency from capture until a frame is ready to draw, decode and convert times,
+and the frames dropped: by the server, for a client that couldn't keep up, and by the screen, replaced before drawing.
+
+Every option takes a comma-separated list, and every combination is measured in turn, for sizing the camera settings:
+
+    python -m benchmarks.video
+    python -m benchmarks.video --resolution 640x480,1280x720 --quality 60,80 --fps 30 --output video_bench.json
+
+Run it on the Deck for the numbers that matter; on loopback, the network isn't measured, only what the client does.
+"""
+import argparse
+import itertools
+import json
+import os
+import pathlib
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import pygame
+
+from steamdeck_robotcontrol import harness, metrics
+
+DISPLAY_SIZE = (1280, 800)
+RENDER_FPS = 60
+
+
+def percentiles(values: List[float], scale: float = 1000.0) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * scale
+
+    return {"mean": sum(ordered) / len(ordered) * scale, "p50": at(0.5), "p95": at(0.95), "p99": at(0.99), "max": ordered[-1] * scale}
+
+
+def measure(width: int, height: int, quality: int, fps: float, payload_size: Optional[int], seconds: float, warmup: float) -> dict:
+    """Run one configuration; the times in the result are in milliseconds."""
+    from steamdeck_robotcontrol.screens.control import RobotControlScreen, open_connection
+    from steamdeck_robotcontrol.server.standin import StandInRobot
+
+    dropped_by_server = metrics.counter("server.frames_dropped")
+    display = pygame.Surface(DISPLAY_SIZE)
+    clock = pygame.time.Clock()
+    with StandInRobot(width, height, quality, fps, payload_size) as robot:
+        control_screen = RobotControlScreen(*open_connection(robot.address), frame_timings=[])
+        time.sleep(warmup)
+        # Only what happens after the warm-up counts
+        start = time.time()
+        sent_before, dropped_before = robot.frames_sent, dropped_by_server.value
+        presented = 0
+        while time.time() < start + seconds and not control_screen.closing:
+            if control_screen.should_render_frame():
+                if not control_screen.latest_video_frame_presented:
+                    presented += 1
+                control_screen.run_frame(display)
+            clock.tick(RENDER_FPS)
+        end = time.time()
+        sent, dropped = robot.frames_sent - sent_before, dropped_by_server.value - dropped_before
+        frame_bytes = len(robot.frames[0])
+        control_screen.closing = True
+        control_screen.closing_reason = "user"
+        control_screen.run_frame(display)
+        control_screen.video_recv_thread.join(timeout=2)
+
+    timings = [timing for timing in control_screen.frame_timings if start <= timing[1] < end]
+    return {
+        "resolution": f"{width}x{height}", "quality": quality, "fps": fps, "frame_bytes": frame_bytes,
+        "frames_sent": sent, "frames_received": len(timings), "frames_presented": presented,
+        "dropped_by_server": dropped, "replaced_before_drawing": max(0, len(timings) - presented),
+        "received_fps": len(timings) / (end - start), "presented_fps": presented / (end - start),
+        "latency_ms": percentiles([ready - captured for captured, _, _, _, ready in timings]),
+        "transfer_ms": percentiles([received - captured for captured, received, _, _, _ in timings]),
+        "decode_ms": percentiles([decode for _, _, decode, _, _ in timings]),
+        "convert_ms": percentiles([convert for _, _, _, convert, _ in timings]),
+    }
+
+
+def parse_list(value: str, kind=int) -> list:
+    return [kind(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resolution", default="640x480", help="WIDTHxHEIGHT of the frames")
+    parser.add_argument("--quality", default="80", help="JPEG quality, 1 to 100")
+    parser.add_argument("--fps", default="30", help="Frames per second that the server sends")
+    parser.add_argument("--payload-size", default="", help="Pad every frame to at least this many bytes, to measure bigger frames than the picture makes")
+    parser.add_argument("--seconds", type=float, default=5.0, help="How long to measure each configuration")
+    parser.add_argument("--warmup", type=float, default=1.0, help="Seconds to run each configuration before measuring")
+    parser.add_argument("--output", type=pathlib.Path, help="Write the results as JSON here")
+    args = parser.parse_args()
+
+    harness.use_dummy_drivers()
+    pygame.font.init()
+    # The screen checks the data directory for tracing and recording settings; keep it away from the real one
+    os.environ["ROBOTCONTROL_DATA_DIR"] = tempfile.mkdtemp(prefix="robotcontrol-video-")
+
+    resolutions = [tuple(int(n) for n in resolution.split("x")) for resolution in args.resolution.split(",")]
+    payload_sizes = parse_list(args.payload_size) or [None]
+    results = []
+    print(f"{'resolution':<10} {'q':>3} {'fps':>4} {'KiB':>6} {'recv fps':>8} {'drawn fps':>9} {'srv drop':>8} {'replaced':>8}"
+          f" {'lat p50':>7} {'lat p95':>7} {'lat p99':>7} {'decode':>7} {'convert':>7}")
+    for (width, height), quality, fps, payload_size in itertools.product(resolutions, parse_list(args.quality), parse_list(args.fps, float), payload_sizes):
+        result = measure(width, height, quality, fps, payload_size, args.seconds, args.warmup)
+        results.append(result)
+        latency, decode, convert = result["latency_ms"], result["decode_ms"], result["convert_ms"]
+        print(f"{result['resolution']:<10} {quality:>3} {fps:>4g} {result['frame_bytes'] / 1024:>6.1f} {result['received_fps']:>8.1f} {result['presented_fps']:>9.1f}"
+              f" {result['dropped_by_server']:>8} {result['replaced_before_drawing']:>8}"
+              f" {latency.get('p50', 0):>7.2f} {latency.get('p95', 0):>7.2f} {latency.get('p99', 0):>7.2f} {decode.get('mean', 0):>7.2f} {convert.get('mean', 0):>7.2f}")
+    print("Latencies, and mean decode and convert times, are in milliseconds.")
+    if args.output:
+        args.output.write_text(json.dumps({"results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
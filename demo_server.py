@@ -1,16 +1,55 @@
-#import cv2
+import cv2
 import websockets.sync.server
+import websockets.exceptions
 import time
-import struct
+import socket as sockets
 import threading
+import atexit
+import logging
+import pathlib
+from typing import Optional
+
+from steamdeck_robotcontrol import logs, metrics, tracing
+from steamdeck_robotcontrol.protocol import CONTROL_PATH, EMERGENCY_STOP_ACKNOWLEDGED, UDP_VIDEO_SUBSCRIBE, VIDEO_PATH, pack_video_frame, unpack_trace, unpack_udp_video_subscribe, unpack_wheel_values
+from steamdeck_robotcontrol.server import ClientQueue, ControlArbiter, FrameBroadcaster
+from steamdeck_robotcontrol.udp_video import UDPVideoClient
 
 
 import serial
 p = serial.Serial('/dev/ttyACM0', 115200)
 
-#camera = cv2.VideoCapture(0)  # init the camera
-#conn_lock = threading.Lock()
+# Every connected client gets the video, but only one of them can drive.
+broadcaster = FrameBroadcaster(queue_size=2)
+arbiter = ControlArbiter()
+# Clients that asked for video over UDP get it sent from this socket
+udp_video_socket = sockets.socket(sockets.AF_INET, sockets.SOCK_DGRAM)
 emergency_stop_when_started = 0.0
+ENCODE_TIME = metrics.histogram("server.encode_seconds")
+
+# Printing from the loops below would make them wait for the terminal; the log is written on a thread of its own
+logs.setup_logging()
+atexit.register(logs.shutdown_logging)
+log = logging.getLogger(__name__)
+
+
+def export_metrics():
+    for path in metrics.REGISTRY.export(pathlib.Path("metrics")):
+        log.info("Metrics written to %s", path)
+
+
+# Exported to the working directory when the server stops. Registered after shutdown_logging, so that it runs before it
+atexit.register(export_metrics)
+
+# Set if ROBOTCONTROL_TRACE is: the times that traced commands reached each stage, see steamdeck_robotcontrol/tracing.py
+span_log = tracing.from_environment("server", pathlib.Path("traces"))
+if span_log is not None:
+    atexit.register(span_log.close)
+
+
+def record_span(trace, kind, received, parsed, serial_written=None):
+    if span_log is not None and trace is not None:
+        seq, client_sent = trace
+        span_log.record({"seq": seq, "kind": kind, "client_sent": client_sent, "received": received, "parsed": parsed, "serial_written": serial_written})
 
 INPUT_SCALE = 100
 MIN_SIDE_VAL = 500
@@ -29,7 +68,7 @@ def write_setpoints(sp):
   #print("Writing", current_setpoints)
   last_setpoints = current_setpoints
   spf, ssf, ssb, spb = current_setpoints
-  print(f'pf{spf} sf{ssf} sb{ssb} pb{spb}\r\n')
+  log.debug('Writing pf%s sf%s sb%s pb%s', spf, ssf, ssb, spb)
   p.write(f'pf{spf} sf{ssf} sb{ssb} pb{spb}\r\n'.encode())
   p.write('?\r\n'.encode())
   p.flush()
@@ -62,105 +101,173 @@ def report_loop():
 threading.Thread(target=report_loop, daemon=True).start()
 
 
+def capture_thread():
+    camera = cv2.VideoCapture(0)  # init the camera
+    if not camera.isOpened():
+        log.warning("Could not open the camera, not sending video")
+        return
+    try:
+        while 1:
+            if not broadcaster.has_clients():
+                # Nobody is watching, so don't spend time encoding
+                time.sleep(0.1)
+                continue
+            grabbed, frame = camera.read()  # grab the current frame
+            if not grabbed:
+                continue
+            when = time.time()
+            frame = cv2.resize(frame, (640, 480))  # resize the frame
+            # Encode only once: the same message is queued for every client
+            encode_started = time.perf_counter()
+            encoded, buffer = cv2.imencode('.jpg', frame)
+            ENCODE_TIME.observe(time.perf_counter() - encode_started)
+            broadcaster.broadcast(pack_video_frame(when, buffer.tobytes()))
+    finally:
+        camera.release()
+
+threading.Thread(target=capture_thread, daemon=True).start()
+
+
 def handler(socket: websockets.sync.server.ServerConnection):
+    # The path selects which channel this is (see PROTOCOL.md):
+    # "/video" only receives frames, "/control" only exchanges commands, and anything else does both.
+    path = socket.request.path
+    if path == VIDEO_PATH:
+        video_handler(socket)
+    elif path == CONTROL_PATH:
+        control_handler(socket)
+    else:
+        client = broadcaster.add_client(socket)
+        try:
+            control_handler(socket, client)
+        finally:
+            broadcaster.remove_client(client)
+
+
+def video_handler(socket: websockets.sync.server.ServerConnection):
+    client = broadcaster.add_client(socket)
+    log.info("Client %s connected to the video channel", socket.remote_address)
+    try:
+        for _ in socket:
+            pass  # Nothing is expected from the client here, but we need to notice it closing
+    except websockets.exceptions.ConnectionClosed:
+        pass
+    finally:
+        broadcaster.remove_client(client)
+
+
+def control_handler(socket: websockets.sync.server.ServerConnection, video_client: Optional[ClientQueue] = None):
     global emergency_stop_when_started
     global current_setpoints
-#    if conn_lock.locked():
-#        socket.close(code=1008,  # closing due to message that violates policy
-#                     reason="Another client is connected")
-#    conn_lock.acquire()
+    # Each control connection is handled in its own thread, and never carries video,
+    # so commands are not stuck behind frames that are being written to other sockets.
+    # On a combined channel, video_client's thread is also writing frames to the socket, so replies go through its queue.
+    client = socket
+    reply = video_client.send if video_client is not None else socket.send
+    if arbiter.try_acquire(client):
+        log.info("Client %s connected and has control", socket.remote_address)
+    else:
+        log.info("Client %s connected as a viewer", socket.remote_address)
     old_setpoints = None
+    udp_client = None
     try:
-        while True:
-            try:
-                while 1:  # loop until timeout error
-                    cmd = socket.recv(timeout=0)
-                    if cmd[0:1] == b"S":
-                            if time.time() - emergency_stop_when_started < 2:
-                                print("Ignoring setpoint command due to emergency stop")
-                                break
-                            setpoints = list(struct.unpack(">hhhh", cmd[1:]))
-                            if setpoints != old_setpoints:
-                                old_setpoints = setpoints
-                                print("New setpoints:", setpoints)
-                    if cmd[0:1] == b"T":
-                            if time.time() - emergency_stop_when_started < 2:
-                                print("Ignoring setpoint command due to emergency stop")
-                                break
-                            # Offsets: port to forward, port to left, starboard to forward, starboard to right
-                            opf,opl,osf,osr = struct.unpack(">hhhh", cmd[1:])
-                            #print("---------------------------------------------")
-                            #print("Offsets:")
-                            #print("Port to forward:", opf)
-                            #print("Port to left:", opl)
-                            #print("Starboard to forward:", osf)
-                            #print("Starboard to right:", osr)
-                            
-                            # Need to transform the coordinates from pair offsets into setpoints.
-                            #spf, ssf, ssb, spb = current_setpoints
-                            spf, ssf, ssb, spb = 0,0,0,0
-
-                            if abs(opl) < MIN_SIDE_VAL and abs(osr) < MIN_SIDE_VAL:
-                                # Forward-back motion: add this component to both wheels on side
-                                spf += opf
-                                spb += opf
-                                ssf += osf
-                                ssb += osf
-                            else:
-                                # Left-right motion: one wheel needs this component subtracted, the other added
-                                # (TODO: check which one on real robot)
-                                spf += opl
-                                spb -= opl
-                                ssf += osr
-                                ssb -= osr
-
-                            # port front, starboard front, starboard back, port back
-                            setpoints = [spf, ssf, ssb, spb]
-
-                            for i in range(len(setpoints)):
-                                setpoints[i] *= INPUT_SCALE
-
-                            if setpoints != old_setpoints:
-                                old_setpoints = setpoints
-                                current_setpoints = setpoints
-                                write_setpoints(setpoints)
-
-                    elif cmd[0:1] == b"!":
-                            # Emergency stop:
-                            emergency_stop_when_started = time.time()
-                            # TODO: set setpoints to wheel positions
-                            spf = spb = ssf = ssb = 0
-                            setpoints = [0,0,0,0]
-                            p.write(b'!\r\n')
-                            p.flush()
-
-                    else:
-                            print("Unknown command:", repr(cmd))
-            except TimeoutError:
-                pass
-            #try:
-            #  grabbed, frame = camera.read()  # grab the current frame
-            #  when = time.time()
-            #  frame = cv2.resize(frame, (640, 480))  # resize the frame
-            #  encoded, buffer = cv2.imencode('.jpg', frame)
-            #  to_send = bytearray(b'F????????????')
-            #  when_size_enc = struct.pack_into(">dI", to_send, 1, when, len(buffer))
-            #  to_send.extend(buffer)
-            #  socket.send(to_send)
-            #except: pass
-
-
-    except KeyboardInterrupt:
+        for cmd in socket:
+            received = time.time()
+            if cmd[0:1] == UDP_VIDEO_SUBSCRIBE:
+                # Anyone can watch, so this doesn't need control
+                if udp_client:
+                    broadcaster.remove_client(udp_client)
+                address = (socket.remote_address[0], unpack_udp_video_subscribe(cmd))
+                log.info("Sending video over UDP to %s", address)
+                udp_client = broadcaster.add_client(UDPVideoClient(udp_video_socket, address))
+                continue
+            # Any client can stop the robot, whether it has control or not
+            if cmd[0:1] == b"!":
+                emergency_stop_when_started = time.time()
+                trace = unpack_trace(cmd, 1)
+                parsed = time.time()
+                # TODO: set setpoints to wheel positions
+                spf = spb = ssf = ssb = 0
+                setpoints = [0,0,0,0]
+                p.write(b'!\r\n')
+                p.flush()
+                record_span(trace, "!", received, parsed, time.time())
+                reply(EMERGENCY_STOP_ACKNOWLEDGED)
+                continue
+            # Viewers' other commands are ignored, but they get control once the previous holder leaves
+            if not arbiter.try_acquire(client):
+                continue
+            if cmd[0:1] == b"S":
+                if time.time() - emergency_stop_when_started < 2:
+                    log.info("Ignoring setpoint command due to emergency stop")
+                    continue
+                values, trace = unpack_wheel_values(cmd)
+                setpoints = list(values)
+                record_span(trace, "S", received, time.time())
+                if setpoints != old_setpoints:
+                    old_setpoints = setpoints
+                    log.debug("New setpoints: %s", setpoints)
+            elif cmd[0:1] == b"T":
+                if time.time() - emergency_stop_when_started < 2:
+                    log.info("Ignoring setpoint command due to emergency stop")
+                    continue
+                # Offsets: port to forward, port to left, starboard to forward, starboard to right
+                (opf,opl,osf,osr), trace = unpack_wheel_values(cmd)
+                #print("---------------------------------------------")
+                #print("Offsets:")
+                #print("Port to forward:", opf)
+                #print("Port to left:", opl)
+                #print("Starboard to forward:", osf)
+                #print("Starboard to right:", osr)
+
+                # Need to transform the coordinates from pair offsets into setpoints.
+                #spf, ssf, ssb, spb = current_setpoints
+                spf, ssf, ssb, spb = 0,0,0,0
+
+                if abs(opl) < MIN_SIDE_VAL and abs(osr) < MIN_SIDE_VAL:
+                    # Forward-back motion: add this component to both wheels on side
+                    spf += opf
+                    spb += opf
+                    ssf += osf
+                    ssb += osf
+                else:
+                    # Left-right motion: one wheel needs this component subtracted, the other added
+                    # (TODO: check which one on real robot)
+                    spf += opl
+                    spb -= opl
+                    ssf += osr
+                    ssb -= osr
+
+                # port front, starboard front, starboard back, port back
+                setpoints = [spf, ssf, ssb, spb]
+
+                for i in range(len(setpoints)):
+                    setpoints[i] *= INPUT_SCALE
+
+                parsed = time.time()
+                serial_written = None
+                if setpoints != old_setpoints:
+                    old_setpoints = setpoints
+                    current_setpoints = setpoints
+                    write_setpoints(setpoints)
+                    serial_written = time.time()
+                record_span(trace, "T", received, parsed, serial_written)
+
+            else:
+                log.warning("Unknown command: %r", cmd)
+
+    except (KeyboardInterrupt, websockets.exceptions.ConnectionClosed):
         pass
-#        camera.release()
-#        cv2.destroyAllWindows()
     finally:
-        conn_lock.release()
-        p.write(b'\x03')
-        p.write('\r\n'.encode())
-        p.write(b'\x04')
-        p.write('\r\n'.encode())
-        p.flush()
+        if udp_client:
+            broadcaster.remove_client(udp_client)
+        # A disconnecting client is an emergency stop, but only if it was the one driving
+        if arbiter.release(client):
+            p.write(b'\x03')
+            p.write('\r\n'.encode())
+            p.write(b'\x04')
+            p.write('\r\n'.encode())
+            p.flush()
 
 server = websockets.sync.server.serve(handler, host='0.0.0.0', port=5555)
 server.serve_forever()
@@ -19,4 +19,11 @@ if __name__ == '__main__':
         print(xauthority_candidates)
         xauth = max(xauthority_candidates, key=lambda x: os.stat(x).st_mtime)
         os.environ['XAUTHORITY'] = xauth
-    run()
+    # --profile or --profile=cprofile,sample turns on profiling mode, see steamdeck_robotcontrol/profiling.py
+    profile = None
+    for arg in sys.argv[1:]:
+        if arg == '--profile':
+            profile = 'all'
+        elif arg.startswith('--profile='):
+            profile = arg[len('--profile='):]
+    run(profile)
@@ -1,8 +1,17 @@
+# Imported first, so that startup times are measured from as early as possible
+from . import startup
+import logging
+import os
+import pathlib
 import threading
 import time
 import traceback
 import pygame
-from .screens import *
+from . import logs, metrics, persistence, profiling
+from .overlay import MetricsOverlay
+# Only the screens that the main menu needs are imported here; see screens/__init__.py
+from .screens.coroutine_screen import CoroutineScreen
+from .screens.main_menu import main_menu
 from .screen import *
 
 #entrypoint = TextInputScreen("Type whatever", allow_cancelling=True)
@@ -13,13 +22,40 @@ from .screen import *
 # for i in range(1000):
 #     l.append( [i, str(i)] )
 # entrypoint = VerticalMenuScreen(l)
-entrypoint = GeneratorScreen(main_menu())
-# entrypoint = RenderingGeneratorScreen(robot_control_wrapper('1.2.3.4'))
+entrypoint = startup.StartupScreen(lambda: CoroutineScreen(main_menu()))
+# entrypoint = CoroutineScreen(robot_control_wrapper('1.2.3.4'))
+
+log = logging.getLogger(__name__)
+
+# The controller and keyboard events of the session are written to the file this names, see harness.py
+RECORD_EVENTS_ENV = "ROBOTCONTROL_RECORD_EVENTS"
+
+FLIP_TIME = metrics.histogram("frame.flip")
+FRAME_INTERVAL = metrics.histogram("frame.interval")
+
+# The phase histograms of each screen class, so that they are looked up once per class rather than on every frame
+_phase_histograms = dict()
+
+
+def phase_histograms(screen):
+    """The handle_event, should_render_frame and run_frame histograms of the screen's class."""
+    cls = type(screen)
+    histograms = _phase_histograms.get(cls)
+    if histograms is None:
+        histograms = _phase_histograms[cls] = tuple(metrics.histogram(f"screen.{cls.__name__}.{phase}") for phase in ("handle_event", "should_render_frame", "run_frame"))
+    return histograms
+
 
 def run_render(screen_stack, display):
     global current_screen
+    started = time.perf_counter()
     result = current_screen.run_frame(display)
+    rendered = time.perf_counter()
+    phase_histograms(current_screen)[2].observe(rendered - started)
+    overlay.draw(display)
+    flip_started = time.perf_counter()
     pygame.display.flip()
+    FLIP_TIME.observe(time.perf_counter() - flip_started)
 
     match result:
         case ContinueExecution():
@@ -36,17 +72,30 @@ def run_render(screen_stack, display):
                 current_screen.receive_data(old_screen, data)
                 run_render(screen_stack, display)
             else:
-                print(f"Screen {old_screen} returned without a caller on the stack with data: {data}")
+                log.info("Screen %s returned without a caller on the stack with data: %s", old_screen, data)
                 raise SystemExit
         case what:
             raise RuntimeError(f"Unknown run frame result: {what}")
 
 
 
-def main():
+overlay = MetricsOverlay()
+
+
+def main(profile=None, event_source=pygame.event.get, on_frame=None, fullscreen=True):
+    """
+    Run the screens until one exits the program.
+
+    The events come from event_source(), which is called once per loop; the harness (see harness.py) passes scripted ones.
+    If on_frame is given, it is called after every rendered frame with the display and how long the frame took.
+    """
+    logs.setup_logging()
+    profiler = profiling.from_environment(profile, persistence.get_data_directory() / "profiles")
+    if profiler is not None:
+        profiler.start()
     pygame.init()
     display = pygame.display.set_mode((1280, 800))
-    if not pygame.display.is_fullscreen():
+    if fullscreen and not pygame.display.is_fullscreen():
         pygame.display.toggle_fullscreen()
 
     joysticks = [
@@ -59,27 +108,59 @@ def main():
     screen_stack = []
 
     clock = pygame.time.Clock()
+    last_frame_at = None
     try:
         while True:
             clock.tick(60)
             should_render = False
+            handle_event_time, should_render_time, _ = phase_histograms(current_screen)
             # First handle_events, and only then should_render_frame!! Some screens accumulate events!
-            for event in pygame.event.get():
+            for event in event_source():
+                if profiler is not None and profiler.handle_event(event):
+                    continue
+                if overlay.handle_event(event):
+                    should_render = True
+                    continue
+                started = time.perf_counter()
                 should_render |= current_screen.handle_event(event)
+                handle_event_time.observe(time.perf_counter() - started)
+            started = time.perf_counter()
             should_render |= current_screen.should_render_frame()
+            should_render_time.observe(time.perf_counter() - started)
 
             if should_render:
+                frame_started = time.perf_counter()
                 run_render(screen_stack, display)
+                startup.TIMES.mark("first frame")
+                now = time.perf_counter()
+                if last_frame_at is not None:
+                    FRAME_INTERVAL.observe(now - last_frame_at)
+                last_frame_at = now
+                if on_frame is not None:
+                    on_frame(display, now - frame_started)
             
+    except SystemExit:
+        pass
     except:
         traceback.print_exc()
 
     finally:
+        if profiler is not None:
+            profiler.stop()
         pygame.quit()
-
-
-def run():
-    main()
+        for path in metrics.REGISTRY.export(persistence.get_data_directory() / "metrics"):
+            log.info("Metrics written to %s", path)
+        logs.shutdown_logging()
+
+
+def run(profile=None):
+    """Run the app. profile is the value of --profile, if it was given; see profiling.py."""
+    event_source = pygame.event.get
+    if os.environ.get(RECORD_EVENTS_ENV):
+        # For replaying the session's input in the harness later
+        from .harness import EventTimelineRecorder
+        event_source = EventTimelineRecorder(pathlib.Path(os.environ[RECORD_EVENTS_ENV]))
+    main(profile, event_source)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,31 @@
+"""
+Shared fonts for the screens.
+
+Looking up a system font can be slow (on Linux, pygame asks fontconfig for the whole font list the first time),
+and every screen used to create its own fonts, so they are created once per size and kept here.
+"""
+import functools
+import pygame
+
+# The sizes used by the screens, which the startup phase creates ahead of time
+PRELOAD_SIZES = (24, 36, 48)
+
+# Rendering these once warms up the glyph cache of a font
+PRELOAD_TEXT = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789 .,:;!?'\"()-_/%"
+
+
+@functools.lru_cache(maxsize=None)
+def get_font(size: int) -> pygame.font.Font:
+    """The default font in the given size, created on first use."""
+    pygame.font.init()
+    return pygame.font.SysFont(pygame.font.get_default_font(), size)
+
+
+def look_up_system_fonts():
+    """Build pygame's list of system fonts. This doesn't touch SDL, so it is safe to do on a background thread."""
+    pygame.font.get_fonts()
+
+
+def preload_font(size: int):
+    """Create the font of this size and render its common glyphs once. Must be called on the main thread."""
+    get_font(size).render(PRELOAD_TEXT, True, "white")
@@ -0,0 +1,163 @@
+"""
+Runs the app without a display or a controller, for benchmarks and CI.
+
+The app's own main loop (__main__.main) runs with SDL's dummy video driver, and its events come from a timeline:
+a list of (seconds from the start, event) pairs, written in Python with the helpers below,
+or loaded from a JSON-lines file that was recorded from a real session
+(run the app with ROBOTCONTROL_RECORD_EVENTS set to the file's path, see EventTimelineRecorder).
+
+    timeline = [button_down(1.0, 0), button_up(1.1, 0), axis(3.0, 1, -1.0), axis(5.0, 1, 0.0)]
+    result = run_app(timeline, linger=1.0, dump_frames={10, 100}, dump_directory=pathlib.Path("frames"))
+    print(result.summary())
+
+The run ends when the program exits, or when the timeline is over and linger seconds have passed.
+Every rendered frame's duration is collected in the result, and the frames selected by their number are saved as PNG.
+"""
+import json
+import os
+import pathlib
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+import pygame
+
+Timeline = List[Tuple[float, pygame.event.Event]]
+
+EVENT_TYPES = ("JOYBUTTONDOWN", "JOYBUTTONUP", "JOYAXISMOTION", "JOYHATMOTION", "KEYDOWN", "KEYUP", "TEXTINPUT")
+
+
+def use_dummy_drivers():
+    """Make SDL run without a display or sound card. This has to happen before pygame opens the display."""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+
+def button_down(t: float, button: int, joy: int = 0):
+    return t, pygame.event.Event(pygame.JOYBUTTONDOWN, button=button, joy=joy, instance_id=joy)
+
+
+def button_up(t: float, button: int, joy: int = 0):
+    return t, pygame.event.Event(pygame.JOYBUTTONUP, button=button, joy=joy, instance_id=joy)
+
+
+def press(t: float, button: int, hold: float = 0.1) -> Timeline:
+    """A button pressed at t, and released hold seconds later."""
+    return [button_down(t, button), button_up(t + hold, button)]
+
+
+def axis(t: float, axis: int, value: float, joy: int = 0):
+    return t, pygame.event.Event(pygame.JOYAXISMOTION, axis=axis, value=value, joy=joy, instance_id=joy)
+
+
+def hat(t: float, value: Tuple[int, int], joy: int = 0):
+    return t, pygame.event.Event(pygame.JOYHATMOTION, hat=0, value=value, joy=joy, instance_id=joy)
+
+
+def key(t: float, key: int, unicode: str = ""):
+    return t, pygame.event.Event(pygame.KEYDOWN, key=key, unicode=unicode, mod=0)
+
+
+def event_to_json(t: float, event) -> str:
+    attrs = {name: value for name, value in event.dict.items() if isinstance(value, (int, float, str, list, tuple))}
+    return json.dumps({"t": round(t, 4), "type": pygame.event.event_name(event.type).upper(), "attrs": attrs})
+
+
+def load_timeline(path: pathlib.Path) -> Timeline:
+    """Read a timeline written by EventTimelineRecorder."""
+    timeline = []
+    with path.open() as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                attrs = {name: tuple(value) if isinstance(value, list) else value for name, value in item["attrs"].items()}
+                timeline.append((item["t"], pygame.event.Event(getattr(pygame, item["type"]), **attrs)))
+    return timeline
+
+
+class EventTimelineRecorder:
+    """An event source that passes on pygame's events, and writes the controller and keyboard ones into a timeline file."""
+
+    def __init__(self, path: pathlib.Path, source: Optional[Callable[[], list]] = None):
+        self.source = source or pygame.event.get
+        self.types = {getattr(pygame, name) for name in EVENT_TYPES}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Line buffered, so that the timeline is complete however the app ends
+        self.file = path.open("w", buffering=1)
+        self.started = time.perf_counter()
+
+    def __call__(self):
+        events = self.source()
+        for event in events:
+            if event.type in self.types:
+                self.file.write(event_to_json(time.perf_counter() - self.started, event) + "\n")
+        return events
+
+
+class TimelineEventSource:
+    """An event source that hands out the timeline's events once their time has come, along with pygame's own events."""
+
+    def __init__(self, timeline: Timeline, linger: float = 1.0, source: Callable[[], list] = pygame.event.get):
+        self.timeline = sorted(timeline, key=lambda item: item[0])
+        self.linger = linger
+        self.source = source
+        self.next = 0
+        self.started: Optional[float] = None
+
+    def __call__(self):
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now
+        elapsed = now - self.started
+        events = self.source()
+        while self.next < len(self.timeline) and self.timeline[self.next][0] <= elapsed:
+            events.append(self.timeline[self.next][1])
+            self.next += 1
+        if self.next == len(self.timeline) and elapsed > (self.timeline[-1][0] if self.timeline else 0) + self.linger:
+            raise SystemExit
+        return events
+
+
+class HarnessResult:
+    def __init__(self):
+        self.frame_times: List[float] = []
+        self.frame_seconds: List[float] = []
+        self.dumped: List[pathlib.Path] = []
+        self.started = time.perf_counter()
+        self.ended = self.started
+
+    def summary(self) -> Dict[str, float]:
+        if not self.frame_seconds:
+            return {"frames": 0}
+        ordered = sorted(self.frame_seconds)
+
+        def percentile(fraction):
+            return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+        duration = self.ended - self.started
+        return {
+            "frames": len(ordered), "seconds": duration, "fps": len(ordered) / duration if duration else 0.0,
+            "p50_ms": percentile(0.5), "p95_ms": percentile(0.95), "p99_ms": percentile(0.99), "max_ms": ordered[-1] * 1000,
+        }
+
+
+def run_app(timeline: Timeline, linger: float = 1.0, dump_frames: Iterable[int] = (), dump_directory: Optional[pathlib.Path] = None) -> HarnessResult:
+    """Run the app's main loop on the timeline, with the dummy drivers. See the module docstring."""
+    use_dummy_drivers()
+    from . import __main__ as app
+
+    result = HarnessResult()
+    dump_frames: Set[int] = set(dump_frames)
+
+    def on_frame(display: pygame.Surface, seconds: float):
+        result.frame_times.append(time.perf_counter() - result.started)
+        result.frame_seconds.append(seconds)
+        number = len(result.frame_seconds)
+        if number in dump_frames and dump_directory is not None:
+            dump_directory.mkdir(parents=True, exist_ok=True)
+            path = dump_directory / f"frame-{number:05}.png"
+            pygame.image.save(display, str(path))
+            result.dumped.append(path)
+
+    result.started = time.perf_counter()
+    app.main(event_source=TimelineEventSource(timeline, linger), on_frame=on_frame, fullscreen=False)
+    result.ended = time.perf_counter()
+    return result
@@ -0,0 +1,73 @@
+"""
+Instant replay: the most recent video frames are kept as they were received (JPEG, not decoded or re-encoded),
+up to a number of bytes, so that what just happened can be saved as a clip after the fact.
+
+Adding a frame keeps a reference to the received data, and forgets the oldest frames once they are over the limit,
+so it costs the video thread no more than an append. Saving writes the frames one after another as an MJPEG stream,
+which ffplay, VLC and mpv play directly, on a thread of its own.
+"""
+import collections
+import logging
+import pathlib
+import threading
+import time
+from concurrent.futures import Future
+from typing import Deque, List, Tuple
+
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+# 32 MiB is about half a minute of the server's 640x480 video
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+CLIPS_SAVED = metrics.counter("instant_replay.clips_saved")
+
+
+class FrameRing:
+    """The most recent JPEG frames, with their capture times, that fit into max_bytes together."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.frames: Deque[Tuple[float, bytes]] = collections.deque()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def add(self, when_captured: float, jpeg_data):
+        """Keep a frame. jpeg_data can be a memoryview into the received message: it is not copied."""
+        with self.lock:
+            self.frames.append((when_captured, jpeg_data))
+            self.size += len(jpeg_data)
+            while self.size > self.max_bytes and len(self.frames) > 1:
+                self.size -= len(self.frames.popleft()[1])
+
+    def snapshot(self) -> List[Tuple[float, bytes]]:
+        with self.lock:
+            return list(self.frames)
+
+    def save(self, path: pathlib.Path) -> Future:
+        """Write the frames kept right now into an MJPEG file, on a background thread. The future's result is the path."""
+        frames = self.snapshot()
+        future = Future()
+
+        def write():
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with path.open("wb") as f:
+                    for _, jpeg_data in frames:
+                        f.write(jpeg_data)
+                CLIPS_SAVED.inc()
+                if frames:
+                    duration = frames[-1][0] - frames[0][0]
+                    log.info("Saved %d frames (%.1f s) of video to %s", len(frames), duration, path)
+                future.set_result(path)
+            except BaseException as e:
+                log.exception("Could not save the instant replay to %s", path)
+                future.set_exception(e)
+
+        threading.Thread(target=write, daemon=True, name="instant replay writer").start()
+        return future
+
+
+def clip_path(directory: pathlib.Path) -> pathlib.Path:
+    return directory / f"replay-{time.strftime('%Y%m%d-%H%M%S')}.mjpeg"
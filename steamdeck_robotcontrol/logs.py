@@ -0,0 +1,149 @@
+"""
+Logging that never makes the render or control loops wait for a terminal.
+
+setup_logging() makes the loggers of this package (and of the demo server) hand their records to a queue,
+which a background thread writes to stderr. Writing to a slow terminal, or to the devkit's log pipe,
+then only delays that thread. On the calling thread, logging costs a level check, and for records
+that pass it, building the record and putting it into the queue.
+
+Each call site is rate limited: at most RATE_LIMIT_BURST records from one line of code get through
+in every RATE_LIMIT_INTERVAL seconds, and the next one that gets through after some were dropped says how many.
+So a log call can be left in a loop that runs every frame.
+
+The most recent records are also kept in memory in RECENT, which the metrics overlay shows.
+
+    log = logging.getLogger(__name__)
+    log.debug("Sent %s", setpoints)     # arguments are only formatted on the background thread
+"""
+import collections
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Deque, Dict, Optional, Tuple
+
+from . import metrics
+
+LEVEL_ENV = "ROBOTCONTROL_LOG_LEVEL"
+FORMAT = "%(asctime)s %(levelname)s %(threadName)s %(name)s: %(message)s"
+
+# At most this many records per call site in this many seconds
+RATE_LIMIT_BURST = 5
+RATE_LIMIT_INTERVAL = 1.0
+
+# How many records RECENT holds
+RECENT_RECORDS = 200
+
+SUPPRESSED = metrics.counter("log.suppressed")
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets at most burst records per interval through from each call site (file and line)."""
+
+    def __init__(self, burst: int = RATE_LIMIT_BURST, interval: float = RATE_LIMIT_INTERVAL):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        # For each call site: when its current interval started, and how many records it let through since
+        self.windows: Dict[Tuple[str, int], Tuple[float, int]] = dict()
+        self.suppressed: Dict[Tuple[str, int], int] = dict()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        started, passed = self.windows.get(site, (0.0, 0))
+        if now - started >= self.interval:
+            started, passed = now, 0
+        if passed >= self.burst:
+            self.suppressed[site] = self.suppressed.get(site, 0) + 1
+            SUPPRESSED.inc()
+            return False
+        self.windows[site] = (started, passed + 1)
+        record.suppressed = self.suppressed.pop(site, 0)
+        return True
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the most recent records in memory."""
+
+    def __init__(self, capacity: int = RECENT_RECORDS):
+        super().__init__()
+        self.records: Deque[logging.LogRecord] = collections.deque(maxlen=capacity)
+
+    def emit(self, record: logging.LogRecord):
+        self.records.append(record)
+
+    def lines(self, count: int):
+        """The formatted last count records, oldest first."""
+        return [self.format(record) for record in list(self.records)[-count:]]
+
+
+class SuppressedCountFormatter(logging.Formatter):
+    """Says how many records from the same call site were dropped by the rate limit before this one."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            text += f" ({suppressed} similar suppressed)"
+        return text
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records into the queue as they are. The standard QueueHandler formats the message first,
+    so that records can be pickled, but these stay in this process, so formatting is left to the background thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+RECENT = RingBufferHandler()
+RECENT.setFormatter(SuppressedCountFormatter("%(levelname)s %(name)s: %(message)s"))
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[NonBlockingQueueHandler] = None
+_loggers: Tuple[str, ...] = ()
+_lock = threading.Lock()
+
+
+def setup_logging(level: Optional[str] = None, loggers=("steamdeck_robotcontrol", "__main__"), stream=None):
+    """
+    Send the records of the given loggers through the queue. The level defaults to $ROBOTCONTROL_LOG_LEVEL, or INFO.
+    Calling it again only changes the level.
+    """
+    global _listener, _handler, _loggers
+    level = (level or os.environ.get(LEVEL_ENV) or "INFO").upper()
+    with _lock:
+        if _listener is None:
+            console = logging.StreamHandler(stream or sys.stderr)
+            console.setFormatter(SuppressedCountFormatter(FORMAT))
+            log_queue = queue.SimpleQueue()
+            _handler = NonBlockingQueueHandler(log_queue)
+            _handler.addFilter(RateLimitFilter())
+            _loggers = tuple(loggers)
+            for name in _loggers:
+                logger = logging.getLogger(name)
+                logger.addHandler(_handler)
+                logger.propagate = False
+            _listener = logging.handlers.QueueListener(log_queue, console, RECENT, respect_handler_level=True)
+            _listener.start()
+        for name in loggers:
+            logging.getLogger(name).setLevel(level)
+
+
+def shutdown_logging():
+    """Write out whatever is still queued, stop the background thread, and give the loggers back their usual handling."""
+    global _listener, _handler
+    with _lock:
+        if _listener is not None:
+            for name in _loggers:
+                logger = logging.getLogger(name)
+                logger.removeHandler(_handler)
+                logger.propagate = True
+            _listener.stop()
+            _listener = _handler = None
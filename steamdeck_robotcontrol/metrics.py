@@ -0,0 +1,181 @@
+"""
+Lightweight metrics: counters, gauges and fixed-bucket histograms, kept in a registry.
+
+Recording is meant to be left on all the time, so it is as cheap as it can be in Python:
+metrics are looked up once and kept, and recording only updates a few numbers, without locks.
+Updates from several threads at once may, very rarely, lose an increment; that's fine for monitoring.
+
+    FRAMES = metrics.counter("video.frames")
+    DECODE = metrics.histogram("video.decode_seconds")
+    FRAMES.inc()
+    DECODE.observe(elapsed)
+
+The overlay (see overlay.py) shows the registry on screen, and it is exported to JSON and CSV when the app exits.
+"""
+import bisect
+import csv
+import json
+import pathlib
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+# Bucket upper bounds for durations, in seconds: from 0.1 ms to 1 s, roughly doubling
+DURATION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.002, 0.004, 0.008, 0.0167, 0.033, 0.066, 0.133, 0.25, 0.5, 1.0)
+
+
+class Counter:
+    """A number that only goes up, like the number of messages sent."""
+    kind = "counter"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.value = 0
+
+    def inc(self, amount: Union[int, float] = 1):
+        self.value += amount
+
+    def snapshot(self) -> dict:
+        return {"value": self.value}
+
+
+class Gauge:
+    """A number that is set to the current value of something, like a queue depth."""
+    kind = "gauge"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.value: Union[int, float] = 0
+        self.max: Union[int, float] = 0
+
+    def set(self, value: Union[int, float]):
+        self.value = value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self) -> dict:
+        return {"value": self.value, "max": self.max}
+
+
+class Histogram:
+    """
+    Counts observations into fixed buckets, so that recording is a binary search and an increment,
+    and percentiles can be estimated (to the bucket's upper bound) without keeping the observations.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, buckets: Sequence[float] = DURATION_BUCKETS):
+        self.name = name
+        self.buckets = tuple(buckets)
+        # The last count is for observations above the last bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def percentile(self, fraction: float) -> float:
+        """The upper bound of the bucket that the given fraction of observations falls under (the max, for the overflow bucket)."""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count, "sum": self.sum, "mean": self.mean, "max": self.max,
+            "p50": self.percentile(0.5), "p95": self.percentile(0.95), "p99": self.percentile(0.99),
+            "buckets": list(self.buckets), "counts": list(self.counts),
+        }
+
+
+Metric = Union[Counter, Gauge, Histogram]
+
+
+class Registry:
+    """Holds metrics by name. Asking for a metric that exists returns it, so modules can share them."""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = dict()
+        self.created_at = time.time()
+
+    def _get(self, name: str, cls, *args) -> Metric:
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, *args)
+        elif not isinstance(metric, cls):
+            raise TypeError(f"Metric {name} is a {metric.kind}, not a {cls.kind}")
+        return metric
+
+    def counter(self, name: str) -> Counter:
+        return self._get(name, Counter)
+
+    def gauge(self, name: str) -> Gauge:
+        return self._get(name, Gauge)
+
+    def histogram(self, name: str, buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+        return self._get(name, Histogram, buckets)
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {name: {"kind": metric.kind, **metric.snapshot()} for name, metric in sorted(self.metrics.items())}
+
+    def export_json(self, path: pathlib.Path):
+        report = {"started": self.created_at, "exported": time.time(), "metrics": self.snapshot()}
+        path.write_text(json.dumps(report, indent=2))
+
+    def export_csv(self, path: pathlib.Path):
+        """One row per metric, with the summary values (not the buckets)."""
+        columns = ["name", "kind", "value", "count", "sum", "mean", "max", "p50", "p95", "p99"]
+        with path.open("w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+            writer.writeheader()
+            for name, values in self.snapshot().items():
+                writer.writerow({"name": name, **values})
+
+    def export(self, directory: pathlib.Path, stem: Optional[str] = None) -> List[pathlib.Path]:
+        """Write the JSON and CSV exports into the directory, named after the time the registry was created."""
+        directory.mkdir(parents=True, exist_ok=True)
+        stem = stem or time.strftime("metrics-%Y%m%d-%H%M%S", time.localtime(self.created_at))
+        paths = [directory / f"{stem}.json", directory / f"{stem}.csv"]
+        self.export_json(paths[0])
+        self.export_csv(paths[1])
+        return paths
+
+
+# The registry of the application
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+class RateTracker:
+    """Turns counters into per-second rates, between one call to rates() and the next."""
+
+    def __init__(self):
+        self.last_values: Dict[str, float] = dict()
+        self.last_time = time.perf_counter()
+
+    def rates(self, counters: Iterable[Counter]) -> Dict[str, float]:
+        now = time.perf_counter()
+        elapsed = max(now - self.last_time, 1e-9)
+        result = dict()
+        for metric in counters:
+            result[metric.name] = (metric.value - self.last_values.get(metric.name, 0)) / elapsed
+            self.last_values[metric.name] = metric.value
+        self.last_time = now
+        return result
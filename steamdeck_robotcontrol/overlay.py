@@ -0,0 +1,79 @@
+"""
+An on-screen view of the metrics registry, drawn over whatever screen is showing.
+"""
+import time
+from typing import List
+import pygame
+
+from steamdeck_robotcontrol import fonts, logs, metrics
+from steamdeck_robotcontrol.metrics import Counter, Gauge, Histogram, RateTracker
+
+# Toggles the overlay on the controller (the right menu button on the Deck), or on a keyboard
+TOGGLE_BUTTON = 7
+TOGGLE_KEY = pygame.K_F3
+
+# The text is only rendered this often; in between, the same image is drawn again
+REFRESH_INTERVAL = 0.5
+
+# How many of the most recent log records are shown under the metrics
+LOG_LINES = 8
+
+
+class MetricsOverlay:
+    """
+    Draws the metrics of a registry, and the most recent log records, in a corner of the display.
+    The overlay is drawn whenever the current screen renders a frame, so it updates as often as that screen does.
+    """
+
+    def __init__(self, registry: metrics.Registry = metrics.REGISTRY, recent_logs: logs.RingBufferHandler = logs.RECENT):
+        self.registry = registry
+        self.recent_logs = recent_logs
+        self.enabled = False
+        self.image = None
+        self.next_refresh_at = 0.0
+        self.rate_tracker = RateTracker()
+
+    def handle_event(self, event: pygame.event.Event) -> bool:
+        """Returns True if the event toggled the overlay, in which case it shouldn't go to the screen."""
+        if (event.type == pygame.JOYBUTTONDOWN and event.button == TOGGLE_BUTTON) or (event.type == pygame.KEYDOWN and event.key == TOGGLE_KEY):
+            self.enabled = not self.enabled
+            self.next_refresh_at = 0.0
+            return True
+        return False
+
+    def lines(self) -> List[str]:
+        values = list(self.registry.metrics.values())
+        rates = self.rate_tracker.rates(metric for metric in values if isinstance(metric, Counter))
+        lines = []
+        for metric in values:
+            if isinstance(metric, Histogram):
+                if metric.count:
+                    lines.append(f"{metric.name}: n={metric.count} mean {metric.mean * 1000:.2f} p95 {metric.percentile(0.95) * 1000:.1f} max {metric.max * 1000:.1f} ms")
+            elif isinstance(metric, Counter):
+                lines.append(f"{metric.name}: {metric.value} ({rates[metric.name]:.1f}/s)")
+            elif isinstance(metric, Gauge):
+                lines.append(f"{metric.name}: {metric.value} (max {metric.max})")
+        return sorted(lines)
+
+    def render(self) -> pygame.Surface:
+        font = fonts.get_font(24)
+        labels = [font.render(line, True, "white") for line in self.lines()] or [font.render("No metrics yet", True, "white")]
+        labels += [font.render(line, True, "yellow") for line in self.recent_logs.lines(LOG_LINES)]
+        width = max(label.get_width() for label in labels) + 10
+        height = sum(label.get_height() for label in labels) + 10
+        image = pygame.Surface((width, height), pygame.SRCALPHA)
+        image.fill((0, 0, 0, 180))
+        y = 5
+        for label in labels:
+            image.blit(label, (5, y))
+            y += label.get_height()
+        return image
+
+    def draw(self, display: pygame.Surface):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if now >= self.next_refresh_at:
+            self.image = self.render()
+            self.next_refresh_at = now + REFRESH_INTERVAL
+        display.blit(self.image, (0, 0))
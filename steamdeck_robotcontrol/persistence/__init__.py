@@ -1,38 +1,150 @@
 """
 For the use of application screens, a persistence layer is provided.
-This is a scoped key-value store, backed by SQLite databases, where the values are JSON objects.
+This is a scoped key-value store, backed by a single SQLite database in the data directory, where the values are JSON objects.
 """
+import atexit
+import logging
+import os
 import sqlite3
-from typing import Dict, Tuple
+import threading
+from typing import Dict, Optional
 import weakref
 import pathlib
-from .database import KVDatabase
+from .cache import CachePolicy
+from .connection import SharedConnection
+from .codecs import BINARY_CODEC, JSON_CODEC, BinaryCodec, Codec, JSONCodec, register_codec
+from .database import KVDatabase, create_scope_table, quote_identifier, table_name_for_scope
+from .frozen import FrozenDict, FrozenList, freeze, thaw
+from .worker import PersistenceWorker
 
-# Holds opened sqlite3 connections
+log = logging.getLogger(__name__)
+
+# The name of the database file, in the data directory, that holds every scope
+DATABASE_FILENAME = "robotcontrol.sqlite3"
+
+# Holds the opened connection to each database file, shared by every scope in it.
 # These will get closed automatically on program shutdown, so strong references are held here.
-CONNECTIONS: Dict[str, Tuple[pathlib.Path, sqlite3.Connection]] = dict()
+CONNECTIONS: Dict[pathlib.Path, SharedConnection] = dict()
+
+# Holds the background workers for scopes opened with background=True: one per database file,
+# shared by every such scope, and owning its own connection.
+WORKERS: Dict[pathlib.Path, SharedConnection] = dict()
 
 # Holds weak references to KVDatabases, so that we can return the same one
 # in order to share their cache.
 DATABASES: weakref.WeakValueDictionary[str, KVDatabase] = weakref.WeakValueDictionary()
 
-def get_path_for_key(key: str) -> pathlib.Path:
-    return pathlib.Path(f"./{key}.sqlite3")  # TODO: store this in a well-known location
+# Guards CONNECTIONS, WORKERS and DATABASES, since scopes can be opened from several threads at once.
+# It is never held while a connection's lock is taken, so that opening a scope inside a batch can't deadlock.
+REGISTRY_LOCK = threading.Lock()
+
+
+def get_data_directory() -> pathlib.Path:
+    """
+    The well-known directory where the application keeps its data, independent of the working directory.
+    Can be overridden with the ROBOTCONTROL_DATA_DIR environment variable.
+    """
+    override = os.environ.get("ROBOTCONTROL_DATA_DIR")
+    if override:
+        return pathlib.Path(override)
+    base = os.environ.get("XDG_DATA_HOME") or pathlib.Path.home() / ".local" / "share"
+    return pathlib.Path(base) / "steamdeck_robotcontrol"
+
+
+def get_database_path() -> pathlib.Path:
+    directory = get_data_directory()
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / DATABASE_FILENAME
+
 
+def get_legacy_path_for_key(key: str) -> pathlib.Path:
+    """Where scopes used to be stored, one file per scope, relative to the working directory."""
+    return pathlib.Path(f"./{key}.sqlite3")
 
-def get_database(key: str) -> KVDatabase:
-    # First check if the database already exists. If it does, produce that.
-    if key in DATABASES:
-        return DATABASES[key]
-    # Then check if the database was opened. If it was, wrap it in a KVDatabase.
-    elif key in CONNECTIONS:
-        db = KVDatabase(CONNECTIONS[key][1], key, CONNECTIONS[key][0], perform_init=False)  # No init needed, because it will have been done at least once.
+
+def import_legacy_scope(connection: SharedConnection, key: str):
+    """
+    If the scope doesn't exist yet in the shared database, but there is a file for it in the old location,
+    copy its contents over, so that settings saved by older versions are kept.
+    The old file is left where it is.
+    """
+    legacy_path = get_legacy_path_for_key(key)
+    if not legacy_path.is_file():
+        return
+    table_name = table_name_for_scope(key)
+    exists = connection.run_query(lambda conn: conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table_name,)).fetchone())
+    if exists:
+        return
+    legacy = sqlite3.connect(legacy_path)
+    try:
+        rows = legacy.execute("SELECT key, value_json FROM props").fetchall()
+    except sqlite3.Error:
+        return
+    finally:
+        legacy.close()
+    table = quote_identifier(table_name)
+    def copy_rows(conn: sqlite3.Connection):
+        create_scope_table(conn, table)
+        conn.executemany(f"INSERT OR IGNORE INTO {table}(key, value_json) VALUES (?, ?)", rows)
+    with connection.batch():
+        connection.run_write(copy_rows)
+    log.info("Imported %d items for scope %s from %s", len(rows), key, legacy_path)
+
+
+def get_database(key: str, commit_interval: Optional[float] = None, background: bool = False, cache_policy: Optional[CachePolicy] = None, external_change_check_interval: Optional[float] = None, codec: Optional[Codec] = None) -> KVDatabase:
+    """
+    Get the KVDatabase for the scope key.
+    Every scope is stored in the same database file (see get_database_path()),
+    and every scope opened the same way shares one connection,
+    so a batch() on one of them can include writes to the others.
+
+    The cache_policy and codec (which values are stored with, JSON by default) only apply if the scope is not already open;
+    commit_interval and external_change_check_interval, only if the connection is not already open either:
+    if background is set, the scope uses the PersistenceWorker thread, and its cache is filled right away,
+    so that the caller normally never waits for SQLite;
+    otherwise, if commit_interval is given, the connection will be in write-behind mode (see KVDatabase).
+    If the database file may be written by other processes, give an external_change_check_interval,
+    and the cache is discarded within about that many seconds of another process committing a write.
+    Any thread can open a scope; if two open the same one at once, both get the same KVDatabase,
+    though the one that didn't make it may get it before its cache is filled.
+    """
+    path = get_database_path()
+    with REGISTRY_LOCK:
+        # First check if the database already exists. If it does, produce that.
+        db = DATABASES.get(key)
+        if db is not None:
+            return db
+        registry = WORKERS if background else CONNECTIONS
+        connection = registry.get(path)
+        if connection is None:
+            if background:
+                worker = PersistenceWorker(path, commit_interval or 0.0, data_version_poll_interval=external_change_check_interval)
+                connection = SharedConnection(path, worker=worker)
+            else:
+                # Write-behind commits happen on a timer thread, so the connection can't be bound to this thread.
+                connection = SharedConnection(path, conn=sqlite3.connect(path, check_same_thread=False), commit_interval=commit_interval)
+            registry[path] = connection
+
+    # These take the connection's lock, so they happen outside the registry's; both can safely be done twice
+    import_legacy_scope(connection, key)
+    # The strong reference must be held until we return, otherwise the weak one dies immediately.
+    db = KVDatabase(connection, key, perform_init=True, cache_policy=cache_policy, external_change_check_interval=external_change_check_interval, codec=codec)
+    with REGISTRY_LOCK:
+        existing = DATABASES.get(key)
+        if existing is not None:
+            # Another thread opened the scope meanwhile; only one KVDatabase may cache it
+            return existing
         DATABASES[key] = db
-        return get_database(key)
-    # If not, open it, store it, then wrap it.
-    else:
-        path = get_path_for_key(key)
-        conn = sqlite3.connect(get_path_for_key(key))
-        CONNECTIONS[key] = (path, conn)
-        DATABASES[key] = KVDatabase(conn, key, path, perform_init=True)
-        return get_database(key)
\ No newline at end of file
+    if background:
+        db.populate_cache()
+    return db
+
+
+@atexit.register
+def flush_all_databases():
+    """Commit the writes that are still waiting for a deferred commit when the program exits."""
+    for connection in CONNECTIONS.values():
+        if connection.commit_interval is not None:
+            connection.flush()
+    for connection in WORKERS.values():
+        connection.close()
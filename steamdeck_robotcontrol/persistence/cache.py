@@ -0,0 +1,109 @@
+import collections
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+_MISSING = object()
+
+
+@dataclass
+class CachePolicy:
+    """
+    Limits on how much a KVDatabase keeps in its cache.
+    None means unlimited; by default, the cache is unbounded.
+
+    The size of an entry is estimated as the length of its encoded value,
+    which is a lower bound on its size in memory, but is cheap to get.
+    """
+    max_entries: Optional[int] = None
+    max_bytes: Optional[int] = None
+
+    @property
+    def is_bounded(self) -> bool:
+        return self.max_entries is not None or self.max_bytes is not None
+
+
+class LRUCache:
+    """
+    A dict-like cache that evicts the least recently used entries to stay within a CachePolicy.
+
+    get() counts hits and misses, and marks the entry as recently used;
+    the other operations don't touch the statistics, so that internal bookkeeping doesn't skew them.
+    """
+
+    def __init__(self, policy: Optional[CachePolicy] = None):
+        self.policy = policy or CachePolicy()
+        self.entries: collections.OrderedDict[str, Any] = collections.OrderedDict()
+        self.sizes: Dict[str, int] = dict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.entries.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def peek(self, key: str, default: Any = None) -> Any:
+        """Like get(), but without counting it or marking the entry as used."""
+        return self.entries.get(key, default)
+
+    def put(self, key: str, value: Any, size: int = 0):
+        """Store a value with its estimated size, then evict old entries if the policy requires it."""
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        self.total_bytes += size - self.sizes.get(key, 0)
+        self.sizes[key] = size
+        self._evict()
+
+    def _evict(self):
+        max_entries, max_bytes = self.policy.max_entries, self.policy.max_bytes
+        # The newest entry is never evicted, even if it's bigger than the whole limit on its own
+        while len(self.entries) > 1 and (
+            (max_entries is not None and len(self.entries) > max_entries)
+            or (max_bytes is not None and self.total_bytes > max_bytes)
+        ):
+            key, _ = self.entries.popitem(last=False)
+            self.total_bytes -= self.sizes.pop(key)
+            self.evictions += 1
+
+    def __setitem__(self, key: str, value: Any):
+        self.put(key, value)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.entries[key]
+
+    def __delitem__(self, key: str):
+        del self.entries[key]
+        self.total_bytes -= self.sizes.pop(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def items(self):
+        return self.entries.items()
+
+    def clear(self):
+        self.entries.clear()
+        self.sizes.clear()
+        self.total_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for tuning the policy."""
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
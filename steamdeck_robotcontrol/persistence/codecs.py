@@ -0,0 +1,186 @@
+"""
+Codecs turn the values of a KVDatabase into what is stored in SQLite, and back.
+
+JSON is the default: it is stored as TEXT, is readable with any SQLite tool,
+and supports the sub-document operations (append(), set_at(), remove_at()) inside SQLite.
+The binary codec stores a compact tagged encoding as a BLOB instead,
+which is smaller and many times faster for lists of numbers, such as recorded latencies or calibration tables.
+For small values, or lists of many small dicts, JSON is faster (its encoder is written in C); see benchmarks/codecs.py.
+
+The name of the codec is stored in each row, so rows written with different codecs can be mixed in a scope.
+"""
+import array
+import json
+import struct
+import sys
+from typing import Any, Dict, Union
+
+
+class Codec:
+    """Base class for codecs. The name is what gets stored in the row, so it must never change."""
+    name: str
+
+    def encode(self, value: Any) -> Union[str, bytes]:
+        raise NotImplementedError
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        raise NotImplementedError
+
+
+class JSONCodec(Codec):
+    name = "json"
+
+    def encode(self, value: Any) -> str:
+        return json.dumps(value)
+
+    def decode(self, data: str) -> Any:
+        return json.loads(data)
+
+
+# Tags of the binary encoding. Lengths and counts are unsigned 32-bit, numbers are 64-bit, all little-endian.
+_NONE, _TRUE, _FALSE, _INT, _BIG_INT, _FLOAT, _STR, _LIST, _DICT, _FLOAT_ARRAY, _INT_ARRAY = b"NTFiIdslmaq"
+_LENGTH = struct.Struct("<I")
+_INT64 = struct.Struct("<q")
+_FLOAT64 = struct.Struct("<d")
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+_NEEDS_BYTESWAP = sys.byteorder != "little"
+
+
+class BinaryCodec(Codec):
+    """
+    A compact binary encoding of JSON-like values.
+
+    Lists made only of floats, or only of integers that fit in 64 bits, are stored as packed arrays,
+    which are encoded and decoded in a single step instead of item by item.
+    Like JSON, tuples become lists, and dict keys must be strings.
+    """
+    name = "binary"
+
+    def encode(self, value: Any) -> bytes:
+        out = bytearray()
+        self._encode(value, out)
+        return bytes(out)
+
+    def _encode(self, value: Any, out: bytearray):
+        value_type = type(value)
+        if value is None:
+            out.append(_NONE)
+        elif value is True:
+            out.append(_TRUE)
+        elif value is False:
+            out.append(_FALSE)
+        elif isinstance(value, float):
+            out.append(_FLOAT)
+            out += _FLOAT64.pack(value)
+        elif isinstance(value, int):
+            if _INT64_MIN <= value <= _INT64_MAX:
+                out.append(_INT)
+                out += _INT64.pack(value)
+            else:
+                self._encode_text(_BIG_INT, str(value), out)
+        elif isinstance(value, str):
+            self._encode_text(_STR, value, out)
+        elif isinstance(value, (list, tuple)):
+            packed = self._pack_array(value)
+            if packed is not None:
+                tag, items = packed
+                if _NEEDS_BYTESWAP: items.byteswap()
+                out.append(tag)
+                out += _LENGTH.pack(len(items))
+                out += items.tobytes()
+            else:
+                out.append(_LIST)
+                out += _LENGTH.pack(len(value))
+                for item in value:
+                    self._encode(item, out)
+        elif isinstance(value, dict):
+            out.append(_DICT)
+            out += _LENGTH.pack(len(value))
+            for key, item in value.items():
+                if not isinstance(key, str): raise TypeError(f"Dict keys must be strings, not {key!r}")
+                self._encode_text(_STR, key, out)
+                self._encode(item, out)
+        else:
+            raise TypeError(f"Object of type {value_type.__name__} cannot be encoded")
+
+    @staticmethod
+    def _encode_text(tag: int, text: str, out: bytearray):
+        data = text.encode("utf-8")
+        out.append(tag)
+        out += _LENGTH.pack(len(data))
+        out += data
+
+    @staticmethod
+    def _pack_array(value) -> Any:
+        """Return (tag, array) if every item of the list is a float, or every item is a 64-bit integer."""
+        if not value:
+            return None
+        first_type = type(value[0])
+        if first_type is float and all(type(item) is float for item in value):
+            return _FLOAT_ARRAY, array.array("d", value)
+        if first_type is int and all(type(item) is int for item in value):
+            try:
+                return _INT_ARRAY, array.array("q", value)
+            except OverflowError:
+                return None
+        return None
+
+    def decode(self, data: bytes) -> Any:
+        view = memoryview(data)
+        value, offset = self._decode(view, 0)
+        if offset != len(view): raise ValueError(f"{len(view) - offset} bytes left over after decoding")
+        return value
+
+    def _decode(self, view: memoryview, offset: int):
+        start = offset
+        tag = view[offset]
+        offset += 1
+        if tag == _NONE:
+            return None, offset
+        if tag == _TRUE:
+            return True, offset
+        if tag == _FALSE:
+            return False, offset
+        if tag == _INT:
+            return _INT64.unpack_from(view, offset)[0], offset + 8
+        if tag == _FLOAT:
+            return _FLOAT64.unpack_from(view, offset)[0], offset + 8
+        length = _LENGTH.unpack_from(view, offset)[0]
+        offset += 4
+        if tag == _STR:
+            return str(view[offset:offset + length], "utf-8"), offset + length
+        if tag == _BIG_INT:
+            return int(str(view[offset:offset + length], "utf-8")), offset + length
+        if tag == _FLOAT_ARRAY or tag == _INT_ARRAY:
+            items = array.array("d" if tag == _FLOAT_ARRAY else "q")
+            end = offset + length * items.itemsize
+            items.frombytes(view[offset:end])
+            if _NEEDS_BYTESWAP: items.byteswap()
+            return items.tolist(), end
+        if tag == _LIST:
+            result = []
+            for _ in range(length):
+                item, offset = self._decode(view, offset)
+                result.append(item)
+            return result, offset
+        if tag == _DICT:
+            result = {}
+            for _ in range(length):
+                key, offset = self._decode(view, offset)
+                result[key], offset = self._decode(view, offset)
+            return result, offset
+        raise ValueError(f"Unknown tag {tag!r} at offset {start}")
+
+
+JSON_CODEC = JSONCodec()
+BINARY_CODEC = BinaryCodec()
+
+# Codecs by the name stored in the rows
+CODECS: Dict[str, Codec] = {codec.name: codec for codec in (JSON_CODEC, BINARY_CODEC)}
+
+
+def register_codec(codec: Codec):
+    """Make a custom codec available for decoding rows, in addition to the built-in ones."""
+    if codec.name in CODECS and CODECS[codec.name] is not codec:
+        raise ValueError(f"A different codec is already registered as {codec.name!r}")
+    CODECS[codec.name] = codec
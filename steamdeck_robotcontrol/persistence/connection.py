@@ -0,0 +1,134 @@
+import contextlib
+import pathlib
+import sqlite3
+import threading
+import weakref
+from typing import Any, Callable, Optional
+from .worker import PersistenceWorker
+
+
+class SharedConnection:
+    """
+    A database file, opened once and shared by the KVDatabases of every scope stored in it.
+
+    Holds what belongs to the connection rather than to a scope: the lock, the open batch and the pending commit.
+    Because of this, a batch covers the writes to every scope on the connection,
+    so writes to several scopes can be committed, or rolled back, together.
+
+    Either holds a sqlite3 connection directly, or a PersistenceWorker that owns one on its own thread.
+    For write-behind mode (see KVDatabase), a direct connection must be opened with check_same_thread=False.
+    """
+
+    def __init__(self, path: pathlib.Path, conn: Optional[sqlite3.Connection] = None, worker: Optional[PersistenceWorker] = None, commit_interval: Optional[float] = None):
+        if (conn is None) == (worker is None):
+            raise ValueError("Exactly one of conn and worker must be given")
+        self.path = path
+        self.conn = conn
+        self.worker = worker
+        self.commit_interval = commit_interval
+        self.lock = threading.RLock()
+        self.batch_depth = 0
+        self.commit_timer: Optional[threading.Timer] = None
+        # The KVDatabases using this connection, whose caches must be discarded when a batch is rolled back
+        self.databases: weakref.WeakSet = weakref.WeakSet()
+
+    def run_query(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run a function on the connection and return its result, waiting for the worker if there is one."""
+        if self.worker is not None:
+            return self.worker.call(fn)
+        return fn(self.conn)
+
+    def run_write(self, fn: Callable[[sqlite3.Connection], Any], on_failure: Optional[Callable[[BaseException], Any]] = None):
+        """
+        Run a function that writes to the connection; with a worker, this is queued without waiting,
+        and if it fails later, on_failure is called with the error (see PersistenceWorker.post).
+        Without a worker, the error is raised here instead.
+        """
+        if self.worker is not None:
+            self.worker.post(fn, on_failure)
+        else:
+            fn(self.conn)
+
+    def request_commit(self):
+        """
+        Called after every write: commits now, or arranges for a commit to happen later.
+        """
+        with self.lock:
+            if self.batch_depth or self.worker is not None:
+                return  # The batch will ask again when it ends, and the worker commits by itself
+            if self.commit_interval is None:
+                self.conn.commit()
+            elif self.commit_timer is None and self.conn.in_transaction:
+                self.commit_timer = threading.Timer(self.commit_interval, self.flush)
+                self.commit_timer.daemon = True
+                self.commit_timer.start()
+
+    def flush(self):
+        """
+        Commit every write that is waiting for a deferred commit.
+        Inside a batch, this does nothing: the batch commits when it ends.
+        """
+        with self.lock:
+            if self.batch_depth:
+                return
+            if self.worker is not None:
+                self.worker.flush()
+                return
+            if self.commit_timer is not None:
+                self.commit_timer.cancel()
+                self.commit_timer = None
+            self.conn.commit()
+
+    def close(self):
+        """Commit everything, and close the connection or stop the worker."""
+        self.flush()
+        if self.worker is not None:
+            self.worker.close()
+        else:
+            self.conn.close()
+
+    def _open_savepoint(self, conn: sqlite3.Connection):
+        if self.worker is not None:
+            self.worker.begin_batch(conn)
+        # Start the transaction explicitly, so that releasing the savepoint does not commit by itself.
+        # Any writes waiting for a write-behind commit are already in the transaction, and stay there.
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        conn.execute("SAVEPOINT kvdatabase_batch")
+
+    def _release_savepoint(self, conn: sqlite3.Connection, rollback: bool):
+        if rollback:
+            conn.execute("ROLLBACK TO kvdatabase_batch")
+        conn.execute("RELEASE kvdatabase_batch")
+        if self.worker is not None:
+            self.worker.end_batch(conn)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Context manager that groups every write inside it, to any scope on this connection,
+        into a single commit at the end of the block.
+
+        If the block raises an exception, its writes are rolled back, and the caches of every scope are discarded
+        (because they held the values that were rolled back).
+        Batches can be nested; the inner ones become part of the outermost one.
+        """
+        with self.lock:
+            outermost = self.batch_depth == 0
+            if outermost:
+                self.run_write(self._open_savepoint)
+            self.batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                if outermost:
+                    self.run_write(lambda conn: self._release_savepoint(conn, rollback=True))
+                    for db in list(self.databases):
+                        db.discard_cache()
+                raise
+            else:
+                if outermost:
+                    self.run_write(lambda conn: self._release_savepoint(conn, rollback=False))
+            finally:
+                self.batch_depth -= 1
+            self.request_commit()
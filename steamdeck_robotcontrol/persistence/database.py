@@ -1,42 +1,222 @@
 import json
 import pathlib
 import sqlite3
-from typing import Any
+import time
+from typing import Any, Callable, Optional, Sequence, Union
 from functools import wraps
+from .cache import CachePolicy, LRUCache
+from .codecs import CODECS, JSON_CODEC, Codec
+from .connection import SharedConnection
+from .frozen import FrozenDict, FrozenList, freeze
+from .worker import PersistenceWorker
+
+# How many rows are fetched at once when iterating over the database
+ITERATION_BATCH_SIZE = 256
+
+_MISSING = object()
+
+# A path into a JSON value: a sequence of list indexes and dict keys
+JSONPath = Sequence[Union[int, str]]
+
+
+def table_name_for_scope(key: str) -> str:
+    """Every scope is stored in a table of its own in the shared database file."""
+    return f"kv_{key}"
+
+
+# The columns of a scope's table. value_json holds whatever the row's codec produced, TEXT or BLOB;
+# it keeps its name from when every value was JSON.
+SCOPE_TABLE_COLUMNS = "key TEXT PRIMARY KEY, value_json TEXT, codec TEXT NOT NULL DEFAULT 'json'"
+
+
+def create_scope_table(conn: sqlite3.Connection, table: str):
+    """Create the table for a scope, or add the codec column to one from before codecs existed."""
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {table}({SCOPE_TABLE_COLUMNS})")
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if "codec" not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN codec TEXT NOT NULL DEFAULT 'json'")
+
+
+def decode_value(data: Union[str, bytes], codec_name: str) -> Any:
+    """Decode a stored value with the codec named in its row, and freeze it for the cache."""
+    if codec_name == "json":
+        return freeze(json.loads(data))
+    codec = CODECS.get(codec_name)
+    if codec is None: raise ValueError(f"Value was stored with unknown codec {codec_name!r}; it needs to be registered first")
+    return freeze(codec.decode(data))
+
+
+def quote_identifier(name: str) -> str:
+    """Quote a table name for use in SQL, so that scope keys can contain any character."""
+    return '"' + name.replace('"', '""') + '"'
 
 def mutates_database(func):
-    """Decorator to perform commit after the function returns."""
+    """
+    Decorator to perform commit after the function returns.
+    Inside a batch, or in write-behind mode, the commit is deferred instead.
+    """
     @wraps(func)
     def wrapped(self, *args, **kwargs):
-        try:
-            return func(self, *args, **kwargs)
-        finally:
-            self.conn.commit()
+        with self.lock:
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                self.request_commit()
     return wrapped
 
 class KVDatabase:
     """
     A wrapper around a SQLite database connection that provides dict-like key-value storage for JSONable types.
+    Each scope key is stored in a table of its own, so several scopes can share one database file and SharedConnection.
+
+    Values are returned from the cache without copying, so they are frozen (see frozen.py):
+    lists and dicts that raise TypeError when changed in place.
+    To change part of a stored value, use append(), set_at() and remove_at(),
+    which only send the change to SQLite instead of the whole value.
+
+    Values are stored with the scope's codec, JSON by default, or with the one given to set();
+    each row records its codec, so rows stored with different codecs can be mixed (see codecs.py).
 
     Performance is a focus. Every operation that can be cached, is.
-    For this reason, it is important that there is only one instance of this object for every connection,
+    For this reason, it is important that there is only one instance of this object for every scope,
     and that the database isn't being written by any other process;
     these are considerations external to this class.
 
+    If other connections or processes do need to write to the database,
+    give an external_change_check_interval: then before serving reads, at most that often,
+    PRAGMA data_version is checked, and the cache is discarded only if another connection has committed a write
+    (to any scope in the file, because SQLite only counts changes per file).
+    With a worker, the worker does the polling instead (see PersistenceWorker), and reads only compare a counter.
+
     Has a special state where the cache is complete.
     When this is the case, operations like enumerating the items or getting the length
     will not hit the underlying SQLite database.
+
+    The cache can be bounded by a CachePolicy, evicting the least recently used values.
+    The cache can then only be complete if everything fits; any eviction leaves the complete state.
+    Hit, miss and eviction counters are available from cache.stats().
+
+    Every write is normally committed (and so synced to disk) immediately.
+    Several writes can be grouped into a single commit using batch().
+    If a commit_interval is given, the database is in write-behind mode:
+    writes are committed together at most that many seconds later, from a timer thread,
+    or when flush() is called. Writes that have not been committed yet are lost if the program crashes.
+    For write-behind mode, the connection must be opened with check_same_thread=False.
+    Commits, batches and write-behind mode belong to the SharedConnection, so they cover every scope on it.
+
+    Alternatively, the SharedConnection can hold a PersistenceWorker instead of a sqlite3 connection.
+    Then the connection is only ever used on the worker's thread:
+    writes update the cache and are queued without waiting, and only reads that miss the cache wait for the worker.
+    If a queued write fails, the cache holds a value that SQLite doesn't, so the next read discards the cache.
+    The worker does its own group commits, and flush() waits until everything queued so far is committed.
     """
-    @mutates_database
-    def __init__(self, conn: sqlite3.Connection, key: str, path: pathlib.Path, perform_init=True):
-        self.conn = conn
+    def __init__(self, connection: SharedConnection, key: str, perform_init=True, cache_policy: Optional[CachePolicy] = None, external_change_check_interval: Optional[float] = None, codec: Optional[Codec] = None):
+        self.connection = connection
         self.key = key
-        self.path = path
+        self.table = quote_identifier(table_name_for_scope(key))
+        self.lock = connection.lock
+        self.codec = codec or JSON_CODEC
+        # Set by the worker's thread when a queued write failed; the cache is discarded on the next read
+        self.cache_is_stale = False
         if perform_init:
-            conn.execute("CREATE TABLE IF NOT EXISTS props(key TEXT PRIMARY KEY, value_json TEXT)")
-        self.cache = dict()
+            self.run_write(lambda conn: create_scope_table(conn, self.table))
+            self.connection.request_commit()
+        self.cache = LRUCache(cache_policy)
         self.cache_is_complete = False
+        connection.databases.add(self)
+
+        self.external_change_check_interval = external_change_check_interval
+        self.last_external_change_check = 0.0
+        self.data_version: Optional[int] = None
+        self.seen_external_changes = self.worker.external_changes if self.worker is not None else 0
+        if self.worker is None and external_change_check_interval is not None:
+            self.check_for_external_changes()
+
+    @property
+    def path(self) -> pathlib.Path:
+        return self.connection.path
+
+    @property
+    def worker(self) -> Optional[PersistenceWorker]:
+        return self.connection.worker
+
+    @property
+    def commit_interval(self) -> Optional[float]:
+        return self.connection.commit_interval
+
+    @property
+    def cache_is_complete(self) -> bool:
+        # Any eviction since the cache became complete means that something is missing from it again
+        return self._cache_complete_at_evictions == self.cache.evictions
+
+    @cache_is_complete.setter
+    def cache_is_complete(self, value: bool):
+        self._cache_complete_at_evictions = self.cache.evictions if value else None
+
+    def run_query(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run a function on the connection and return its result, waiting for the worker if there is one."""
+        return self.connection.run_query(fn)
+
+    def run_write(self, fn: Callable[[sqlite3.Connection], Any]):
+        """Run a function that writes to the connection; with a worker, this is queued without waiting."""
+        self.connection.run_write(fn, self._write_failed)
+
+    def _write_failed(self, exception: BaseException):
+        # Called on the worker's thread, which mustn't touch the cache while another thread may be using it
+        self.cache_is_stale = True
+
+    def request_commit(self):
+        """
+        Called after every write: commits now, or arranges for a commit to happen later.
+        """
+        self.connection.request_commit()
+
+    def flush(self):
+        """
+        Commit every write that is waiting for a deferred commit, in every scope on the connection.
+        Inside a batch, this does nothing: the batch commits when it ends.
+        """
+        self.connection.flush()
+
+    def batch(self):
+        """
+        Context manager that groups every write inside it into a single commit at the end of the block.
+
+        The batch belongs to the connection, so writes to other scopes on the same connection
+        made inside the block are part of it too, and are committed or rolled back together.
+        If the block raises an exception, its writes are rolled back, and the caches are discarded
+        (because they held the values that were rolled back).
+        Batches can be nested; the inner ones become part of the outermost one.
+        """
+        return self.connection.batch()
     
+    def check_for_external_changes(self):
+        """
+        Discard the cache if another connection has committed a write since the last check,
+        or if a write queued for the worker failed.
+        This is called before reads, so it is cheap: with a worker it compares a counter,
+        and otherwise it runs PRAGMA data_version at most once per external_change_check_interval.
+        """
+        if self.cache_is_stale:
+            self.cache_is_stale = False
+            self.discard_cache()
+        if self.worker is not None:
+            changes = self.worker.external_changes
+            if changes != self.seen_external_changes:
+                self.seen_external_changes = changes
+                self.discard_cache()
+            return
+        if self.external_change_check_interval is None:
+            return
+        now = time.perf_counter()
+        if now - self.last_external_change_check < self.external_change_check_interval:
+            return
+        self.last_external_change_check = now
+        version = self.connection.conn.execute("PRAGMA data_version").fetchone()[0]
+        if self.data_version is not None and version != self.data_version:
+            self.discard_cache()
+        self.data_version = version
+
     def discard_cache(self):
         """
         Clears the cache so that every value will need to be acquired from the database.
@@ -49,16 +229,18 @@ class KVDatabase:
         """Get a data item by key, from cache if possible, raising a KeyError if not there."""
         if not isinstance(key, str): raise TypeError("Keys should be strings")
 
-        if key in self.cache:
-            return self.cache[key]
+        self.check_for_external_changes()
+        value = self.cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
         else:
             if self.cache_is_complete: raise KeyError(f"Key {key} not in KVDatabase for scope key {self.key} (and the database is completely cached)")
-            cursor = self.conn.execute("SELECT value_json FROM props WHERE key=? LIMIT 1", (key,))
-            data = cursor.fetchone()
+            data = self.run_query(lambda conn: conn.execute(f"SELECT value_json, codec FROM {self.table} WHERE key=? LIMIT 1", (key,)).fetchone())
             if data is None: raise KeyError(f"Key {key} not in KVDatabase for scope key {self.key}")
             else:
-                self.cache[key] = json.loads(data[0])
-                return self.cache[key]
+                value = decode_value(data[0], data[1])
+                self.cache.put(key, value, len(data[0]))
+                return value
 
     def get(self, key: str, if_not_found=None) -> Any:
         """Get a data item by key, from cache if possible, returning the provided value or None if not found."""
@@ -73,33 +255,149 @@ class KVDatabase:
             return self.__getitem__(key)
         except:
             self.__setitem__(key, if_not_found)
-            return if_not_found
+            return self.cache[key]
 
-    @mutates_database
     def __setitem__(self, key: str, value: Any):
         """Set a data item, creating it if not exists, and updating the cache."""
-        json_val = json.dumps(value)
-        self.conn.execute("INSERT INTO props(key, value_json) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value_json=?", (key, json_val, json_val))
-        self.cache[key] = value
+        self.set(key, value)
+
+    @mutates_database
+    def set(self, key: str, value: Any, codec: Optional[Codec] = None):
+        """
+        Set a data item, stored with the given codec instead of the scope's default one.
+        For example, set('latencies', samples, codec=BINARY_CODEC) for a long list of numbers.
+        """
+        codec = codec or self.codec
+        encoded = codec.encode(value)
+        self.run_write(lambda conn: conn.execute(f"INSERT INTO {self.table}(key, value_json, codec) VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE SET value_json=excluded.value_json, codec=excluded.codec", (key, encoded, codec.name)))
+        # Freezing also copies, so the caller changing their object later won't affect the cache
+        self.cache.put(key, freeze(value), len(encoded))
 
     @mutates_database
     def __delitem__(self, key: str):
         """Delete a key from the database, as well as from the cache."""
         # We need to raise exceptions for keys that don't exist, so we'll try getting the value first, ignoring the result.
         self.__getitem__(key)
-        self.conn.execute("DELETE FROM props WHERE key=?", (key,))
+        self.run_write(lambda conn: conn.execute(f"DELETE FROM {self.table} WHERE key=?", (key,)))
         del self.cache[key]
 
+    def _update_at(self, key: str, path: JSONPath, operation: str, value: Any = None):
+        """
+        Apply a sub-document change to the cached value (loading it if needed), then the same change in SQLite.
+        The cached value is replaced copy-on-write: only the containers along the path are copied.
+        Only JSON rows can be changed inside SQLite; rows stored with other codecs are encoded again whole.
+        """
+        current = self.__getitem__(key)
+        # Work out the new value first, so that a bad path raises before anything is written
+        sql_path = "$"
+        containers = [current]
+        normalized = []
+        for step in path[:-1] if operation != "append" else path:
+            container = containers[-1]
+            step = _normalize_step(container, step)
+            containers.append(container[step])
+            normalized.append(step)
+            sql_path += _sql_path_step(step)
+
+        target = containers[-1]
+        if operation == "append":
+            if not isinstance(target, list): raise TypeError(f"Can only append to a list, not {type(target).__name__}")
+            new_target = FrozenList([*target, freeze(value)])
+            sql = f"UPDATE {self.table} SET value_json = json_insert(value_json, ?, json(?)) WHERE key = ?"
+            params = (sql_path + "[#]", json.dumps(value), key)
+        else:
+            if not path: raise ValueError("The path must not be empty; to replace the whole value, assign it instead")
+            last = _normalize_step(target, path[-1], allow_new_key=(operation == "set"))
+            sql_path += _sql_path_step(last)
+            if isinstance(target, list):
+                items = list(target)
+                if operation == "set": items[last] = freeze(value)
+                else: del items[last]
+                new_target = FrozenList(items)
+            else:
+                items = dict(target)
+                if operation == "set": items[last] = freeze(value)
+                else: del items[last]
+                new_target = FrozenDict(items)
+            if operation == "set":
+                sql = f"UPDATE {self.table} SET value_json = json_set(value_json, ?, json(?)) WHERE key = ?"
+                params = (sql_path, json.dumps(value), key)
+            else:
+                sql = f"UPDATE {self.table} SET value_json = json_remove(value_json, ?) WHERE key = ?"
+                params = (sql_path, key)
+
+        # Rebuild the containers above the target, from the inside out
+        new_value = new_target
+        for container, step in zip(reversed(containers[:-1]), reversed(normalized)):
+            if isinstance(container, list):
+                items = list(container)
+                items[step] = new_value
+                new_value = FrozenList(items)
+            else:
+                new_value = FrozenDict({**container, step: new_value})
+
+        table = self.table
+        def apply(conn: sqlite3.Connection):
+            if conn.execute(sql + " AND codec = 'json'", params).rowcount == 0:
+                row = conn.execute(f"SELECT codec FROM {table} WHERE key=?", (key,)).fetchone()
+                if row is not None:
+                    conn.execute(f"UPDATE {table} SET value_json = ? WHERE key = ?", (CODECS[row[0]].encode(new_value), key))
+        self.run_write(apply)
+        # The size only matters if the cache is limited by it, so don't pay for encoding otherwise
+        size = len(json.dumps(new_value)) if self.cache.policy.max_bytes is not None else 0
+        self.cache.put(key, new_value, size)
+
+    @mutates_database
+    def append(self, key: str, value: Any, path: JSONPath = ()):
+        """Append a value to the list stored under the key (or to the list at the path inside it)."""
+        self._update_at(key, path, "append", value)
+
+    @mutates_database
+    def set_at(self, key: str, path: JSONPath, value: Any):
+        """
+        Set the item at the path inside the value stored under the key, for example set_at('servers', (0, 'name'), 'Robot').
+        List indexes must already exist, but dict keys are created if they don't.
+        """
+        self._update_at(key, path, "set", value)
+
+    @mutates_database
+    def remove_at(self, key: str, path: JSONPath):
+        """Remove the item at the path inside the value stored under the key, for example remove_at('servers', (3,))."""
+        self._update_at(key, path, "remove")
+
     def __contains__(self, key: str) -> bool:
         """
         Returns whether the key is in the database.
         Consults but does not update the cache.
         """
+        self.check_for_external_changes()
         if key in self.cache:
             return True
         else:
             if self.cache_is_complete: return False
-            return self.conn.execute("SELECT 1 FROM props WHERE key=? LIMIT 1", (key,)).fetchone() is not None
+            return self.run_query(lambda conn: conn.execute(f"SELECT 1 FROM {self.table} WHERE key=? LIMIT 1", (key,)).fetchone()) is not None
+
+    def _batches(self, columns: str, batch_size: int):
+        """
+        Generator over lists of up to batch_size rows of the table, in key order.
+
+        Every batch is a separate query that continues after the last key seen (keyset pagination),
+        so no cursor is held open between batches: rows can be written in the meantime,
+        every key that exists throughout the iteration is yielded exactly once,
+        and with a worker each batch is a single round-trip to its thread.
+        """
+        last_key = None
+        while True:
+            if last_key is None:
+                query = (f"SELECT {columns} FROM {self.table} ORDER BY key LIMIT ?", (batch_size,))
+            else:
+                query = (f"SELECT {columns} FROM {self.table} WHERE key > ? ORDER BY key LIMIT ?", (last_key, batch_size))
+            rows = self.run_query(lambda conn: conn.execute(*query).fetchmany(batch_size))
+            if rows:
+                yield rows
+            if len(rows) < batch_size:
+                return
+            last_key = rows[-1][0]
 
     def __iter__(self):
         """
@@ -107,53 +405,50 @@ class KVDatabase:
         Does not load the keys into memory or into the cache,
         so it is expensive to call unless the database is in the cache_is_complete state.
         """
-        if self.cache_is_complete:
-            return iter(self.cache)
-
-        cursor = self.conn.execute("SELECT key FROM props")
-        def next_item():
-            item = cursor.fetchone()
-            if item: return item[0]
-            else: return None
-        
-        return iter(next_item, None)
+        return self.keys()
 
-    def keys(self):
+    def keys(self, batch_size: int = ITERATION_BATCH_SIZE):
         """
-        Returns an iterator over the keys.
+        Returns an iterator over the keys, fetched from the database in batches of batch_size.
         Does not load the keys into memory or into the cache,
         so it is expensive to call unless the database is in the cache_is_complete state.
         """
-        return self.__iter__()
-    
-    def items(self, load_into_cache=True):
+        self.check_for_external_changes()
+        if self.cache_is_complete:
+            # A snapshot, so that writing while iterating is allowed, like it is with the database
+            return iter(list(self.cache))
+        return (row[0] for rows in self._batches("key", batch_size) for row in rows)
+
+    def items(self, load_into_cache=True, batch_size: int = ITERATION_BATCH_SIZE):
         """
-        Returns an iterator over key-value pairs.
+        Returns an iterator over key-value pairs, fetched from the database in batches of batch_size.
         Also optionally loads the values yielded into cache,
         but this does not put the database into the fully-cached state (because the database may have been mutated during the iteration);
         for that, see populate_cache().
         """
+        self.check_for_external_changes()
         if self.cache_is_complete:
-            return iter(self.cache.items())
-
-        cursor = self.conn.execute("SELECT key, value_json FROM props")
-        def next_item():
-            item = cursor.fetchone()
-            if item:
-                k,v = item
-                if load_into_cache: self.cache[k] = json.loads(v)
-                return (k,v)
-            else: return None
-        return iter(next_item, None)
-    
-    def values(self, load_into_cache=True):
+            return iter(list(self.cache.items()))
+        return self._decoded_items(load_into_cache, batch_size)
+
+    def _decoded_items(self, load_into_cache: bool, batch_size: int):
+        cache = self.cache
+        loads = json.loads
+        for rows in self._batches("key, value_json, codec", batch_size):
+            for k, v, codec_name in rows:
+                # Values that are already cached don't need decoding again
+                value = cache.peek(k, _MISSING)
+                if value is _MISSING:
+                    value = freeze(loads(v)) if codec_name == "json" else decode_value(v, codec_name)
+                    if load_into_cache: cache.put(k, value, len(v))
+                yield (k, value)
+
+    def values(self, load_into_cache=True, batch_size: int = ITERATION_BATCH_SIZE):
         """
         Returns an iterator over the values.
         Is a wrapper around items(), and can do the same caching.
         """
-        underlying_iter = self.items(load_into_cache=load_into_cache)
-        second_item = lambda x: x[1] if x is not None else None
-        return iter(lambda: second_item(next(underlying_iter)))
+        return (v for _, v in self.items(load_into_cache=load_into_cache, batch_size=batch_size))
     
     @mutates_database
     def wipe_everything(self):
@@ -162,7 +457,7 @@ class KVDatabase:
         Also puts the database into the cache_is_complete state
         since after this there are zero items in the database.
         """
-        self.conn.execute("DELETE FROM props WHERE 1=1")
+        self.run_write(lambda conn: conn.execute(f"DELETE FROM {self.table} WHERE 1=1"))
         self.cache.clear()
         self.cache_is_complete = True
 
@@ -171,17 +466,44 @@ class KVDatabase:
         Return the number of rows in the database.
         If cache_is_complete, does not hit the database.
         """
+        self.check_for_external_changes()
         if self.cache_is_complete:
             return len(self.cache)
         else:
-            return self.conn.execute("SELECT count(*) FROM props").fetchone()[0]
+            return self.run_query(lambda conn: conn.execute(f"SELECT count(*) FROM {self.table}").fetchone()[0])
         
     def populate_cache(self):
         """
         Iterate over the database, reading every item into cache.
-        After this, the database has cache_is_complete, which speeds up many operations.
+        After this, the database has cache_is_complete, which speeds up many operations,
+        unless the cache policy did not allow everything to fit.
         """
-        # Iterating over self.items() will load every value into the cache,
-        # and doing it here ensures that the database will not be changed in the meantime.
-        _ = list(self.items(load_into_cache=True))
-        self.cache_is_complete = True
\ No newline at end of file
+        # Iterating over self.items() loads every value into the cache. It fetches a batch at a time,
+        # so writes from other threads could land between batches, and a value fetched before a write would then
+        # be put into the cache after it: the lock keeps writes out until the cache is complete.
+        with self.lock:
+            evictions_before = self.cache.evictions
+            _ = list(self.items(load_into_cache=True))
+            self.cache_is_complete = self.cache.evictions == evictions_before
+
+
+def _normalize_step(container: Any, step: Union[int, str], allow_new_key: bool = False) -> Union[int, str]:
+    """Check that a path step exists in the container, turning negative list indexes into positive ones."""
+    if isinstance(container, list):
+        if not isinstance(step, int) or isinstance(step, bool): raise TypeError(f"List indexes must be integers, not {step!r}")
+        if not -len(container) <= step < len(container): raise IndexError(f"List index {step} out of range")
+        return step % len(container)
+    elif isinstance(container, dict):
+        if not isinstance(step, str): raise TypeError(f"Dict keys must be strings, not {step!r}")
+        if step not in container and not allow_new_key: raise KeyError(step)
+        return step
+    else:
+        raise TypeError(f"Cannot index into {type(container).__name__} with {step!r}")
+
+
+def _sql_path_step(step: Union[int, str]) -> str:
+    """Format a path step for SQLite's JSON functions."""
+    if isinstance(step, int):
+        return f"[{step}]"
+    if '"' in step: raise ValueError(f"Dict keys in paths cannot contain double quotes: {step!r}")
+    return f'."{step}"'
@@ -0,0 +1,69 @@
+"""
+Read-only versions of the JSON container types.
+
+KVDatabase hands out the values in its cache directly, without copying them.
+If those could be changed in place, a caller could accidentally change the cache without writing to the database,
+so the cached values are frozen instead.
+They are still lists and dicts, so they compare equal to the originals and can be serialized as JSON.
+To change a value, either build a new one, use thaw() to get a mutable copy, or use the KVDatabase sub-document operations.
+"""
+from typing import Any
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError(f"{type(self).__name__} values from a KVDatabase are read-only; use thaw() to get a mutable copy")
+
+
+class FrozenList(list):
+    """A list that cannot be changed after it is created."""
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+class FrozenDict(dict):
+    """A dict that cannot be changed after it is created."""
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+# Values of these types are immutable already, so freeze() skips calling itself for them
+_SCALAR_TYPES = frozenset({str, int, float, bool, type(None)})
+
+
+def freeze(value: Any) -> Any:
+    """Return a deeply read-only version of a JSON-like value. Values that are already frozen are not copied."""
+    value_type = type(value)
+    if value_type in _SCALAR_TYPES or value_type is FrozenList or value_type is FrozenDict:
+        return value
+    if isinstance(value, dict):
+        return FrozenDict({key: item if type(item) in _SCALAR_TYPES else freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return FrozenList([item if type(item) in _SCALAR_TYPES else freeze(item) for item in value])
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """Return a deeply mutable copy of a JSON-like value, made of plain lists and dicts."""
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    return value
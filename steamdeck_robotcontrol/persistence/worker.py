@@ -0,0 +1,150 @@
+import logging
+import pathlib
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+from .. import metrics
+
+log = logging.getLogger(__name__)
+
+QUEUE_DEPTH = metrics.gauge("persistence.queue_depth")
+
+# Put into the queue to make the worker commit, close the connection and stop.
+_STOP = object()
+
+
+class PersistenceWorker:
+    """
+    Owns a sqlite3 connection on a thread of its own.
+
+    Operations are functions that take the connection; they are queued and applied strictly in order.
+    post() queues an operation without waiting for it, call() waits for its result.
+
+    Writes are group-committed: the worker commits once the queue runs dry,
+    or, if a commit_interval is given, once that many seconds have passed since the first uncommitted write.
+    While a batch is open (see begin_batch and end_batch), nothing is committed.
+
+    If a data_version_poll_interval is given, the worker checks PRAGMA data_version that often while it's idle,
+    and increments external_changes whenever another connection has committed a write.
+    Reading that counter is all that a KVDatabase needs to do to find out whether its cache went stale.
+    """
+
+    def __init__(self, path: pathlib.Path, commit_interval: float = 0.0, data_version_poll_interval: Optional[float] = None):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.data_version_poll_interval = data_version_poll_interval
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.external_changes = 0
+        # These are only touched by the worker thread.
+        self.batch_depth = 0
+        self.dirty_since: Optional[float] = None
+        self.data_version: Optional[int] = None
+        self.last_poll = 0.0
+
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True, name=f"persistence worker for {path}")
+        self.thread.start()
+        self.ready.wait()
+
+    def submit(self, fn: Callable[[sqlite3.Connection], Any]) -> Future:
+        """Queue an operation, returning a Future for its result."""
+        future = Future()
+        self.queue.put((fn, future))
+        QUEUE_DEPTH.set(self.queue.qsize())
+        return future
+
+    def call(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Queue an operation, and wait for its result. Every operation queued before it is applied first."""
+        return self.submit(fn).result()
+
+    def post(self, fn: Callable[[sqlite3.Connection], Any], on_failure: Optional[Callable[[BaseException], Any]] = None):
+        """
+        Queue an operation without waiting for it.
+        If it fails, the error is logged, and on_failure (if given) is called with it on the worker's thread.
+        """
+        def report_failure(future: Future):
+            exception = future.exception()
+            if exception is not None:
+                log.exception("A queued database operation failed", exc_info=exception)
+                if on_failure is not None:
+                    on_failure(exception)
+
+        self.submit(fn).add_done_callback(report_failure)
+
+    def flush(self):
+        """Wait until every operation queued so far is applied and committed."""
+        self.call(self._commit)
+
+    def close(self):
+        """Apply and commit everything queued so far, then stop the worker."""
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join()
+
+    def begin_batch(self, conn: sqlite3.Connection):
+        """Operation that holds off commits until the matching end_batch."""
+        self.batch_depth += 1
+
+    def end_batch(self, conn: sqlite3.Connection):
+        self.batch_depth -= 1
+
+    def _commit(self, conn: sqlite3.Connection):
+        if self.batch_depth == 0:
+            conn.commit()
+            self.dirty_since = None
+
+    def _poll_data_version(self, conn: sqlite3.Connection):
+        self.last_poll = time.perf_counter()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if self.data_version is not None and version != self.data_version:
+            self.external_changes += 1
+        self.data_version = version
+
+    def _next_timeout(self) -> Optional[float]:
+        """How long the worker can wait for an operation before it has to commit or poll."""
+        now = time.perf_counter()
+        timeout = None
+        if self.dirty_since is not None and self.batch_depth == 0:
+            timeout = max(0.0, self.dirty_since + self.commit_interval - now)
+        if self.data_version_poll_interval is not None:
+            poll_timeout = max(0.0, self.last_poll + self.data_version_poll_interval - now)
+            timeout = poll_timeout if timeout is None else min(timeout, poll_timeout)
+        return timeout
+
+    def run(self):
+        conn = sqlite3.connect(self.path)
+        if self.data_version_poll_interval is not None:
+            self._poll_data_version(conn)
+        self.ready.set()
+        try:
+            while True:
+                try:
+                    item = self.queue.get(timeout=self._next_timeout())
+                except queue.Empty:
+                    item = None
+                if item is _STOP:
+                    break
+
+                if item is not None:
+                    fn, future = item
+                    if future.set_running_or_notify_cancel():
+                        try:
+                            future.set_result(fn(conn))
+                        except BaseException as e:
+                            future.set_exception(e)
+
+                if conn.in_transaction and self.dirty_since is None:
+                    self.dirty_since = time.perf_counter()
+                if self.dirty_since is not None and self.batch_depth == 0 and self.queue.empty():
+                    if time.perf_counter() - self.dirty_since >= self.commit_interval:
+                        self._commit(conn)
+                if self.data_version_poll_interval is not None and self.queue.empty():
+                    if time.perf_counter() - self.last_poll >= self.data_version_poll_interval:
+                        self._poll_data_version(conn)
+        finally:
+            conn.commit()
+            conn.close()
@@ -0,0 +1,194 @@
+"""
+Profiling mode, for finding out where the time goes on the Deck itself, during a real drive.
+
+It is enabled with `run_app.py --profile[=MODES]`, or with the ROBOTCONTROL_PROFILE environment variable.
+MODES is a comma-separated list of:
+
+    cprofile    deterministic profile of the main loop (the screens, rendering and event handling)
+    sample      periodic stack samples of every other thread (video and control receiving, persistence, warm-up)
+
+and defaults to both. Capturing starts at launch; holding the left shoulder button and pressing X (or pressing F4)
+stops it, and doing that again starts a new capture. Each capture is written into the `profiles` folder
+of the data directory when it stops, as a .prof file (for pstats or snakeviz) and a .folded file
+(one line per distinct stack with its sample count, as read by flamegraph.pl and speedscope).
+"""
+import collections
+import cProfile
+import logging
+import os
+import pathlib
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import pygame
+
+log = logging.getLogger(__name__)
+
+PROFILE_ENV = "ROBOTCONTROL_PROFILE"
+MODES = ("cprofile", "sample")
+
+# How often the sampler takes the stacks of the other threads, in seconds
+SAMPLE_INTERVAL = 0.005
+
+# Left shoulder button, then X: no screen uses either, so the first press of the chord doesn't do anything else
+CHORD_BUTTONS = (4, 2)
+TOGGLE_KEY = pygame.K_F4
+
+
+def parse_modes(value: Optional[str]) -> Tuple[str, ...]:
+    """Turn the value of --profile or of the environment variable into modes. "1" or "all" means all of them, "0" or an empty value none."""
+    if value is None or value.strip().lower() in ("", "0", "no", "false", "off"):
+        return ()
+    if value.strip().lower() in ("1", "all", "yes", "true"):
+        return MODES
+    modes = tuple(mode.strip().lower() for mode in value.split(",") if mode.strip())
+    for mode in modes:
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r}, expected some of {', '.join(MODES)}")
+    return modes
+
+
+class StackSampler:
+    """
+    Takes the stacks of all threads except the calling one on a thread of its own, every interval,
+    and counts how often each distinct stack was seen.
+    Its cost is one walk over each thread's frames per sample, whatever those threads are doing.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL, ignored_thread: Optional[int] = None):
+        self.interval = interval
+        self.ignored_thread = threading.get_ident() if ignored_thread is None else ignored_thread
+        self.stacks: Dict[Tuple[str, ...], int] = collections.Counter()
+        self.samples = 0
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True, name="stack sampler")
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own_thread = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident in (own_thread, self.ignored_thread):
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread {ident}"))
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+        self.samples += 1
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            self.sample()
+
+    def write_folded(self, path: pathlib.Path):
+        with path.open("w") as f:
+            for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+                f.write(";".join(frame.replace(";", ",") for frame in stack) + f" {count}\n")
+
+
+class SessionProfiler:
+    """
+    Runs the profilers of the given modes, in captures that are started and stopped during the session.
+    start() and stop() must be called from the main loop's thread, since that's the thread cProfile profiles.
+    """
+
+    def __init__(self, modes: Tuple[str, ...], directory: pathlib.Path, sample_interval: float = SAMPLE_INTERVAL):
+        self.modes = modes
+        self.directory = directory
+        self.sample_interval = sample_interval
+        self.session = time.strftime("%Y%m%d-%H%M%S")
+        self.captures = 0
+        self.profile: Optional[cProfile.Profile] = None
+        self.sampler: Optional[StackSampler] = None
+        self.started_at = 0.0
+        self.held_buttons = set()
+        # The buttons whose presses were kept from the screen, so that their releases are too
+        self.swallowed_buttons = set()
+
+    @property
+    def capturing(self) -> bool:
+        return self.profile is not None or self.sampler is not None
+
+    def start(self):
+        if self.capturing:
+            return
+        self.captures += 1
+        self.started_at = time.perf_counter()
+        if "sample" in self.modes:
+            self.sampler = StackSampler(self.sample_interval)
+            self.sampler.start()
+        if "cprofile" in self.modes:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        log.info("Profiling capture %d started (%s)", self.captures, ", ".join(self.modes))
+
+    def stop(self) -> List[pathlib.Path]:
+        """Stop capturing, and write the capture's files. Returns their paths."""
+        if not self.capturing:
+            return []
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stem = f"session-{self.session}-capture{self.captures}"
+        paths = []
+        if self.profile is not None:
+            self.profile.disable()
+            paths.append(self.directory / f"{stem}.prof")
+            self.profile.dump_stats(paths[-1])
+            self.profile = None
+        if self.sampler is not None:
+            self.sampler.stop()
+            paths.append(self.directory / f"{stem}.folded")
+            self.sampler.write_folded(paths[-1])
+            self.sampler = None
+        log.info("Profiling capture %d stopped after %.1f s, written to: %s", self.captures, time.perf_counter() - self.started_at, " ".join(map(str, paths)))
+        return paths
+
+    def toggle(self):
+        if self.capturing:
+            self.stop()
+        else:
+            self.start()
+
+    def handle_event(self, event: pygame.event.Event) -> bool:
+        """
+        Returns True if the event shouldn't go to the screen: the key that toggles capturing,
+        or a press of a chord button while another is held (the one that completes the chord toggles capturing), and its release.
+        """
+        if event.type == pygame.JOYBUTTONDOWN and event.button in CHORD_BUTTONS:
+            partial_chord = bool(self.held_buttons)
+            self.held_buttons.add(event.button)
+            if self.held_buttons.issuperset(CHORD_BUTTONS):
+                self.toggle()
+            elif not partial_chord:
+                return False
+            self.swallowed_buttons.add(event.button)
+            return True
+        elif event.type == pygame.JOYBUTTONUP:
+            self.held_buttons.discard(event.button)
+            if event.button in self.swallowed_buttons:
+                self.swallowed_buttons.discard(event.button)
+                return True
+        elif event.type == pygame.KEYDOWN and event.key == TOGGLE_KEY:
+            self.toggle()
+            return True
+        return False
+
+
+def from_environment(value: Optional[str], directory: pathlib.Path) -> Optional[SessionProfiler]:
+    """The profiler for the --profile value given (or, if None, for the environment variable), or None if profiling is off."""
+    if value is None:
+        value = os.environ.get(PROFILE_ENV)
+    modes = parse_modes(value)
+    if not modes:
+        return None
+    return SessionProfiler(modes, directory)
@@ -0,0 +1,80 @@
+"""
+Packing and unpacking of the messages described in PROTOCOL.md.
+
+Both the app and the robot-side server use these, so that the byte layout is only written down once.
+"""
+import struct
+from typing import Optional, Sequence, Tuple
+
+# Websocket paths for the two channels; connecting to any other path gets a single combined channel.
+CONTROL_PATH = "/control"
+VIDEO_PATH = "/video"
+
+VIDEO_FRAME = b"F"
+WHEEL_SETPOINTS = b"S"
+WHEEL_PAIR_OFFSETS = b"T"
+EMERGENCY_STOP = b"!"
+UDP_VIDEO_SUBSCRIBE = b"U"
+EMERGENCY_STOP_ACKNOWLEDGED = b"A"
+
+VIDEO_FRAME_HEADER = struct.Struct(">dI")
+VIDEO_FRAME_HEADER_SIZE = 1 + VIDEO_FRAME_HEADER.size
+
+# The four values of the S and T messages
+WHEEL_VALUES = struct.Struct(">hhhh")
+
+# Optionally appended to S, T and ! messages: sequence number, and when the client sent the message
+TRACE_TRAILER = struct.Struct(">Id")
+
+
+def pack_video_frame(when_captured: float, jpeg_data: bytes) -> bytes:
+    """Build a video frame message out of the capture timestamp and the JPEG-encoded picture."""
+    msg = bytearray(VIDEO_FRAME_HEADER_SIZE)
+    msg[0:1] = VIDEO_FRAME
+    VIDEO_FRAME_HEADER.pack_into(msg, 1, when_captured, len(jpeg_data))
+    msg.extend(jpeg_data)
+    return bytes(msg)
+
+
+def unpack_video_frame(msg: bytes) -> Tuple[float, memoryview]:
+    """
+    Split a video frame message into the capture timestamp and the JPEG data.
+    The JPEG data is a view into the message, so it is not copied.
+    """
+    when_captured, byte_size = VIDEO_FRAME_HEADER.unpack_from(msg, 1)
+    return when_captured, memoryview(msg)[VIDEO_FRAME_HEADER_SIZE:VIDEO_FRAME_HEADER_SIZE + byte_size]
+
+
+def pack_udp_video_subscribe(port: int) -> bytes:
+    """Build a message asking the server to send the video to this UDP port on the client's address."""
+    return UDP_VIDEO_SUBSCRIBE + struct.pack(">H", port)
+
+
+def unpack_udp_video_subscribe(msg: bytes) -> int:
+    """Return the UDP port that the client asked for the video to be sent to."""
+    return struct.unpack_from(">H", msg, 1)[0]
+
+
+def pack_wheel_values(kind: bytes, values: Sequence[int], trace: Optional[Tuple[int, float]] = None) -> bytes:
+    """Build a wheel setpoints (S) or wheel pair offsets (T) message, with a trace trailer if one is given."""
+    msg = kind + WHEEL_VALUES.pack(*values)
+    if trace is not None:
+        msg += TRACE_TRAILER.pack(*trace)
+    return msg
+
+
+def unpack_wheel_values(msg: bytes) -> Tuple[Tuple[int, int, int, int], Optional[Tuple[int, float]]]:
+    """Return the four values of an S or T message, and its trace trailer, or None if it has none."""
+    return WHEEL_VALUES.unpack_from(msg, 1), unpack_trace(msg, 1 + WHEEL_VALUES.size)
+
+
+def pack_emergency_stop(trace: Optional[Tuple[int, float]] = None) -> bytes:
+    """Build an emergency stop message, with a trace trailer if one is given."""
+    return EMERGENCY_STOP if trace is None else EMERGENCY_STOP + TRACE_TRAILER.pack(*trace)
+
+
+def unpack_trace(msg: bytes, offset: int) -> Optional[Tuple[int, float]]:
+    """Return the sequence number and client timestamp of the trace trailer at the offset, or None if the message ends there."""
+    if len(msg) < offset + TRACE_TRAILER.size:
+        return None
+    return TRACE_TRAILER.unpack_from(msg, offset)
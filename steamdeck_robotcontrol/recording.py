@@ -0,0 +1,203 @@
+"""
+Recording of every message that goes over the robot connection, for replaying it later without the robot
+(see server/replay.py).
+
+A recording is two files: the messages, and an index.
+
+The messages file starts with MAGIC, and is followed by one record per message: a RECORD_HEADER, then the message.
+The header holds when the message was sent or received (time.time(), taken when the app sent or received it),
+which channel it went over (b"V" for video, b"C" for control), which way (b"R" received by the app, b"S" sent by it),
+whether it was a text message, and the message's length.
+
+The index has an INDEX_ENTRY (the time, and the offset of the record in the messages file) for every record,
+so that any record, or the first record after a given time, can be found without reading the ones before it.
+If the index is missing or shorter than the messages (for example after a crash), it is rebuilt by scanning the messages.
+
+Both files are only ever appended to, by a background thread, so that recording doesn't hold up the threads that receive.
+Recording is turned on by setting ROBOTCONTROL_RECORD; recordings go into the `recordings` folder of the data directory.
+"""
+import bisect
+import os
+import pathlib
+import queue
+import struct
+import threading
+import time
+from typing import Iterator, List, NamedTuple, Optional, Union
+
+RECORD_ENV = "ROBOTCONTROL_RECORD"
+MAGIC = b"RCREC1\n"
+RECORD_HEADER = struct.Struct(">dccBI")
+INDEX_ENTRY = struct.Struct(">dQ")
+
+VIDEO = b"V"
+CONTROL = b"C"
+RECEIVED = b"R"
+SENT = b"S"
+
+_TEXT = 1
+_STOP = object()
+
+
+class Record(NamedTuple):
+    time: float
+    channel: bytes
+    direction: bytes
+    message: Union[bytes, str]
+
+
+def index_path_for(path: pathlib.Path) -> pathlib.Path:
+    return path.with_suffix(".rcidx")
+
+
+class Recorder:
+    """
+    Appends messages to a recording from a background thread.
+    It's shared by the sockets of one connection; it is closed once all of them have released it.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.users = 0
+        self.lock = threading.Lock()
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, daemon=True, name="connection recorder")
+        self.thread.start()
+
+    def record(self, channel: bytes, direction: bytes, message: Union[bytes, str]):
+        self.queue.put((time.time(), channel, direction, message))
+
+    def run(self):
+        with self.path.open("ab") as messages, index_path_for(self.path).open("ab") as index:
+            if messages.tell() == 0:
+                messages.write(MAGIC)
+            while True:
+                item = self.queue.get()
+                if item is _STOP:
+                    return
+                when, channel, direction, message = item
+                flags = 0
+                if isinstance(message, str):
+                    message = message.encode()
+                    flags |= _TEXT
+                index.write(INDEX_ENTRY.pack(when, messages.tell()))
+                messages.write(RECORD_HEADER.pack(when, channel, direction, flags, len(message)))
+                messages.write(message)
+                if self.queue.empty():
+                    messages.flush()
+                    index.flush()
+
+    def acquire(self):
+        with self.lock:
+            self.users += 1
+
+    def release(self):
+        with self.lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+        self.close()
+
+    def close(self):
+        """Write out whatever is still queued, and stop."""
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join()
+
+
+class RecordingSocket:
+    """Wraps a websocket (or anything else with send and recv), recording every message sent and received on it."""
+
+    def __init__(self, socket, recorder: Recorder, channel: bytes):
+        self.socket = socket
+        self.recorder = recorder
+        self.channel = channel
+        self.released = False
+        recorder.acquire()
+
+    def recv(self, *args, **kwargs):
+        message = self.socket.recv(*args, **kwargs)
+        self.recorder.record(self.channel, RECEIVED, message)
+        return message
+
+    def send(self, message):
+        self.socket.send(message)
+        self.recorder.record(self.channel, SENT, bytes(message) if isinstance(message, (bytearray, memoryview)) else message)
+
+    def close(self):
+        self.socket.close()
+        if not self.released:
+            self.released = True
+            self.recorder.release()
+
+    def __getattr__(self, name):
+        return getattr(self.socket, name)
+
+
+def from_environment(directory: pathlib.Path) -> Optional[Recorder]:
+    """A recorder for a new recording in the directory, if recording is enabled, otherwise None."""
+    if os.environ.get(RECORD_ENV, "0") in ("", "0"):
+        return None
+    return Recorder(directory / f"session-{time.strftime('%Y%m%d-%H%M%S')}.rcrec")
+
+
+class RecordingReader:
+    """Reads a recording, using (and if needed, rebuilding) its index."""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.file = path.open("rb")
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a recording")
+        self.times: List[float] = []
+        self.offsets: List[int] = []
+        self._load_index()
+
+    def _load_index(self):
+        index_path = index_path_for(self.path)
+        data = index_path.read_bytes() if index_path.exists() else b""
+        # A partly written entry at the end is ignored
+        for when, offset in INDEX_ENTRY.iter_unpack(data[:len(data) - len(data) % INDEX_ENTRY.size]):
+            self.times.append(when)
+            self.offsets.append(offset)
+        size = self.path.stat().st_size
+        # The index entry is written before its record, so the last records may not have made it to the file
+        while self.offsets and self._record_end(self.offsets[-1], size) is None:
+            self.times.pop()
+            self.offsets.pop()
+        # Pick up any records that the index doesn't cover
+        offset = self._record_end(self.offsets[-1], size) if self.offsets else len(MAGIC)
+        while (end := self._record_end(offset, size)) is not None:
+            self.times.append(self._header_at(offset)[0])
+            self.offsets.append(offset)
+            offset = end
+
+    def _header_at(self, offset: int):
+        self.file.seek(offset)
+        return RECORD_HEADER.unpack(self.file.read(RECORD_HEADER.size))
+
+    def _record_end(self, offset: int, size: int) -> Optional[int]:
+        """Where the record at the offset ends, or None if the file ends before it does."""
+        if offset + RECORD_HEADER.size > size:
+            return None
+        end = offset + RECORD_HEADER.size + self._header_at(offset)[4]
+        return end if end <= size else None
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> Record:
+        when, channel, direction, flags, length = self._header_at(self.offsets[i])
+        message = self.file.read(length)
+        return Record(when, channel, direction, message.decode() if flags & _TEXT else message)
+
+    def __iter__(self) -> Iterator[Record]:
+        return (self[i] for i in range(len(self)))
+
+    def index_at(self, when: float) -> int:
+        """The index of the first record at or after the given time."""
+        return bisect.bisect_left(self.times, when)
+
+    def close(self):
+        self.file.close()
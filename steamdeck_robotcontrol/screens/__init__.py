@@ -1,6 +1,35 @@
-from .sample import *
-from .text_input import *
-from .control import *
-from .menu import *
-from .generator_screen import *
-from .main_menu import *
\ No newline at end of file
+"""
+The screens of the application.
+
+Screens are looked up here by name, but the module that defines each one is only imported when it's first used:
+some of them need heavy modules (RobotControlScreen needs OpenCV, numpy and websockets),
+which shouldn't delay showing the main menu.
+"""
+import importlib
+
+# Name -> the module in this package that defines it
+SCREENS = {
+    "SampleScreen": ".sample",
+    "EventLogScreen": ".sample",
+    "TextInputScreen": ".text_input",
+    "VerticalMenuScreen": ".menu",
+    "CoroutineScreen": ".coroutine_screen",
+    "RobotControlScreen": ".control",
+    "robot_control_wrapper": ".control",
+    "main_menu": ".main_menu",
+    "SessionHistoryScreen": ".history",
+}
+
+__all__ = list(SCREENS)
+
+
+def __getattr__(name: str):
+    if name not in SCREENS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(SCREENS[name], __name__), name)
+    globals()[name] = value  # Later lookups don't go through here
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(SCREENS))
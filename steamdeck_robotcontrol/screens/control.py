@@ -1,11 +1,12 @@
+import logging
 import math
-import struct
 import time
 from typing import Any
 import cv2
 import numpy as np
 import pygame
 import threading
+from concurrent.futures import Future
 import websockets.sync.client
 import websockets.exceptions
 
@@ -14,149 +15,160 @@ from steamdeck_robotcontrol.screen import (
     ReturnToCaller,
     ScreenRunResult,
 )
-from steamdeck_robotcontrol.screens.generator_screen import (
-    IGNORE_OPPORTUNITY,
-    RENDERING_OPPORTUNITY,
-    SUPPORTS_RENDERING,
-    WANT_TO_RENDER,
+from steamdeck_robotcontrol.screens.coroutine_screen import (
+    call,
+    events,
+    next_frame,
+    run_in_thread,
 )
-from .. import screen
-
-
-def robot_control_wrapper(server_addr):
-    """Generator-style wrapper responsible for (re)opening the connection."""
+from steamdeck_robotcontrol.udp_video import UDPVideoReceiver
+from .. import fonts, instant_replay, metrics, persistence, protocol, recording, screen, session_archive, tracing
+
+VIDEO_DECODE_TIME = metrics.histogram("video.decode_seconds")
+VIDEO_CONVERT_TIME = metrics.histogram("video.convert_seconds")
+VIDEO_LATENCY = metrics.histogram("video.latency_seconds")
+VIDEO_FRAMES_RECEIVED = metrics.counter("video.frames_received")
+VIDEO_BYTES_RECEIVED = metrics.counter("bytes.received.video_frame")
+VIDEO_FRAMES_LOST = metrics.gauge("video.udp_frames_lost")
+WHEEL_OFFSETS_SENT = metrics.counter("messages.sent.wheel_pair_offsets")
+WHEEL_OFFSETS_BYTES_SENT = metrics.counter("bytes.sent.wheel_pair_offsets")
+EMERGENCY_STOPS_SENT = metrics.counter("messages.sent.emergency_stop")
+EMERGENCY_STOP_RTT = metrics.histogram("emergency_stop.rtt_seconds")
+
+log = logging.getLogger(__name__)
+
+
+def open_connection(server_addr, video_transport="websocket"):
+    """Open the control connection, and the video one over the chosen transport; returns (video, control)."""
+    # Commands go over their own connection, so they never wait behind a video frame.
+    control_socket = websockets.sync.client.connect(
+        f"ws://{server_addr}{protocol.CONTROL_PATH}"
+    )
+    try:
+        if video_transport == "udp":
+            # A lost datagram costs us one frame, instead of delaying every frame behind it
+            video_socket = UDPVideoReceiver()
+            control_socket.send(
+                protocol.pack_udp_video_subscribe(video_socket.port)
+            )
+        else:
+            # JPEG data does not compress, so don't spend time trying
+            video_socket = websockets.sync.client.connect(
+                f"ws://{server_addr}{protocol.VIDEO_PATH}",
+                compression=None,
+            )
+    except Exception:
+        control_socket.close()
+        raise
+    # Set if ROBOTCONTROL_RECORD is: every message in both directions is recorded, for replaying later
+    recorder = recording.from_environment(persistence.get_data_directory() / "recordings")
+    if recorder is not None:
+        video_socket = recording.RecordingSocket(video_socket, recorder, recording.VIDEO)
+        control_socket = recording.RecordingSocket(control_socket, recorder, recording.CONTROL)
+    return video_socket, control_socket
+
+
+def close_abandoned_connection(connecting: Future):
+    """Done-callback for a connection attempt that was given up on: close the connection if it got made after all."""
+    if not connecting.cancelled() and connecting.exception() is None:
+        for socket in connecting.result():
+            socket.close()
+
+
+def log_failed_save(saving: Future):
+    """Done-callback for saving a session into the archive, which nothing waits for."""
+    if saving.exception() is not None:
+        log.error("Saving the session into the archive failed", exc_info=saving.exception())
+
+
+async def robot_control_wrapper(server_addr, video_transport="websocket"):
+    """
+    Coroutine responsible for (re)opening the connection, and running a RobotControlScreen on it.
+    The video_transport is either "websocket" or "udp" (see PROTOCOL.md).
+    """
     disconnection_reason = None
-
-    # The first thing I'll receive is an indication of a rendering opportunity, and some events.
-    yield SUPPORTS_RENDERING
-    # Then, I'll send an ignored value, which would have been my first indication of what to do.
-    opportunity, events = yield None
-
     connected_once = False
-
-    while True:
-        # Now they're waiting for me to say what I want to do.
-        # I want to render now, and they'll give me the display.
-        display = yield WANT_TO_RENDER
-
-        # I will render the "Connecting" text to the screen.
-        display.fill("black")
-        font = pygame.font.SysFont(pygame.font.get_default_font(), 48)
-        text = font.render(
-            f"{'Rec' if connected_once else 'C'}onnecting to {server_addr} (press B to give up)...",
-            True,
-            "white",
-        )
-        display.blit(text, (0, 0))  # TODO: position
-        disconnect_text = pygame.Surface((1, 1))
-        if disconnection_reason:
-            disconnect_text = font.render(
-                f"Latest error: {disconnection_reason}", True, "white"
+    font = fonts.get_font(48)
+    # Made on the first connection, and saved into the archive however the session ends, on a thread of its own
+    session = None
+    try:
+        while True:
+            text = font.render(
+                f"{'Rec' if connected_once else 'C'}onnecting to {server_addr} (press B to give up)...",
+                True,
+                "white",
             )
-        display.blit(disconnect_text, (0, 50))
-        last_rendered_at = time.perf_counter()
+            disconnect_text = pygame.Surface((1, 1))
+            if disconnection_reason:
+                disconnect_text = font.render(
+                    f"Latest error: {disconnection_reason}", True, "white"
+                )
+
+            connecting = run_in_thread(open_connection, server_addr, video_transport)
+            # While connecting, the text moves once a second, to show that we're not stuck
+            offset = 0
+            next_render_at = time.perf_counter()
+            while not connecting.done():
+                if time.perf_counter() >= next_render_at:
+                    display = await next_frame()
+                    display.fill("black")
+                    display.blit(text, (offset, 0))  # TODO: position
+                    display.blit(disconnect_text, (offset, 50))
+                    offset += 10
+                    next_render_at = time.perf_counter() + 1
+                for event in await events(timeout=next_render_at - time.perf_counter(), until=connecting):
+                    if event.type == pygame.JOYBUTTONDOWN and event.button == 1:
+                        # The B button was pressed, which means we're aborting the connection.
+                        connecting.add_done_callback(close_abandoned_connection)
+                        return None
 
-        # Now I'm done rendering, and I'm going to start connecting.
-        connection_result = [None, None]
-
-        def connect():
             try:
-                socket = websockets.sync.client.connect(f"ws://{server_addr}")
-                connection_result[0] = socket  # Instead of return, must use this
+                sockets = connecting.result()
             except Exception as e:
-                connection_result[1] = e
-
-        connection_thread = threading.Thread(target=connect, daemon=True)
-        connection_thread.start()
-
-        # I will tell the caller that I'm done rendering, and would now like to continue running
-        opportunity, events = yield ContinueExecution.value
-
-        # Now comes an event loop
-        i = 0
-        while connection_thread.is_alive():
-            for event in events:
-                if event.type == pygame.JOYBUTTONDOWN and event.button == 1:
-                    # The B button was pressed, which means we're aborting the connection.
-                    return None
-
-            # I'll yield whether I want to continue, or render.
-            # I'll render if it's more than 1 second since I did last time.
-            if time.perf_counter() - last_rendered_at > 1:
-                display = yield WANT_TO_RENDER
+                # Show the error, and give the option to retry
+                display = await next_frame()
                 display.fill("black")
-                display.blit(text, (i, 0))  # to see if it's working, we move the text
-                i += 10
-                display.blit(disconnect_text, (i, 100))
-                last_rendered_at = time.perf_counter()
-                opportunity, events = yield ContinueExecution.value
+                errors = [
+                    font.render(f"Error while connecting to {server_addr}:", True, "white"),
+                    font.render(repr(e), True, "white"),
+                    font.render("Press A to retry or B to give up", True, "white"),
+                ]
+                rect = pygame.Rect(0, 0, 0, 0)
+                for error in errors:
+                    error_rect = error.get_rect()
+                    error_rect.top = rect.bottom
+                    error_rect.left = rect.left
+                    display.blit(error, error_rect)
+                    rect = error_rect
+
+                what_to_do = None
+                while not what_to_do:
+                    for event in await events():
+                        if event.type == pygame.JOYBUTTONDOWN:
+                            if event.button == 0:
+                                what_to_do = "retry"
+                            elif event.button == 1:
+                                what_to_do = "abort"
+                if what_to_do == "abort":
+                    return None
+                # Otherwise, retry from the start of the loop
             else:
-                # Otherwise, I don't care about this rendering opportunity.
-                opportunity, events = yield IGNORE_OPPORTUNITY
-
-        # If the second value is there, then it means that there was an error connecting.
-        # Show the error, and give the option to retry
-        if connection_result[1]:
-            # This is something to render
-            display = yield WANT_TO_RENDER
-            display.fill("black")
-            errors = []
-            errors.append(
-                font.render(f"Error while connecting to {server_addr}:", True, "white")
-            )
-            errors.append(font.render(repr(connection_result[1]), True, "white"))
-            errors.append(
-                font.render("Press A to retry or B to give up", True, "white")
-            )
-            rect = pygame.Rect(0, 0, 0, 0)
-            for error in errors:
-                error_rect = error.get_rect()
-                error_rect.top = rect.bottom
-                error_rect.left = rect.left
-                display.blit(error, error_rect)
-                rect = error_rect
-
-            # Now sit in a loop, accepting events until either button is pressed.
-            opportunity, events = yield ContinueExecution.value
-            last_rendered_at = time.perf_counter()
-            what_to_do = None
-            print(what_to_do)
-            while not what_to_do:
-                for e in events:
-                    if e.type == pygame.JOYBUTTONDOWN:
-                        if e.button == 0:
-                            what_to_do = "retry"
-                        elif e.button == 1:
-                            what_to_do = "abort"
-
-                # Occasionally we need to take the render opportunity, but not render anything new.
-                # This is so that the display keeps up to date.
-                if time.perf_counter() - last_rendered_at > 1:
-                    display = yield WANT_TO_RENDER
-                    opportunity, events = yield ContinueExecution.value
+                # With the connection established, we can make a RobotControlScreen out of it,
+                # and wait for it to tell us how the control session died.
+                if session is None:
+                    session = session_archive.SessionRecorder(server_addr)
                 else:
-                    opportunity, events = yield IGNORE_OPPORTUNITY
-
-            # We need to acquire some new events now, after the event with the button press.
-            opportunity, events = yield IGNORE_OPPORTUNITY
-            if what_to_do == "retry":
-                what_to_do = None  # idk how exactly, but this does not get reset at the start of the loop
-                # Continue to the start of the loop implicitly
-            else:
-                return None
-
-        else:
-            # With the connection established, we can make a RobotControlScreen out of it
-            # Yield it, and wait for a response
-            connected_once = True
-            reason = yield RobotControlScreen(connection_result[0])
-            # The response will tell us how the control session died.
-            # If it was a manual exit, we should return, otherwise retry
-            if reason == "user":
-                return None
-            else:
-                disconnection_reason = reason
-                continue
+                    session.reconnects += 1
+                connected_once = True
+                reason = await call(RobotControlScreen(*sockets, session=session))
+                # If it was a manual exit, we should return, otherwise retry
+                if reason == "user":
+                    return None
+                else:
+                    disconnection_reason = reason
+    finally:
+        if session is not None:
+            run_in_thread(session.save).add_done_callback(log_failed_save)
 
 
 SEND_INTERVAL = 0.1
@@ -165,9 +177,24 @@ SEND_INTERVAL = 0.1
 class RobotControlScreen(screen.Screen):
     """Maintains a connection to the robot and sends it joystick positions."""
 
-    def __init__(self, websocket: websockets.sync.client.ClientConnection):
+    def __init__(
+        self,
+        websocket: websockets.sync.client.ClientConnection,
+        control_websocket: websockets.sync.client.ClientConnection | None = None,
+        frame_timings: list | None = None,
+        session: session_archive.SessionRecorder | None = None,
+    ):
+        """
+        Video frames are received on the websocket.
+        If a control_websocket is given, commands are sent and telemetry is received on it instead,
+        so that they are not delayed by the video frames; otherwise everything shares the websocket.
+        If a frame_timings list is given, every frame's (captured, received, decode seconds, convert seconds, ready) times
+        are appended to it, as benchmarks.video does; the histograms only estimate percentiles to their bucket bounds.
+        If a session is given, what happens is also recorded into it, for the session archive.
+        """
         super().__init__()
         self.socket = websocket
+        self.control_socket = control_websocket or websocket
         self.connection = None
 
         self.left_joystick_position = [0, 0]
@@ -183,40 +210,76 @@ class RobotControlScreen(screen.Screen):
         self.closing_reason = None
 
         self.latest_video_frame = pygame.Surface((800, 600))
-        self.font = pygame.font.SysFont(pygame.font.get_default_font(), 24)
+        self.font = fonts.get_font(24)
         self.latest_video_frame.fill((255, 0, 255))
         self.latest_video_frame_latency = 0.0
         self.latest_video_frame_presented = False
         self.latest_video_frame_latencies = [0]
-        self.video_recv_thread = threading.Thread(
-            target=self.video_recv_thread_worker, daemon=True
-        )
-        self.video_recv_thread.start()
+        self.frame_timings = frame_timings
+        self.session = session
 
         self.video_is_fullscreen = False
         self.last_send_time = time.time()
 
+        # Set if ROBOTCONTROL_TRACE is, see tracing.py
+        self.span_log = tracing.from_environment("client", persistence.get_data_directory() / "traces")
+        # When the first joystick event since the last command was sent arrived, if there was one
+        self.first_input_at = None
+        # When the last emergency stop was sent, until the server acknowledges it
+        self.emergency_stop_sent_at = None
+
+        # The last frames as received, which the Y button saves as a clip
+        self.instant_replay = instant_replay.FrameRing()
+        self.instant_replay_saving = None
+
+        # The receiving threads start last, since they use everything above
+        self.video_recv_thread = threading.Thread(
+            target=self.video_recv_thread_worker, daemon=True, name="video receive"
+        )
+        self.video_recv_thread.start()
+        self.control_recv_thread = None
+        if self.control_socket is not self.socket:
+            self.control_recv_thread = threading.Thread(
+                target=self.control_recv_thread_worker, daemon=True, name="control receive"
+            )
+            self.control_recv_thread.start()
+
     def video_recv_thread_worker(self):
         try:
             while not self.closing:
                 msg = []
                 try:
                     msg = self.socket.recv()
-                except websockets.exceptions.ConnectionClosed as e:
+                except (websockets.exceptions.ConnectionClosed, OSError) as e:
                     self.closing = True
-                    self.closing_reason = str(e)
+                    self.closing_reason = self.closing_reason or str(e)
                     break
-                if msg and msg[0] == ord("F"):  # video frame
-                    when_captured, byte_size = struct.unpack_from(
-                        ">dI", buffer=msg, offset=1
-                    )
-                    npimg = np.frombuffer(msg[13:], dtype=np.uint8)
+                if msg and msg[0:1] == protocol.VIDEO_FRAME:
+                    VIDEO_FRAMES_RECEIVED.inc()
+                    VIDEO_BYTES_RECEIVED.inc(len(msg))
+                    received_at = time.time()
+                    when_captured, jpeg_data = protocol.unpack_video_frame(msg)
+                    self.instant_replay.add(when_captured, jpeg_data)
+                    decode_started = time.perf_counter()
+                    npimg = np.frombuffer(jpeg_data, dtype=np.uint8)
                     cv2img = cv2.imdecode(npimg, 1)
+                    decoded = time.perf_counter()
                     pygame_img = pygame.image.frombuffer(
-                        cv2img.tostring(), cv2img.shape[1::-1], "BGR"
+                        cv2img.tobytes(), cv2img.shape[1::-1], "BGR"
                     )
+                    converted = time.perf_counter()
+                    VIDEO_DECODE_TIME.observe(decoded - decode_started)
+                    VIDEO_CONVERT_TIME.observe(converted - decoded)
                     self.latest_video_frame = pygame_img
                     self.latest_video_frame_latency = time.time() - when_captured
+                    if self.frame_timings is not None:
+                        self.frame_timings.append((
+                            when_captured, received_at, decoded - decode_started,
+                            converted - decoded, when_captured + self.latest_video_frame_latency,
+                        ))
+                    VIDEO_LATENCY.observe(self.latest_video_frame_latency)
+                    if self.session is not None:
+                        self.session.frame_received(self.latest_video_frame_latency)
                     self.latest_video_frame_latencies.append(
                         self.latest_video_frame_latency
                     )
@@ -224,15 +287,47 @@ class RobotControlScreen(screen.Screen):
                         len(self.latest_video_frame_latencies) > 1280
                     ):  # Horizontal chart can fit 1280 pixels
                         self.latest_video_frame_latencies.pop(0)
-                    self.latest_video_frame_presented = True
+                    # A new frame, which the next run_frame presents
+                    self.latest_video_frame_presented = False
+                elif msg and msg[0:1] == protocol.EMERGENCY_STOP_ACKNOWLEDGED:
+                    # On a combined channel, the acknowledgements come along with the video
+                    self.emergency_stop_acknowledged()
+        except Exception as e:
+            # End the session, rather than leaving it running without video
+            log.exception("Video receiving failed")
+            self.closing = True
+            self.closing_reason = f"Video error: {e!r}"
+        finally:
+            # Finalize by closing the sockets
+            self.socket.close()
+            self.control_socket.close()
+
+    def control_recv_thread_worker(self):
+        try:
+            while not self.closing:
+                try:
+                    msg = self.control_socket.recv()
+                except websockets.exceptions.ConnectionClosed as e:
+                    self.closing = True
+                    self.closing_reason = self.closing_reason or str(e)
+                    break
+                if msg[0:1] == protocol.EMERGENCY_STOP_ACKNOWLEDGED:
+                    self.emergency_stop_acknowledged()
+                # Anything else, like video frames from a server that doesn't split the channels, is ignored here.
         finally:
-            # Finalize by closing the socket
+            # Closing the video socket makes the video thread stop waiting for frames
             self.socket.close()
+            self.control_socket.close()
 
     def run_frame(self, display: pygame.Surface) -> ScreenRunResult:
         super().run_frame(display)
         display.fill("black")
         if self.closing:
+            # Unblock the receiving threads, so they don't wait for a message that may never come
+            self.socket.close()
+            self.control_socket.close()
+            if self.span_log is not None:
+                self.span_log.close()
             return ReturnToCaller(self.closing_reason)
 
         disp = display.get_rect()
@@ -244,6 +339,7 @@ class RobotControlScreen(screen.Screen):
             img_rect = img.get_rect()
             img_rect.center = disp.center
             display.blit(img, img_rect)
+            self.video_frame_presented()
             return ContinueExecution.value
 
         left_joystick_circle = pygame.Rect(0, 0, 100, 100)
@@ -326,16 +422,24 @@ class RobotControlScreen(screen.Screen):
         frame_rect = self.latest_video_frame.get_rect()
         frame_rect.center = disp.center
         display.blit(self.latest_video_frame, frame_rect)
-        self.latest_video_frame_presented = True
+        self.video_frame_presented()
 
         # In a corner of the screen, draw the delay between now and the latest frame
-        delay_text = self.font.render(
-            f"Frame recv: {round(1000*self.latest_video_frame_latency, 2)} ms ago",
-            True,
-            "white",
+        delay_label = (
+            f"Frame recv: {round(1000*self.latest_video_frame_latency, 2)} ms ago"
         )
+        # Only the UDP receiver loses frames (it may be wrapped by a RecordingSocket, so this doesn't check its type)
+        frames_lost = getattr(self.socket, "frames_lost", None)
+        if frames_lost is not None:
+            delay_label += f", {frames_lost} frames lost"
+            VIDEO_FRAMES_LOST.set(frames_lost)
+        delay_text = self.font.render(delay_label, True, "white")
         delay_rect = delay_text.get_rect()
         display.blit(delay_text, delay_rect)
+        if self.instant_replay_saving is not None and (not self.instant_replay_saving.done() or time.perf_counter() < self.instant_replay_saving_started + 3):
+            replay_label = "Saved replay" if self.instant_replay_saving.done() else "Saving replay..."
+            replay_text = self.font.render(replay_label, True, "white")
+            display.blit(replay_text, replay_text.get_rect(topright=disp.topright))
 
         # On bottom of screen, draw a chart of the latencies
         chart_rect = pygame.Rect(0, 0, disp.width, 200)
@@ -395,7 +499,55 @@ class RobotControlScreen(screen.Screen):
             round(self.starboard_wheel_pair_desired_setpoint[1]),
         ]
 
+    def video_frame_presented(self):
+        if not self.latest_video_frame_presented and self.session is not None:
+            self.session.frame_drawn()
+        self.latest_video_frame_presented = True
+
+    def emergency_stop_acknowledged(self):
+        """Called by the receiving threads when the server acknowledges an emergency stop."""
+        sent_at = self.emergency_stop_sent_at
+        if sent_at is None:
+            return
+        self.emergency_stop_sent_at = None
+        rtt = time.perf_counter() - sent_at
+        EMERGENCY_STOP_RTT.observe(rtt)
+        if self.session is not None:
+            self.session.emergency_stop_acknowledged(rtt)
+        log.info("Emergency stop acknowledged after %.1f ms", rtt * 1000)
+
+    def send_command(self, msg: bytes):
+        try:
+            self.control_socket.send(msg)
+            if self.session is not None:
+                self.session.command_sent()
+        except (websockets.exceptions.ConnectionClosed, OSError) as e:
+            # The receiving threads usually notice first; either way, the session is over
+            self.closing = True
+            self.closing_reason = self.closing_reason or str(e)
+
+    def send_traced(self, kind: bytes, build, input_at=None, integrated_at=None):
+        """
+        Send the message that build(trace) returns; trace is None unless tracing is on,
+        in which case the message's span is recorded too.
+        """
+        if self.span_log is None:
+            msg = build(None)
+            self.send_command(msg)
+            return msg
+        send_start = time.time()
+        seq = self.span_log.next_sequence()
+        client_sent = time.time()
+        msg = build((seq, client_sent))
+        self.send_command(msg)
+        self.span_log.record({
+            "seq": seq, "kind": kind.decode(), "input": input_at, "integrated": integrated_at,
+            "send_start": send_start, "client_sent": client_sent, "sent": time.time(),
+        })
+        return msg
+
     def should_render_frame(self) -> bool:
+        integrated_at = time.time()
         # Run integration for the two axes
         deltaT = time.perf_counter() - self.last_integration_time
 
@@ -437,15 +589,21 @@ class RobotControlScreen(screen.Screen):
             != old_starboard_setpoints
         ) and curr_time - self.last_send_time > 0.1:
             self.last_send_time = curr_time
-            cmd = bytearray(b"T")
             # Port forward, port left
             pf, pl = self.port_wheel_pair_desired_setpoint_rounded
             # Starboard forward, starboard right
             sf, sr = self.starboard_wheel_pair_desired_setpoint_rounded
-            cmd.extend(struct.pack(">hhhh", pf, pl, sf, sr))
-            self.socket.send(cmd)
-            print(
-                "Sent",
+            cmd = self.send_traced(
+                protocol.WHEEL_PAIR_OFFSETS,
+                lambda trace: protocol.pack_wheel_values(protocol.WHEEL_PAIR_OFFSETS, (pf, pl, sf, sr), trace),
+                self.first_input_at,
+                integrated_at,
+            )
+            self.first_input_at = None
+            WHEEL_OFFSETS_SENT.inc()
+            WHEEL_OFFSETS_BYTES_SENT.inc(len(cmd))
+            log.debug(
+                "Sent %s %s",
                 self.port_wheel_pair_desired_setpoint_rounded,
                 self.starboard_wheel_pair_desired_setpoint_rounded,
             )
@@ -456,19 +614,30 @@ class RobotControlScreen(screen.Screen):
 
     def handle_event(self, event: pygame.event.Event) -> bool:
         if event.type == pygame.JOYBUTTONDOWN:
-            print(event.button)
+            log.debug("Button %d pressed", event.button)
             if event.button == 5:  # Right shoulder button
                 self.video_is_fullscreen = True
             elif event.button == 6:  # Left menu button / start button
                 self.closing = True
                 self.closing_reason = "user"
+            elif event.button == 3:  # Y button
+                # Save what just happened
+                path = instant_replay.clip_path(persistence.get_data_directory() / "replays")
+                self.instant_replay_saving = self.instant_replay.save(path)
+                self.instant_replay_saving_started = time.perf_counter()
+                return True
             elif event.button in [9, 10]:  # Left and right joystick press
                 # Send emergency stop
-                self.socket.send(b"!")
+                self.emergency_stop_sent_at = time.perf_counter()
+                self.send_traced(protocol.EMERGENCY_STOP, protocol.pack_emergency_stop, time.time())
+                EMERGENCY_STOPS_SENT.inc()
+                log.info("Emergency stop sent")
         elif event.type == pygame.JOYBUTTONUP:
             if event.button == 5:
                 self.video_is_fullscreen = False
         if event.type == pygame.JOYAXISMOTION:
+            if self.first_input_at is None and event.axis in (0, 1, 3, 4):
+                self.first_input_at = time.time()
             match event.axis:
                 case 0:
                     self.left_joystick_position[0] = event.value
@@ -0,0 +1,185 @@
+"""
+A screen runtime for writing screen flows as coroutines.
+
+A CoroutineScreen runs an `async def` function, which awaits the primitives defined here:
+
+    display = await next_frame()        # draw on the display; it is shown when the coroutine awaits again
+    for event in await events(): ...    # wait for input events
+    await sleep(0.5)
+    choice = await call(VerticalMenuScreen(items))   # show another screen, and get what it returned
+    sockets = await wait(run_in_thread(connect))     # wait for work done on another thread
+
+While the coroutine is waiting, the screen only checks whether what it waits for has happened,
+so a screen that is waiting costs next to nothing per frame, and doesn't render.
+Coroutines can await each other, so flows made of several screens can be written as plain functions.
+When the coroutine returns, the screen returns that value to its caller
+(or, if the value is a ScreenRunResult, such as ExitProgram.value, it does that instead).
+"""
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Coroutine, List, Optional
+import pygame
+
+from steamdeck_robotcontrol.screen import CallAnother, ContinueExecution, ReturnToCaller, ScreenRunResult
+from .. import screen
+
+
+class _Request:
+    """Something a coroutine waits for. Awaiting it passes it to the CoroutineScreen, which resumes the coroutine with the result."""
+
+    def __await__(self):
+        return (yield self)
+
+
+class _NextFrame(_Request):
+    pass
+
+
+class _Events(_Request):
+    def __init__(self, deadline: Optional[float], until: Optional[Future]):
+        self.deadline = deadline
+        self.until = until
+
+
+class _Sleep(_Request):
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+
+
+class _Call(_Request):
+    def __init__(self, screen: screen.Screen):
+        self.screen = screen
+
+
+class _Wait(_Request):
+    def __init__(self, future: Future):
+        self.future = future
+
+
+# Stands in for the request while a called screen is showing
+_IN_CALL = object()
+
+
+def next_frame():
+    """Wait for the next frame, returning the display to draw it on."""
+    return _NextFrame()
+
+
+def events(timeout: Optional[float] = None, until: Optional[Future] = None):
+    """
+    Wait for input events, returning the list of events that arrived.
+    If a timeout is given, or a future that finishes in the meantime, the list may be empty.
+    """
+    return _Events(None if timeout is None else time.perf_counter() + timeout, until)
+
+
+def sleep(seconds: float):
+    """Wait for this many seconds, without rendering."""
+    return _Sleep(time.perf_counter() + seconds)
+
+
+def call(other_screen: screen.Screen):
+    """Show another screen until it returns, and return what it returned."""
+    return _Call(other_screen)
+
+
+def wait(future: Future):
+    """Wait for the future to finish, returning its result or raising its exception."""
+    return _Wait(future)
+
+
+def run_in_thread(fn: Callable[..., Any], *args, **kwargs) -> Future:
+    """Call the function on a daemon thread, returning a Future for its result that can be waited on."""
+    future = Future()
+
+    def run():
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+class CoroutineScreen(screen.Screen):
+    """Runs a coroutine that awaits the primitives of this module. See the module docstring."""
+
+    def __init__(self, coroutine: Coroutine[Any, Any, Any]):
+        super().__init__()
+        self.coroutine = coroutine
+        self.queued_events: List[pygame.event.Event] = []
+        self.request: Any = None
+        self.result: Optional[ScreenRunResult] = None
+        self._resume(None)
+
+    def _resume(self, value: Any = None, exception: Optional[BaseException] = None):
+        try:
+            if exception is not None:
+                self.request = self.coroutine.throw(exception)
+            else:
+                self.request = self.coroutine.send(value)
+        except StopIteration as e:
+            self.request = None
+            self.result = e.value if isinstance(e.value, ScreenRunResult) else ReturnToCaller(e.value)
+            return
+        if not isinstance(self.request, _Request):
+            raise TypeError(f"Coroutine screens can only await the primitives from coroutine_screen, not {self.request!r}")
+
+    def _resume_finished_waits(self) -> bool:
+        """Resume the coroutine for as long as what it waits for has already happened. Returns whether a frame is needed."""
+        while self.result is None:
+            request = self.request
+            if isinstance(request, (_NextFrame, _Call)):
+                return True
+            elif isinstance(request, _Events):
+                timed_out = request.deadline is not None and time.perf_counter() >= request.deadline
+                if self.queued_events or timed_out or (request.until is not None and request.until.done()):
+                    events, self.queued_events = self.queued_events, []
+                    self._resume(events)
+                else:
+                    return False
+            elif isinstance(request, _Sleep):
+                if time.perf_counter() >= request.deadline:
+                    self._resume(None)
+                else:
+                    return False
+            elif isinstance(request, _Wait):
+                if not request.future.done():
+                    return False
+                exception = request.future.exception()
+                if exception is not None:
+                    self._resume(exception=exception)
+                else:
+                    self._resume(request.future.result())
+            else:
+                return False  # Waiting for a called screen to return
+        return True
+
+    def run_frame(self, display: pygame.Surface) -> ScreenRunResult:
+        super().run_frame(display)
+        self._resume_finished_waits()
+        if isinstance(self.request, _NextFrame):
+            self._resume(display)
+            # Whatever the coroutine waits for now, it gets after this frame is shown
+        if self.result is not None:
+            return self.result
+        if isinstance(self.request, _Call):
+            other_screen = self.request.screen
+            self.request = _IN_CALL
+            return CallAnother(other_screen)
+        return ContinueExecution.value
+
+    def should_render_frame(self) -> bool:
+        return self._resume_finished_waits()
+
+    def handle_event(self, event: pygame.event.Event) -> bool:
+        # The events are only handed over in should_render_frame, so that all events of a frame arrive together
+        self.queued_events.append(event)
+        return False
+
+    def receive_data(self, returning_screen, returned_data: Any):
+        if self.request is _IN_CALL:
+            self._resume(returned_data)
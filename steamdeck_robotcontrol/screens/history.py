@@ -0,0 +1,158 @@
+import datetime
+import logging
+import math
+from typing import Any, List, Optional
+import pygame
+
+from steamdeck_robotcontrol.screen import ContinueExecution, ReturnToCaller, ScreenRunResult
+from steamdeck_robotcontrol.screens.coroutine_screen import run_in_thread
+from .. import fonts, screen, session_archive
+
+log = logging.getLogger(__name__)
+
+# The summary values that are charted across sessions: (label, key in the summary, scale, unit)
+TRENDS = [
+    ("Video latency, median", "latency_p50", 1000, "ms"),
+    ("Video latency, 95th percentile", "latency_p95", 1000, "ms"),
+    ("Frames drawn per second", "fps", 1, "fps"),
+    ("Commands per second", "command_rate", 1, "/s"),
+    ("Emergency stop round trip", "emergency_stop_rtt", 1000, "ms"),
+    ("Reconnections", "reconnects", 1, ""),
+]
+# At most this many of the latest sessions are charted
+MAX_SESSIONS_SHOWN = 200
+
+
+def number_or_none(value) -> Optional[float]:
+    if value is None or math.isnan(value):
+        return None
+    return value
+
+
+def draw_chart(display: pygame.Surface, rect: pygame.Rect, values: List[Optional[float]], color, selected: Optional[int] = None):
+    """A line through the values, spread over the width of rect and scaled to its height; None leaves a gap."""
+    pygame.draw.rect(display, "grey30", rect, width=1)
+    present = [value for value in values if value is not None]
+    if not present:
+        return
+    low, high = min(present), max(present)
+    step = rect.width / max(len(values) - 1, 1)
+    if selected is not None:
+        x = rect.left + int(selected * step)
+        pygame.draw.line(display, "grey60", (x, rect.top), (x, rect.bottom - 1))
+    points = []
+    for i, value in enumerate(values + [None]):
+        if value is None:
+            if len(points) > 1:
+                pygame.draw.lines(display, color, False, points, 2)
+            elif points:
+                pygame.draw.circle(display, color, points[0], 2)
+            points = []
+            continue
+        fraction = (value - low) / ((high - low) or 1)
+        points.append((rect.left + int(i * step), rect.bottom - 2 - int((rect.height - 4) * fraction)))
+
+
+class SessionHistoryScreen(screen.Screen):
+    """
+    Shows how the sessions with one server went, from the session archive: a chart for each summary value across the sessions,
+    and the latency and frame rate during the session selected with the d-pad (the latest, at first). B or A returns.
+    The sessions are loaded on another thread, since reading the archive can take a while.
+    """
+
+    def __init__(self, server_name: str, server_address: str):
+        super().__init__()
+        self.server_name = server_name
+        self.loading = run_in_thread(session_archive.load, server_address)
+        self.load_error = None
+        self.sessions = []
+        self.selected = -1
+        self.font = fonts.get_font(24)
+        self.title_font = fonts.get_font(36)
+        self.am_returning_now = False
+        self.needs_render = True
+
+    def run_frame(self, display: pygame.Surface) -> ScreenRunResult:
+        super().run_frame(display)
+        if self.am_returning_now:
+            return ReturnToCaller(None)
+        self.needs_render = False
+        if self.loading is not None and self.loading.done():
+            self.finish_loading()
+
+        display.fill("black")
+        disp = display.get_rect()
+        title = self.title_font.render(f"Performance history of {self.server_name}", True, "white")
+        display.blit(title, (10, 10))
+        if self.loading is not None:
+            display.blit(self.font.render("Loading the recorded sessions... (B to return)", True, "white"), (10, 60))
+            return ContinueExecution.value
+        if self.load_error is not None:
+            display.blit(self.font.render(f"Could not load the recorded sessions: {self.load_error!r}. Press B to return.", True, "white"), (10, 60))
+            return ContinueExecution.value
+        if not self.sessions:
+            display.blit(self.font.render("No sessions with this server have been recorded yet. Press B to return.", True, "white"), (10, 60))
+            return ContinueExecution.value
+
+        summary = self.sessions[self.selected]["summary"]
+        when = datetime.datetime.fromtimestamp(summary["started"]).strftime("%Y-%m-%d %H:%M")
+        selected_line = f"Session {self.selected + 1} of {len(self.sessions)}: {when}, {summary['duration'] / 60:.1f} min (d-pad to choose, B to return)"
+        display.blit(self.font.render(selected_line, True, "white"), (10, 55))
+
+        # The trends across sessions, two to a row
+        top = 90
+        chart_width = (disp.width - 30) // 2
+        row_height = 95
+        for index, (label, key, scale, unit) in enumerate(TRENDS):
+            left = 10 + (index % 2) * (chart_width + 10)
+            row_top = top + (index // 2) * row_height
+            values = [number_or_none(session["summary"][key]) for session in self.sessions]
+            values = [value * scale if value is not None else None for value in values]
+            current = values[self.selected]
+            known = sorted(value for value in values if value is not None)
+            text = f"{label}: {'-' if current is None else f'{current:.1f}'}{' ' + unit if unit else ''}"
+            if known:
+                text += f" (median of all {known[len(known) // 2]:.1f})"
+            display.blit(self.font.render(text, True, "white"), (left, row_top))
+            draw_chart(display, pygame.Rect(left, row_top + 24, chart_width, row_height - 32), values, (0, 200, 255), self.selected)
+
+        # The selected session over time
+        series = self.sessions[self.selected]["series"]
+        series_top = top + math.ceil(len(TRENDS) / 2) * row_height + 10
+        series_height = (disp.bottom - series_top - 40) // 2
+        for row, (label, key, scale, color) in enumerate([("Latency during the session, ms", "latency_p50", 1000, (255, 200, 0)), ("Frames drawn per second", "fps", 1, (0, 255, 100))]):
+            row_top = series_top + row * (series_height + 20)
+            values = [number_or_none(value) for value in series[key]]
+            values = [value * scale if value is not None else None for value in values]
+            known = [value for value in values if value is not None]
+            text = label + (f": {min(known):.1f} to {max(known):.1f}" if known else ": no data")
+            display.blit(self.font.render(text, True, "white"), (10, row_top))
+            draw_chart(display, pygame.Rect(10, row_top + 20, disp.width - 20, series_height - 20), values, color)
+
+        return ContinueExecution.value
+
+    def finish_loading(self):
+        try:
+            self.sessions = self.loading.result()[-MAX_SESSIONS_SHOWN:]
+        except Exception as e:
+            log.exception("Loading the session archive failed")
+            self.load_error = e
+        self.selected = len(self.sessions) - 1
+        self.loading = None
+
+    def receive_data(self, returning_screen, returned_data: Any):
+        return super().receive_data(returning_screen, returned_data)
+
+    def should_render_frame(self) -> bool:
+        loaded = self.loading is not None and self.loading.done()
+        return self.needs_render or self.am_returning_now or loaded or self.time_since_last_rendered > 1
+
+    def handle_event(self, event: pygame.event.Event) -> bool:
+        if event.type == pygame.JOYBUTTONDOWN and event.button in (0, 1):
+            self.am_returning_now = True
+            return True
+        if event.type == pygame.JOYHATMOTION and event.value[0] and self.sessions:
+            self.selected = max(0, min(len(self.sessions) - 1, self.selected + event.value[0]))
+            self.needs_render = True
+            return True
+        return False
@@ -1,15 +1,21 @@
 from typing import Any
 import pygame
-from steamdeck_robotcontrol import persistence
+from steamdeck_robotcontrol import persistence, startup
 from steamdeck_robotcontrol.screen import CallAnother, ContinueExecution, ExitProgram, ScreenRunResult
-from steamdeck_robotcontrol.screens.control import robot_control_wrapper
-from steamdeck_robotcontrol.screens.generator_screen import RenderingGeneratorScreen
+from steamdeck_robotcontrol.screens.coroutine_screen import call
 from steamdeck_robotcontrol.screens.menu import VerticalMenuScreen
 from steamdeck_robotcontrol.screens.text_input import TextInputScreen
 from .. import screen
 
-def main_menu():
-    db = persistence.get_database('servers_config')
+@startup.warm_up
+def open_servers_config():
+    # Settings are read from the cache and written on a background thread, so they never stall a frame.
+    # Other tools may edit them too; those edits are picked up within a second.
+    # This is opened during startup, so that the cache is already filled when the menu needs it.
+    return persistence.get_database('servers_config', background=True, external_change_check_interval=1.0)
+
+async def main_menu():
+    db = open_servers_config()
     while 1:
         items = []
         for index, server in enumerate(db.get_or_create('servers', [])):
@@ -17,21 +23,21 @@ def main_menu():
         
         items.append( ('add', 'Add a new server...') )
         items.append( ('exit', 'Exit program') )
-        response = yield VerticalMenuScreen(items)
+        response = await call(VerticalMenuScreen(items))
         match response:
             case 'exit':
                 return None
             case 'add':
-                name = yield TextInputScreen("What should the new server be called?", prefill="New Server", allow_cancelling=True)
+                name = await call(TextInputScreen("What should the new server be called?", prefill="New Server", allow_cancelling=True))
                 if not name: continue
-                address = yield TextInputScreen(f'What should the address for server "{name}" be?', allow_cancelling=True)
+                address = await call(TextInputScreen(f'What should the address for server "{name}" be?', allow_cancelling=True))
                 if not address: continue
-                db['servers'] += [{'name': name, 'address': address}]
+                db.append('servers', {'name': name, 'address': address})
             case idx:
                 # Selected index of server
-                yield from server_submenu(db, idx)
+                await server_submenu(db, idx)
 
-def server_submenu(db, server_idx):
+async def server_submenu(db, server_idx):
     response = '???'
     while response and response != 'back':
         server = db['servers'][server_idx]
@@ -39,30 +45,33 @@ def server_submenu(db, server_idx):
             ('conn', 'Connect to this server'),
             ('edit_name', f'Name: {server["name"]} (edit?)'),
             ('edit_addr', f'Address: {server["address"]} (edit?)'),
+            ('edit_transport', f'Video over: {server.get("video_transport", "websocket")} (switch?)'),
+            ('history', 'Performance history'),
             ('delete', 'Delete this server from the list'),
             ('back', 'Return to server list')
         ]
-        response = yield VerticalMenuScreen(menu, default_item='conn', allow_cancelling=True)
+        response = await call(VerticalMenuScreen(menu, default_item='conn', allow_cancelling=True))
         match response:
-            case 'conn': yield RenderingGeneratorScreen(robot_control_wrapper(server['address']))
+            case 'conn':
+                # Imported here, because it brings in the video and network stack, which the menu doesn't need
+                from steamdeck_robotcontrol.screens.control import robot_control_wrapper
+                await robot_control_wrapper(server['address'], server.get('video_transport', 'websocket'))
+            case 'history':
+                from steamdeck_robotcontrol.screens.history import SessionHistoryScreen
+                await call(SessionHistoryScreen(server['name'], server['address']))
             case 'edit_name':
-                new_name = yield TextInputScreen("What should the new name for this server be?", server['name'], allow_cancelling=True)
+                new_name = await call(TextInputScreen("What should the new name for this server be?", server['name'], allow_cancelling=True))
                 if new_name:
-                    server['name'] = new_name
-                    servers = db['servers']
-                    servers[server_idx] = server
-                    db['servers'] = servers
+                    db.set_at('servers', (server_idx, 'name'), new_name)
             case 'edit_addr':
-                new_addr = yield TextInputScreen("What should the new address for this server be?", server['address'], allow_cancelling=True)
+                new_addr = await call(TextInputScreen("What should the new address for this server be?", server['address'], allow_cancelling=True))
                 if new_addr:
-                    server['address'] = new_addr
-                    servers = db['servers']
-                    servers[server_idx] = server
-                    db['servers'] = servers
+                    db.set_at('servers', (server_idx, 'address'), new_addr)
+            case 'edit_transport':
+                new_transport = 'udp' if server.get('video_transport', 'websocket') == 'websocket' else 'websocket'
+                db.set_at('servers', (server_idx, 'video_transport'), new_transport)
             case 'delete':
-                resp = yield VerticalMenuScreen([(1, f'Really delete the server {server["name"]}'), (0, 'Do not')], default_item=0, allow_cancelling=True)
+                resp = await call(VerticalMenuScreen([(1, f'Really delete the server {server["name"]}'), (0, 'Do not')], default_item=0, allow_cancelling=True))
                 if resp:
-                    servers = db['servers']
-                    servers.pop(server_idx)
-                    db['servers'] = servers
+                    db.remove_at('servers', (server_idx,))
                     response = 'back'
\ No newline at end of file
@@ -3,7 +3,7 @@ from typing import Any, List, Tuple
 import pygame
 
 from steamdeck_robotcontrol.screen import ContinueExecution, ReturnToCaller, ScreenRunResult
-from .. import screen
+from .. import fonts, screen
 
 TYPEMATIC_DELAY = 0.5  # When a direction is being held down, this is how long until typematic triggers
 TYPEMATIC_RATE = 0.1  # When typematic is triggered, this is how often it will tick
@@ -14,8 +14,7 @@ class VerticalMenuScreen(screen.Screen):
     def __init__(self, items: List[Tuple[Any, str]], default_item=None, allow_cancelling=False):
         super().__init__()
         self.items = items
-        pygame.font.init()
-        font = pygame.font.SysFont(pygame.font.get_default_font(), 36)
+        font = fonts.get_font(36)
         self.vspace = 12
         self.text_lines = []
         self.selected_item = None
@@ -28,11 +27,10 @@ class VerticalMenuScreen(screen.Screen):
                 raise ValueError(f"The default_argument must be the internal representation of one of the items: for example, default_item==items[0][0]; provided is: {default_item}")
         self.highlight_index = 0
         self.allow_cancelling = allow_cancelling
+        self.font = font
         for _, label in self.items:
-            self.text_lines.append( (
-                font.render(label, True, 'white'),
-                [font.render(label, True, 'red'), font.render(label, True, 'green'), font.render(label, True, 'blue')]
-            ))
+            # The highlighted versions are only rendered once the item gets selected, so that opening a long menu is quick
+            self.text_lines.append( [font.render(label, True, 'white'), None] )
         self.am_returning_now = False
 
         self.typematic_source = None
@@ -86,6 +84,10 @@ class VerticalMenuScreen(screen.Screen):
             label, rect = label_data
             label_deselected, labels_selected = label
             if self.selected_item == i:
+                if labels_selected is None:
+                    text = self.items[i][1]
+                    labels_selected = [self.font.render(text, True, 'red'), self.font.render(text, True, 'green'), self.font.render(text, True, 'blue')]
+                    self.text_lines[i][1] = labels_selected
                 self.highlight_index = (self.highlight_index + 1) % len(labels_selected)
                 current_label = labels_selected[self.highlight_index]
             else:
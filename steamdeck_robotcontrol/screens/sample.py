@@ -2,7 +2,7 @@ from typing import Any
 import pygame
 
 from steamdeck_robotcontrol.screen import ScreenRunResult
-from .. import screen
+from .. import fonts, screen
 import random
 
 
@@ -53,7 +53,7 @@ class EventLogScreen(screen.Screen):
     """This screen shows a list of events that have been passed to it."""
 
     def __init__(self):
-        self.font = pygame.font.SysFont(pygame.font.get_default_font(), 24)
+        self.font = fonts.get_font(24)
         self.log = []
 
     def run_frame(self, display: pygame.Surface) -> ScreenRunResult:
@@ -2,7 +2,7 @@ from typing import Any
 import pygame
 
 from steamdeck_robotcontrol.screen import ContinueExecution, ReturnToCaller, ScreenRunResult
-from .. import screen
+from .. import fonts, screen
 
 class TextInputScreen(screen.Screen):
     """Asks for some text from the user and returns it once Enter is hit."""
@@ -12,8 +12,7 @@ class TextInputScreen(screen.Screen):
         self.text = prefill
         self.am_returning_now = False
         self.allow_cancelling = allow_cancelling
-        pygame.font.init()
-        self.font = pygame.font.SysFont(pygame.font.get_default_font(), 36)
+        self.font = fonts.get_font(36)
         self.did_flip_fullscreen = False
 
 
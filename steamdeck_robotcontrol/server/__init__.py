@@ -0,0 +1,6 @@
+"""
+Building blocks for the robot-side server (see demo_server.py).
+
+These do not depend on the robot's hardware, so they can be tested and reused on a desktop.
+"""
+from .fanout import *
@@ -0,0 +1,146 @@
+import collections
+import threading
+from typing import Optional, Set
+
+from .. import metrics
+
+__all__ = ["ClientQueue", "FrameBroadcaster", "ControlArbiter"]
+
+FRAMES_BROADCAST = metrics.counter("server.frames_broadcast")
+BYTES_BROADCAST = metrics.counter("server.bytes_broadcast")
+FRAMES_DROPPED = metrics.counter("server.frames_dropped")
+CLIENT_QUEUE_DEPTH = metrics.gauge("server.client_queue_depth")
+
+
+class ClientQueue:
+    """
+    A bounded queue of messages waiting to be sent to a single client, with its own sending thread.
+
+    When the client is slower than the producer, the oldest queued frame is dropped to make room,
+    so the producer never waits and the client always gets the freshest frames it can handle.
+    Other messages for the client go through send(), since only the sending thread may write to the socket.
+    """
+
+    def __init__(self, socket, maxsize: int = 2):
+        self.socket = socket
+        self.frames = collections.deque(maxlen=maxsize)
+        # Messages that must not be dropped; they are sent before any waiting frames
+        self.messages = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.sender_thread = threading.Thread(target=self.sender_worker, daemon=True)
+        self.sender_thread.start()
+
+    def offer(self, frame: bytes):
+        """Queue a frame for sending, dropping the oldest queued one if the queue is full. Never blocks."""
+        with self.condition:
+            if self.closed:
+                return
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped += 1
+                FRAMES_DROPPED.inc()
+            self.frames.append(frame)
+            CLIENT_QUEUE_DEPTH.set(len(self.frames))
+            self.condition.notify()
+
+    def send(self, message: bytes):
+        """Queue a message that must not be dropped, like an acknowledgement, to be sent before the waiting frames. Never blocks."""
+        with self.condition:
+            if self.closed:
+                return
+            self.messages.append(message)
+            self.condition.notify()
+
+    def close(self):
+        """Stop the sending thread; frames and messages still in the queue are discarded."""
+        with self.condition:
+            self.closed = True
+            self.frames.clear()
+            self.messages.clear()
+            self.condition.notify()
+
+    def sender_worker(self):
+        while True:
+            with self.condition:
+                while not self.frames and not self.messages and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                frame = self.messages.popleft() if self.messages else self.frames.popleft()
+            try:
+                self.socket.send(frame)
+                self.sent += 1
+            except Exception:
+                # Any failure to send means that the client is gone;
+                # the connection handler will notice this on its own and unregister us.
+                self.close()
+                return
+
+
+class FrameBroadcaster:
+    """
+    Delivers every frame to every registered client.
+
+    The frame is built once by the caller and the same bytes object is put into each client's queue,
+    so the cost of capturing and encoding does not depend on the number of clients.
+    """
+
+    def __init__(self, queue_size: int = 2):
+        self.queue_size = queue_size
+        self.clients: Set[ClientQueue] = set()
+        self.lock = threading.Lock()
+
+    def add_client(self, socket) -> ClientQueue:
+        client = ClientQueue(socket, self.queue_size)
+        with self.lock:
+            self.clients.add(client)
+        return client
+
+    def remove_client(self, client: ClientQueue):
+        with self.lock:
+            self.clients.discard(client)
+        client.close()
+
+    def has_clients(self) -> bool:
+        return bool(self.clients)
+
+    def broadcast(self, frame: bytes):
+        with self.lock:
+            clients = list(self.clients)
+        FRAMES_BROADCAST.inc()
+        BYTES_BROADCAST.inc(len(frame))
+        for client in clients:
+            client.offer(frame)
+
+
+class ControlArbiter:
+    """
+    Makes sure that only one client at a time can command the robot.
+
+    The first client to ask receives control and keeps it until it releases it (usually by disconnecting);
+    the others can still watch the video, but their commands should be ignored.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.holder: Optional[object] = None
+
+    def try_acquire(self, client) -> bool:
+        """Give control to the client if nobody has it. Returns whether the client now has control."""
+        with self.lock:
+            if self.holder is None:
+                self.holder = client
+            return self.holder is client
+
+    def release(self, client) -> bool:
+        """Take control away from the client, if it had it. Returns whether it did."""
+        with self.lock:
+            if self.holder is client:
+                self.holder = None
+                return True
+            return False
+
+    def has_control(self, client) -> bool:
+        return self.holder is client
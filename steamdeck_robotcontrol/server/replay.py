@@ -0,0 +1,115 @@
+"""
+Serves a recording (see recording.py) back to the app, in place of the robot.
+
+The messages that the app received are sent again, with the same spacing in time (divided by --speed),
+over the same channels: video frames over the video channel, telemetry over the control channel,
+and both over the combined channel. Commands that the app sends are counted and thrown away.
+Each connection plays the recording from the start (or from --start seconds into it).
+
+    python -m steamdeck_robotcontrol.server.replay recording.rcrec [--speed 2] [--port 5555]
+
+Then connect the app to 127.0.0.1:5555. --speed 0 sends everything as fast as the connection takes it.
+"""
+import argparse
+import logging
+import pathlib
+import threading
+import time
+
+import websockets.exceptions
+import websockets.sync.server
+
+from .. import logs, metrics, protocol, recording
+
+log = logging.getLogger(__name__)
+
+COMMANDS_RECEIVED = metrics.counter("replay.commands_received")
+
+
+class ReplayServer:
+    """Replays a recording to every client that connects."""
+
+    def __init__(self, path: pathlib.Path, speed: float = 1.0, start: float = 0.0, loop: bool = False):
+        self.path = path
+        self.speed = speed
+        self.start = start
+        self.loop = loop
+
+    def channels_for_path(self, path: str):
+        if path == protocol.VIDEO_PATH:
+            return {recording.VIDEO}
+        if path == protocol.CONTROL_PATH:
+            return {recording.CONTROL}
+        return {recording.VIDEO, recording.CONTROL}
+
+    def play(self, socket, channels) -> int:
+        """Send the recorded messages of the channels to the socket, keeping their timing. Returns how many were sent."""
+        reader = recording.RecordingReader(self.path)
+        sent = 0
+        try:
+            if not len(reader):
+                return 0
+            first = reader.index_at(reader.times[0] + self.start)
+            while True:
+                started = time.perf_counter()
+                for i in range(first, len(reader)):
+                    record = reader[i]
+                    if record.direction != recording.RECEIVED or record.channel not in channels:
+                        continue
+                    if self.speed > 0:
+                        delay = started + (record.time - reader.times[first]) / self.speed - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                    socket.send(record.message)
+                    sent += 1
+                if not self.loop:
+                    return sent
+        finally:
+            reader.close()
+
+    def handler(self, socket: websockets.sync.server.ServerConnection):
+        channels = self.channels_for_path(socket.request.path)
+        log.info("Client %s connected, replaying %s", socket.remote_address, self.path)
+
+        def drain_commands():
+            try:
+                for _ in socket:
+                    COMMANDS_RECEIVED.inc()
+            except websockets.exceptions.ConnectionClosed:
+                pass
+
+        drain = threading.Thread(target=drain_commands, daemon=True, name="replay command drain")
+        drain.start()
+        try:
+            sent = self.play(socket, channels)
+            log.info("Replayed %d messages to %s", sent, socket.remote_address)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        # The app takes a closed connection for a lost robot, so keep it open until the app leaves
+        drain.join()
+
+    def serve(self, host: str = "127.0.0.1", port: int = 5555):
+        return websockets.sync.server.serve(self.handler, host=host, port=port, compression=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", type=pathlib.Path)
+    parser.add_argument("--speed", type=float, default=1.0, help="How many times faster than recorded to replay; 0 for no waiting at all")
+    parser.add_argument("--start", type=float, default=0.0, help="How many seconds into the recording to start from")
+    parser.add_argument("--loop", action="store_true", help="Start over at the end")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    args = parser.parse_args()
+    logs.setup_logging()
+
+    reader = recording.RecordingReader(args.recording)
+    if len(reader):
+        log.info("%s: %d messages over %.1f s", args.recording, len(reader), reader.times[-1] - reader.times[0])
+    reader.close()
+    with ReplayServer(args.recording, args.speed, args.start, args.loop).serve(args.host, args.port) as server:
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+A stand-in for the robot, on loopback: it serves synthetic video frames and takes commands, like demo_server.py,
+but without a camera or a serial port. The harness and the benchmarks drive the app against it.
+
+The frames are a moving pattern with the frame number on it, encoded ahead of time
+(FRAME_VARIETY different ones, sent in turn), so encoding doesn't hold up sending at the chosen rate.
+
+    with StandInRobot(width=640, height=480, quality=80, fps=30) as robot:
+        connect the app to robot.address
+        ...
+        robot.commands    # how many commands of each kind were received
+"""
+import collections
+import threading
+import time
+from typing import List, Optional
+
+import cv2
+import numpy as np
+import websockets.exceptions
+import websockets.sync.server
+
+from .. import protocol
+from .fanout import ControlArbiter, FrameBroadcaster
+
+# How many different frames are encoded ahead of time
+FRAME_VARIETY = 30
+
+
+def synthetic_frames(width: int, height: int, quality: int, count: int = FRAME_VARIETY, payload_size: Optional[int] = None) -> List[bytes]:
+    """
+    JPEG frames of a moving gradient, with the frame number on them.
+    If a payload_size is given, each frame is padded with bytes after its end to be at least that big,
+    which decoders ignore, so that the amount of data sent can be chosen separately from the picture.
+    """
+    frames = []
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    for i in range(count):
+        shift = i * 255 / count
+        image = np.empty((height, width, 3), dtype=np.uint8)
+        image[..., 0] = (x + shift) % 256
+        image[..., 1] = (y + shift) % 256
+        image[..., 2] = ((x + y) / 2 + 2 * shift) % 256
+        cv2.putText(image, str(i), (width // 10, height // 2), cv2.FONT_HERSHEY_SIMPLEX, height / 200, (255, 255, 255), 3)
+        encoded, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        data = buffer.tobytes()
+        if payload_size is not None and len(data) < payload_size:
+            data += bytes(payload_size - len(data))
+        frames.append(data)
+    return frames
+
+
+class StandInRobot:
+    """Serves synthetic video on the video (and combined) channel, and counts the commands it receives."""
+
+    def __init__(self, width: int = 640, height: int = 480, quality: int = 80, fps: float = 30.0,
+                 payload_size: Optional[int] = None, host: str = "127.0.0.1", port: int = 0):
+        self.fps = fps
+        self.frames = synthetic_frames(width, height, quality, payload_size=payload_size)
+        self.broadcaster = FrameBroadcaster(queue_size=2)
+        self.arbiter = ControlArbiter()
+        self.commands = collections.Counter()
+        self.frames_sent = 0
+        self.stopping = threading.Event()
+        self.server = websockets.sync.server.serve(self.handler, host=host, port=port, compression=None)
+        self.threads = [
+            threading.Thread(target=self.server.serve_forever, daemon=True, name="stand-in server"),
+            threading.Thread(target=self.frame_worker, daemon=True, name="stand-in frames"),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    @property
+    def address(self) -> str:
+        host, port = self.server.socket.getsockname()[:2]
+        return f"{host}:{port}"
+
+    def frame_worker(self):
+        next_frame_at = time.perf_counter()
+        while not self.stopping.is_set():
+            delay = next_frame_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -1 / self.fps:
+                # Fell behind: carry on from now, rather than sending the missed frames in a burst
+                next_frame_at = time.perf_counter()
+            next_frame_at += 1 / self.fps
+            if not self.broadcaster.has_clients():
+                continue
+            frame = self.frames[self.frames_sent % len(self.frames)]
+            self.broadcaster.broadcast(protocol.pack_video_frame(time.time(), frame))
+            self.frames_sent += 1
+
+    def handler(self, socket: websockets.sync.server.ServerConnection):
+        path = socket.request.path
+        video_client = None
+        if path != protocol.CONTROL_PATH:
+            video_client = self.broadcaster.add_client(socket)
+        try:
+            for msg in socket:
+                if path != protocol.VIDEO_PATH and self.arbiter.try_acquire(socket):
+                    self.commands[bytes(msg[0:1])] += 1
+                    if msg[0:1] == protocol.EMERGENCY_STOP:
+                        socket.send(protocol.EMERGENCY_STOP_ACKNOWLEDGED)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self.arbiter.release(socket)
+            if video_client is not None:
+                self.broadcaster.remove_client(video_client)
+
+    def close(self):
+        self.stopping.set()
+        self.server.shutdown()
+        for thread in self.threads:
+            thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
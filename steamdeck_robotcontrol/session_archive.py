@@ -0,0 +1,168 @@
+"""
+An archive of how every control session went, kept through the persistence layer,
+so that a link or a robot that gets slowly worse over weeks shows up.
+
+A session lasts from connecting to a server until leaving it, across reconnections.
+Meanwhile, a SessionRecorder collects when video frames arrived and how late they were, when they were drawn,
+when commands were sent, and how long emergency stops took to be acknowledged, into arrays: an append each.
+When the session ends, save() stores a summary and time series downsampled to at most SERIES_POINTS points
+in the session_archive scope, under "<server address>@<start time>", with the binary codec,
+so that the series are stored as packed arrays of floats.
+Saving also prunes the server's sessions down to the latest MAX_SESSIONS_PER_SERVER, none older than MAX_AGE_DAYS.
+
+The scope is opened without a worker or a filled cache, so that opening it doesn't decode every session;
+instead, saving and loading read and write SQLite directly, and the callers do them on a thread of their own.
+A save can overlap a load, and the connection is shared by those threads, so both hold its lock throughout.
+
+The history screen (screens/history.py) shows the sessions of a server as trends.
+"""
+import array
+import bisect
+import logging
+import math
+import time
+from typing import Dict, List, Optional, Sequence
+
+from . import persistence
+
+log = logging.getLogger(__name__)
+
+SCOPE = "session_archive"
+# Time series are downsampled into at most this many buckets, and no shorter than a second each
+SERIES_POINTS = 120
+# Sessions shorter than this, that got no video either, were connection attempts, and aren't saved
+MIN_SESSION_SECONDS = 5.0
+# How many sessions are kept for each server, and for how long: enough to see trends over weeks
+MAX_SESSIONS_PER_SERVER = 200
+MAX_AGE_DAYS = 90
+
+
+def open_archive():
+    return persistence.get_database(SCOPE, cache_policy=persistence.CachePolicy(max_entries=MAX_SESSIONS_PER_SERVER), codec=persistence.BINARY_CODEC)
+
+
+def session_key(server: str, started: float) -> str:
+    # Fixed-width times, so that a server's sessions sort by time
+    return f"{server}@{started:014.3f}"
+
+
+def server_keys(server: str, archive) -> List[str]:
+    """The keys of the server's sessions, oldest first, read from SQLite without loading the sessions."""
+    # Every key of the server starts with "<server>@", and "A" comes right after "@"
+    with archive.lock:
+        rows = archive.run_query(lambda conn: conn.execute(
+            f"SELECT key FROM {archive.table} WHERE key > ? AND key < ? ORDER BY key", (f"{server}@", f"{server}A")).fetchall())
+    # An address with an "@" in it could share the prefix of another
+    return [key for key, in rows if key.rpartition("@")[0] == server]
+
+
+def prune(server: str, archive=None) -> List[str]:
+    """Delete the server's sessions beyond the latest MAX_SESSIONS_PER_SERVER, and those older than MAX_AGE_DAYS. Returns their keys."""
+    if archive is None:
+        archive = open_archive()
+    keys = server_keys(server, archive)
+    oldest_kept = session_key(server, time.time() - MAX_AGE_DAYS * 86400)
+    # The times in the keys are fixed-width, so the keys compare as the times do
+    removed = [key for index, key in enumerate(keys) if index < len(keys) - MAX_SESSIONS_PER_SERVER or key < oldest_kept]
+    with archive.batch():
+        for key in removed:
+            del archive[key]
+    if removed:
+        log.info("Removed %d old sessions with %s from the archive", len(removed), server)
+    return removed
+
+
+def percentile(ordered: Sequence[float], fraction: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class SessionRecorder:
+    """Collects what happens during one session with a server. The times are seconds since the session started."""
+
+    def __init__(self, server: str):
+        self.server = server
+        self.started = time.time()
+        self.started_clock = time.perf_counter()
+        self.frame_times = array.array("d")
+        self.frame_latencies = array.array("d")
+        self.draw_times = array.array("d")
+        self.command_times = array.array("d")
+        self.emergency_stop_rtts = array.array("d")
+        self.reconnects = 0
+
+    def now(self) -> float:
+        return time.perf_counter() - self.started_clock
+
+    def frame_received(self, latency: float):
+        """Called by the video thread."""
+        self.frame_times.append(self.now())
+        self.frame_latencies.append(latency)
+
+    def frame_drawn(self):
+        self.draw_times.append(self.now())
+
+    def command_sent(self):
+        self.command_times.append(self.now())
+
+    def emergency_stop_acknowledged(self, rtt: float):
+        self.emergency_stop_rtts.append(rtt)
+
+    def summary(self, duration: float) -> dict:
+        # The video thread may be appending the latency of a frame right now
+        count = min(len(self.frame_times), len(self.frame_latencies))
+        latencies = sorted(self.frame_latencies[:count])
+        rtts = sorted(self.emergency_stop_rtts)
+        return {
+            "server": self.server, "started": self.started, "duration": duration, "reconnects": self.reconnects,
+            "frames_received": count, "frames_drawn": len(self.draw_times), "fps": len(self.draw_times) / duration,
+            "latency_p50": percentile(latencies, 0.5), "latency_p95": percentile(latencies, 0.95),
+            "latency_p99": percentile(latencies, 0.99), "latency_max": latencies[-1] if latencies else None,
+            "commands": len(self.command_times), "command_rate": len(self.command_times) / duration,
+            "emergency_stops": len(rtts), "emergency_stop_rtt": percentile(rtts, 0.5),
+        }
+
+    def series(self, duration: float) -> Dict[str, List[float]]:
+        """The session in buckets of equal length: when each starts, the median and worst latency in it, and rates. NaN where there was no video."""
+        buckets = min(SERIES_POINTS, max(1, int(duration)))
+        width = duration / buckets
+        count = min(len(self.frame_times), len(self.frame_latencies))
+        frame_times, latencies = self.frame_times[:count], self.frame_latencies[:count]
+        series = {"t": [], "latency_p50": [], "latency_max": [], "fps": [], "command_rate": []}
+        for bucket in range(buckets):
+            start, end = bucket * width, (bucket + 1) * width
+            first, last = bisect.bisect_left(frame_times, start), bisect.bisect_left(frame_times, end)
+            in_bucket = sorted(latencies[first:last])
+            series["t"].append(start)
+            series["latency_p50"].append(in_bucket[len(in_bucket) // 2] if in_bucket else math.nan)
+            series["latency_max"].append(in_bucket[-1] if in_bucket else math.nan)
+            series["fps"].append((bisect.bisect_left(self.draw_times, end) - bisect.bisect_left(self.draw_times, start)) / width)
+            series["command_rate"].append((bisect.bisect_left(self.command_times, end) - bisect.bisect_left(self.command_times, start)) / width)
+        return series
+
+    def save(self, archive=None) -> Optional[str]:
+        """
+        Store the session in the archive, unless it was only a connection attempt, and prune the server's old sessions. Returns its key.
+        This writes to SQLite, so the UI calls it through run_in_thread.
+        """
+        duration = max(self.now(), 1e-3)
+        if duration < MIN_SESSION_SECONDS and not self.frame_times:
+            return None
+        if archive is None:
+            archive = open_archive()
+        key = session_key(self.server, self.started)
+        session = {"summary": self.summary(duration), "series": self.series(duration)}
+        with archive.lock:
+            archive[key] = session
+            prune(self.server, archive)
+        log.info("Saved the session with %s (%.0f s) into the archive", self.server, duration)
+        return key
+
+
+def load(server: str, archive=None) -> List[dict]:
+    """The archived sessions with the server, oldest first. This reads SQLite, so the UI calls it through run_in_thread."""
+    if archive is None:
+        archive = open_archive()
+    with archive.lock:
+        return [archive[key] for key in server_keys(server, archive)]
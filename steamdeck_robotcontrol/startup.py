@@ -0,0 +1,160 @@
+"""
+The startup phase: a first frame is shown right away,
+while what the first real screen needs is prepared in the background.
+
+Modules register warm-up tasks with the warm_up decorator, for example to open their persistence scopes
+(which fills their caches). The StartupScreen runs each task on a background thread of its own,
+so that a quick one that the menu needs doesn't wait behind a slow one,
+preloads fonts on the main thread one per frame, and then calls the first real screen.
+Tasks registered with wait=False, like importing the video stack, aren't waited for: the menu can be used while they run.
+
+How long it took to show the first frame, and until the first real screen took over, is recorded in TIMES.
+"""
+import importlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import pygame
+
+from steamdeck_robotcontrol import fonts
+from steamdeck_robotcontrol.screen import CallAnother, ContinueExecution, ReturnToCaller, ScreenRunResult
+from . import screen
+
+# This module is imported first thing by the entrypoint, so this is as close to launch as we can measure from
+PROCESS_START = time.perf_counter()
+
+log = logging.getLogger(__name__)
+
+# Modules that screens need once a connection starts, which the menu doesn't import.
+# They are imported in the background, so that neither the first frame, nor the menu, nor connecting waits for them.
+VIDEO_STACK_MODULES = ("numpy", "cv2", "websockets.sync.client", "steamdeck_robotcontrol.screens.control")
+
+_NOTHING = object()
+
+
+class StartupTimes:
+    """Seconds from PROCESS_START until each milestone, and how long each warm-up task took."""
+
+    def __init__(self, start: float):
+        self.start = start
+        self.milestones: Dict[str, float] = dict()
+        self.tasks: Dict[str, float] = dict()
+
+    def mark(self, milestone: str):
+        """Record a milestone. Only the first time counts, so this can be called on every frame."""
+        if milestone not in self.milestones:
+            self.milestones[milestone] = time.perf_counter() - self.start
+
+    def __getitem__(self, milestone: str) -> float:
+        return self.milestones[milestone]
+
+    def report(self):
+        log.info("Startup times: %s", ", ".join(f"{name} after {seconds * 1000:.0f} ms" for name, seconds in self.milestones.items()))
+        for name, seconds in self.tasks.items():
+            log.info("Warm-up task %s took %.0f ms", name, seconds * 1000)
+
+
+TIMES = StartupTimes(PROCESS_START)
+
+# Functions to call in the background during startup, which the first real screen waits for
+WARM_UP_TASKS: List[Callable[[], Any]] = []
+# Functions to call in the background during startup, which nothing waits for
+BACKGROUND_TASKS: List[Callable[[], Any]] = []
+
+# What the warm-up tasks returned. Strong references are held here,
+# so that for example a KVDatabase that was opened stays open until the screen that needs it gets it.
+WARM_UP_RESULTS: Dict[str, Any] = dict()
+
+
+def warm_up(fn: Optional[Callable[[], Any]] = None, *, wait: bool = True):
+    """
+    Decorator that registers a function to run in the background during startup. It can still be called normally.
+    With wait=False, the first real screen is called without waiting for it to finish.
+    """
+    def register(fn: Callable[[], Any]) -> Callable[[], Any]:
+        (WARM_UP_TASKS if wait else BACKGROUND_TASKS).append(fn)
+        return fn
+
+    return register if fn is None else register(fn)
+
+
+@warm_up(wait=False)
+def import_video_stack():
+    for module in VIDEO_STACK_MODULES:
+        importlib.import_module(module)
+
+
+warm_up(fonts.look_up_system_fonts)
+
+
+def run_warm_up_task(task: Callable[[], Any]):
+    started = time.perf_counter()
+    try:
+        WARM_UP_RESULTS[task.__qualname__] = task()
+    except Exception:
+        # Whatever failed will be done again, and fail visibly, when it's actually needed
+        log.exception("Warm-up task %s failed", task.__qualname__)
+    TIMES.tasks[task.__qualname__] = time.perf_counter() - started
+
+
+class StartupScreen(screen.Screen):
+    """
+    Shown while starting up. Its first frame is drawn before anything else is done.
+
+    When the warm-up tasks have finished and the fonts are preloaded, it calls the screen that next_screen() creates;
+    the background tasks are started too, but may still be running then.
+    When that screen returns, this one returns the same data.
+    """
+
+    def __init__(self, next_screen: Callable[[], screen.Screen], tasks: Optional[List[Callable[[], Any]]] = None, font_sizes=fonts.PRELOAD_SIZES,
+                 background_tasks: Optional[List[Callable[[], Any]]] = None):
+        super().__init__()
+        self.next_screen = next_screen
+        self.fonts_to_preload = list(font_sizes)
+        self.frames = 0
+        self.handed_over = False
+        self.returned_data = _NOTHING
+        self.threads = [
+            threading.Thread(target=run_warm_up_task, args=(task,), daemon=True, name=f"warm-up {task.__qualname__}")
+            for task in (WARM_UP_TASKS if tasks is None else tasks)
+        ]
+        for thread in self.threads:
+            thread.start()
+        for task in (BACKGROUND_TASKS if background_tasks is None else background_tasks):
+            threading.Thread(target=run_warm_up_task, args=(task,), daemon=True, name=f"background {task.__qualname__}").start()
+
+    def run_frame(self, display: pygame.Surface) -> ScreenRunResult:
+        super().run_frame(display)
+        if self.returned_data is not _NOTHING:
+            return ReturnToCaller(self.returned_data)
+
+        self.frames += 1
+        if self.frames > 1:
+            # The first frame is only the loading text, so that it appears as soon as possible
+            if self.fonts_to_preload:
+                fonts.preload_font(self.fonts_to_preload.pop(0))
+            elif not any(thread.is_alive() for thread in self.threads) and not self.handed_over:
+                self.handed_over = True
+                next_screen = self.next_screen()
+                TIMES.mark("interactive")
+                TIMES.report()
+                return CallAnother(next_screen)
+
+        display.fill("black")
+        # The built-in font doesn't need the system font list, which is still being built
+        if self.frames == 1:
+            self.loading_text = pygame.font.Font(None, 36).render("Loading...", True, "white")
+        rect = self.loading_text.get_rect(center=display.get_rect().center)
+        display.blit(self.loading_text, rect)
+        return ContinueExecution.value
+
+    def should_render_frame(self) -> bool:
+        return not self.handed_over or self.returned_data is not _NOTHING
+
+    def handle_event(self, event: pygame.event.Event) -> bool:
+        return False
+
+    def receive_data(self, returning_screen, returned_data: Any):
+        self.returned_data = returned_data
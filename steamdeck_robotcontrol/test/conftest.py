@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(autouse=True, scope="session")
+def isolated_data_directory(tmp_path_factory):
+    """Keep the persistence layer from writing to the real data directory while testing."""
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setenv("ROBOTCONTROL_DATA_DIR", str(tmp_path_factory.mktemp("data")))
+    yield
+    monkeypatch.undo()
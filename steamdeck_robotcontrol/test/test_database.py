@@ -2,6 +2,10 @@ from .. import persistence
 import pytest
 import uuid
 import random
+import json
+import sqlite3
+import threading
+import time
 
 def purge_connections():
     """
@@ -9,6 +13,9 @@ def purge_connections():
     """
     persistence.CONNECTIONS.clear()
     persistence.DATABASES.clear()
+    for worker in persistence.WORKERS.values():
+        worker.close()
+    persistence.WORKERS.clear()
 
 
 def test_database_read_write():
@@ -74,7 +81,7 @@ def test_database_complete():
     db = persistence.get_database('test_suite')
     db.populate_cache()
     # Break the connection, so that any operation with it would error out
-    db.conn = ...  # Ellipsis object: look for this in logs
+    db.connection.conn = ...  # Ellipsis object: look for this in logs
     # No write operations past this point
     assert db.cache_is_complete
     assert len(db) == len(data)
@@ -83,4 +90,468 @@ def test_database_complete():
     
     assert set(db) == set(data)
     assert set(db.items()) == set(data.items())
-    
\ No newline at end of file
+
+    # The connection is shared with the other scopes, so don't leave it broken for them
+    del db
+    purge_connections()
+    
+def committed_value(db, key):
+    """Read a value through a separate connection, which only sees committed data."""
+    other = sqlite3.connect(db.path)
+    try:
+        row = other.execute(f"SELECT value_json FROM {db.table} WHERE key=?", (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+    finally:
+        other.close()
+
+def test_database_batch():
+    db = persistence.get_database('test_suite')
+    db.wipe_everything()
+    with db.batch():
+        db['a'] = 1
+        with db.batch():
+            db['b'] = 2
+        # Nothing is committed until the outermost batch ends
+        assert committed_value(db, 'a') is None
+        assert committed_value(db, 'b') is None
+    assert committed_value(db, 'a') == 1
+    assert committed_value(db, 'b') == 2
+
+def test_database_batch_rollback():
+    db = persistence.get_database('test_suite')
+    db.wipe_everything()
+    db['a'] = 1
+    with pytest.raises(RuntimeError):
+        with db.batch():
+            db['a'] = 2
+            db['b'] = 3
+            raise RuntimeError
+    assert db['a'] == 1
+    assert 'b' not in db
+    assert committed_value(db, 'a') == 1
+
+def test_database_write_behind():
+    db = persistence.get_database('test_suite')
+    db.wipe_everything()
+    del db
+    purge_connections()
+
+    db = persistence.get_database('test_suite', commit_interval=0.05)
+    db['a'] = 1
+    db['b'] = 2
+    assert db['a'] == 1
+    assert committed_value(db, 'a') is None
+    # The timer commits everything together
+    deadline = time.perf_counter() + 2
+    while committed_value(db, 'b') != 2:
+        assert time.perf_counter() < deadline
+        time.sleep(0.01)
+    assert committed_value(db, 'a') == 1
+
+    db['c'] = 3
+    db.flush()
+    assert committed_value(db, 'c') == 3
+
+    # Write-behind mode belongs to the connection, which the next tests shouldn't inherit
+    del db
+    purge_connections()
+
+def test_database_background_worker():
+    db = persistence.get_database('test_suite')
+    db.wipe_everything()
+    db['existing'] = 'value'
+    del db
+    purge_connections()
+
+    db = persistence.get_database('test_suite', background=True)
+    # The cache is filled on opening, so reads don't need the worker
+    assert db.cache_is_complete
+    assert db['existing'] == 'value'
+
+    # Writes are applied in the order they were made
+    for i in range(100):
+        db['counter'] = i
+    del db['existing']
+    db.flush()
+    assert committed_value(db, 'counter') == 99
+    assert committed_value(db, 'existing') is None
+
+    with pytest.raises(RuntimeError):
+        with db.batch():
+            db['counter'] = -1
+            raise RuntimeError
+    # Reading after a rollback goes through the worker, after the rollback itself
+    assert db['counter'] == 99
+
+    del db
+    purge_connections()
+    db = persistence.get_database('test_suite')
+    assert db['counter'] == 99
+    assert 'existing' not in db
+
+def test_failed_background_write_discards_cache():
+    db = persistence.get_database('test_suite')
+    db.wipe_everything()
+    db['kept'] = 'value'
+    del db
+    purge_connections()
+
+    db = persistence.get_database('test_suite', background=True)
+    # SQLite refuses this key, but only once the worker gets to the write
+    db.run_query(lambda conn: conn.execute(f"CREATE TRIGGER refuse_bad BEFORE INSERT ON {db.table} WHEN NEW.key = 'bad' BEGIN SELECT RAISE(ABORT, 'refused'); END"))
+    db['bad'] = 'value'
+    assert db.cache.peek('bad', None) == 'value'
+    db.flush()
+    # The value that was never stored isn't served from the cache
+    assert 'bad' not in db
+    assert db['kept'] == 'value'
+    db.run_query(lambda conn: conn.execute("DROP TRIGGER refuse_bad"))
+
+def test_populate_cache_with_concurrent_writes():
+    db = persistence.get_database('test_suite')
+    db.wipe_everything()
+    db['deleted'] = 'old'
+    db['changed'] = 'old'
+    del db
+    purge_connections()
+
+    # Open the scope on the worker without filling the cache, and fill it on another thread,
+    # which stops after fetching its batch until the writes below have been started
+    connection = persistence.SharedConnection(persistence.get_database_path(), worker=persistence.PersistenceWorker(persistence.get_database_path(), 0.0))
+    db = persistence.KVDatabase(connection, 'test_suite')
+    fetched, writes_started = threading.Event(), threading.Event()
+    run_query = db.run_query
+
+    def query_then_wait(fn):
+        result = run_query(fn)
+        fetched.set()
+        writes_started.wait(timeout=5)
+        return result
+
+    db.run_query = query_then_wait
+    populating = threading.Thread(target=db.populate_cache)
+    populating.start()
+    assert fetched.wait(timeout=5)
+    db.run_query = run_query
+
+    def write():
+        del db['deleted']
+        db['changed'] = 'new'
+
+    writing = threading.Thread(target=write)
+    writing.start()
+    writes_started.set()
+    populating.join(timeout=5)
+    writing.join(timeout=5)
+    # The values fetched before the writes didn't overwrite them in the cache
+    assert db.cache_is_complete
+    assert 'deleted' not in db and list(db.keys()) == ['changed']
+    assert db['changed'] == 'new'
+    connection.close()
+
+def test_scope_opened_from_several_threads():
+    purge_connections()
+    opened = []
+    everyone_ready = threading.Barrier(8)
+
+    def open_scope():
+        everyone_ready.wait()
+        opened.append(persistence.get_database('test_suite', background=True))
+
+    threads = [threading.Thread(target=open_scope) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    # One KVDatabase, so one cache, and one worker
+    assert len(opened) == 8 and all(db is opened[0] for db in opened)
+    assert len(persistence.WORKERS) == 1
+    del opened
+    purge_connections()
+
+def test_database_iteration_batches():
+    db = persistence.get_database('test_suite')
+    db.wipe_everything()
+    data = {f'key{i:04}': {'value': i} for i in range(1000)}
+    with db.batch():
+        for key, value in data.items():
+            db[key] = value
+    db.discard_cache()
+
+    for batch_size in [1, 7, 1000, 5000]:
+        assert list(db.keys(batch_size=batch_size)) == sorted(data)
+        assert dict(db.items(load_into_cache=False, batch_size=batch_size)) == data
+    assert not db.cache
+    assert sorted(db.values(), key=lambda v: v['value']) == list(data.values())
+    # items() and values() filled the cache, but the database does not know that the cache is complete
+    assert len(db.cache) == len(data)
+    assert not db.cache_is_complete
+
+def test_database_iteration_with_writes():
+    db = persistence.get_database('test_suite')
+    db.wipe_everything()
+    for i in range(100):
+        db[f'key{i:03}'] = i
+    db.discard_cache()
+
+    seen = []
+    for key in db.keys(batch_size=10):
+        seen.append(key)
+        # Delete a key that is yet to come, and add new ones both before and after the current position
+        if key == 'key050':
+            del db['key060']
+            db['key000a'] = 'early'
+            db['key999'] = 'late'
+    assert 'key060' not in seen
+    assert 'key000a' not in seen
+    assert seen[-1] == 'key999'
+    assert len(seen) == len(set(seen)) == 100
+
+def test_database_values_are_frozen():
+    db = persistence.get_database('test_suite')
+    db.wipe_everything()
+    original = {'servers': [{'name': 'a'}]}
+    db['config'] = original
+    # Changing the object that was stored does not change the cache
+    original['servers'].append({'name': 'b'})
+    assert db['config'] == {'servers': [{'name': 'a'}]}
+
+    with pytest.raises(TypeError):
+        db['config']['servers'] += [{'name': 'c'}]
+    with pytest.raises(TypeError):
+        db['config']['servers'][0]['name'] = 'c'
+    assert db['config'] == {'servers': [{'name': 'a'}]}
+
+    copy = persistence.thaw(db['config'])
+    copy['servers'][0]['name'] = 'c'
+    assert db['config']['servers'][0]['name'] == 'a'
+
+def test_database_sub_document_operations():
+    db = persistence.get_database('test_suite')
+    db.wipe_everything()
+    db['servers'] = []
+    db.append('servers', {'name': 'one', 'address': '1.1.1.1'})
+    db.append('servers', {'name': 'two', 'address': '2.2.2.2'})
+    db.append('servers', {'name': 'three', 'address': '3.3.3.3'})
+    before = db['servers']
+    db.set_at('servers', (1, 'name'), 'TWO')
+    db.set_at('servers', (-1, 'ports'), [1, 2])
+    db.append('servers', 3, path=(2, 'ports'))
+    db.remove_at('servers', (0,))
+    expected = [
+        {'name': 'TWO', 'address': '2.2.2.2'},
+        {'name': 'three', 'address': '3.3.3.3', 'ports': [1, 2, 3]},
+    ]
+    assert db['servers'] == expected
+    # Copy-on-write: the value handed out earlier did not change, and unchanged parts are shared
+    assert before[0]['name'] == 'one'
+    snapshot = db['servers']
+    db.set_at('servers', (0, 'address'), '2.2.2.2')
+    assert db['servers'][1] is snapshot[1]
+
+    # SQLite made the same changes
+    db.discard_cache()
+    assert db['servers'] == expected
+
+    with pytest.raises(IndexError):
+        db.set_at('servers', (5, 'name'), 'x')
+    with pytest.raises(KeyError):
+        db.remove_at('servers', (0, 'missing'))
+    with pytest.raises(TypeError):
+        db.append('servers', 1, path=(0,))
+    assert db['servers'] == expected
+
+def test_database_bounded_cache():
+    db = persistence.get_database('test_suite')
+    db.wipe_everything()
+    for i in range(10):
+        db[f'key{i}'] = i
+    del db
+    purge_connections()
+
+    db = persistence.get_database('test_suite', cache_policy=persistence.CachePolicy(max_entries=5))
+    db.populate_cache()
+    # Everything was read, but it did not fit
+    assert not db.cache_is_complete
+    assert len(db.cache) == 5
+    assert len(db) == 10
+
+    db['key9']  # hit, so key9 becomes the most recently used
+    db['key0']  # miss, evicting the least recently used entry (key5)
+    assert 'key5' not in db.cache
+    assert 'key9' in db.cache
+    stats = db.cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['evictions'] == 6
+    assert db['key5'] == 5
+
+def test_database_cache_byte_limit():
+    db = persistence.get_database('test_suite')
+    db.wipe_everything()
+    del db
+    purge_connections()
+
+    db = persistence.get_database('test_suite', cache_policy=persistence.CachePolicy(max_bytes=1000))
+    db.populate_cache()
+    assert db.cache_is_complete
+    db['small'] = 'x' * 100
+    assert db.cache_is_complete
+    db['big'] = 'x' * 950
+    # Adding the big value evicted the small one, so the cache is no longer complete
+    assert 'small' not in db.cache
+    assert db.cache.stats()['bytes'] <= 1000
+    assert not db.cache_is_complete
+    assert db['small'] == 'x' * 100
+
+def write_externally(db, key, value):
+    """Write a value from a separate connection, as another process would."""
+    conn = sqlite3.connect(db.path)
+    conn.execute(f"INSERT OR REPLACE INTO {db.table} (key, value_json) VALUES (?, ?)", (key, json.dumps(value)))
+    conn.commit()
+    conn.close()
+
+def test_external_changes_sync():
+    purge_connections()
+    db = persistence.get_database('test_suite', external_change_check_interval=0)
+    db.wipe_everything()
+    db['hello'] = 'World!'
+    assert db['hello'] == 'World!'
+
+    write_externally(db, 'hello', 'Other process')
+    assert db['hello'] == 'Other process'
+    # Our own writes don't count as external changes, so the cache is kept
+    db['hello'] = 'Again'
+    assert db.cache.peek('hello') == 'Again'
+    assert db['hello'] == 'Again'
+    assert 'hello' in db.cache
+
+    del db
+    purge_connections()
+
+def test_external_changes_background():
+    purge_connections()
+    db = persistence.get_database('test_suite', background=True, external_change_check_interval=0.01)
+    db.wipe_everything()
+    db['hello'] = 'World!'
+    db.flush()
+    assert db['hello'] == 'World!'
+
+    write_externally(db, 'hello', 'Other process')
+    deadline = time.perf_counter() + 5
+    while db['hello'] != 'Other process':
+        assert time.perf_counter() < deadline, "External change was not noticed"
+        time.sleep(0.01)
+
+    del db
+    purge_connections()
+
+def test_scopes_share_one_file():
+    purge_connections()
+    first = persistence.get_database('test_suite')
+    second = persistence.get_database('test_suite_other')
+    assert first.path == second.path == persistence.get_database_path()
+    assert first.connection is second.connection
+    first.wipe_everything()
+    second.wipe_everything()
+    first['hello'] = 'first'
+    second['hello'] = 'second'
+    assert first['hello'] == 'first'
+    assert second['hello'] == 'second'
+
+    # A batch on one scope includes writes to the others
+    with pytest.raises(RuntimeError):
+        with first.batch():
+            first['hello'] = 'changed'
+            second['hello'] = 'changed'
+            raise RuntimeError
+    assert first['hello'] == 'first'
+    assert second['hello'] == 'second'
+
+    with second.batch():
+        first['hello'] = 'changed'
+        second['hello'] = 'changed'
+        assert committed_value(first, 'hello') == 'first'
+    assert committed_value(first, 'hello') == 'changed'
+    assert committed_value(second, 'hello') == 'changed'
+
+    del first, second
+    purge_connections()
+
+def test_legacy_scope_import(tmp_path, monkeypatch):
+    purge_connections()
+    monkeypatch.chdir(tmp_path)
+    legacy = sqlite3.connect(persistence.get_legacy_path_for_key('test_suite_legacy'))
+    legacy.execute("CREATE TABLE props(key TEXT PRIMARY KEY, value_json TEXT)")
+    legacy.execute("INSERT INTO props VALUES ('servers', '[]')")
+    legacy.commit()
+    legacy.close()
+
+    db = persistence.get_database('test_suite_legacy')
+    assert db['servers'] == []
+    # Only imported once: after that, the shared database is authoritative
+    db['servers'] = [1]
+    del db
+    purge_connections()
+    db = persistence.get_database('test_suite_legacy')
+    assert db['servers'] == [1]
+    db.wipe_everything()
+
+def test_binary_codec_round_trip():
+    codec = persistence.BINARY_CODEC
+    values = [
+        None, True, False, 0, -1, 2**63 - 1, 2**80, -2**70, 1.5, float('inf'), "", "héllo",
+        [], [1.0, 2.5, -3.25], [1, 2, 3], [1, 2.0], [True, 1], [2**64, 1],
+        {"name": "Robot", "latencies": [0.01] * 1000, "nested": {"table": [[1, 2], [3, 4]]}},
+    ]
+    for value in values:
+        assert codec.decode(codec.encode(value)) == value
+    assert codec.decode(codec.encode((1, 2))) == [1, 2]
+    # Packed arrays are much smaller than JSON
+    latencies = [random.random() for _ in range(1000)]
+    assert len(codec.encode(latencies)) < len(json.dumps(latencies)) / 2
+    with pytest.raises(TypeError):
+        codec.encode({1: 'a'})
+
+def test_database_mixed_codecs():
+    db = persistence.get_database('test_suite')
+    db.wipe_everything()
+    db['config'] = {'name': 'Robot'}
+    db.set('latencies', [0.5, 0.25], codec=persistence.BINARY_CODEC)
+    db.set('calibration', {'wheels': [[1.0, 2.0]], 'offset': 3}, codec=persistence.BINARY_CODEC)
+    # Sub-document operations work on binary rows too, by encoding the whole value again
+    db.append('latencies', 0.125)
+    db.set_at('calibration', ('offset',), 4)
+
+    db.discard_cache()
+    assert db['config'] == {'name': 'Robot'}
+    assert db['latencies'] == [0.5, 0.25, 0.125]
+    assert db['calibration'] == {'wheels': [[1.0, 2.0]], 'offset': 4}
+    db.discard_cache()
+    assert dict(db.items()) == {
+        'config': {'name': 'Robot'},
+        'latencies': [0.5, 0.25, 0.125],
+        'calibration': {'wheels': [[1.0, 2.0]], 'offset': 4},
+    }
+    # Assigning normally switches the row back to the default codec
+    db['latencies'] = [1]
+    db.discard_cache()
+    assert db['latencies'] == [1]
+    assert committed_value(db, 'latencies') == [1]
+
+def test_scope_table_without_codec_column():
+    purge_connections()
+    conn = sqlite3.connect(persistence.get_database_path())
+    table = persistence.quote_identifier(persistence.table_name_for_scope('test_suite_old'))
+    conn.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.execute(f"CREATE TABLE {table}(key TEXT PRIMARY KEY, value_json TEXT)")
+    conn.execute(f"INSERT INTO {table} VALUES ('hello', '\"World!\"')")
+    conn.commit()
+    conn.close()
+
+    db = persistence.get_database('test_suite_old')
+    assert db['hello'] == 'World!'
+    db.set('numbers', [1, 2, 3], codec=persistence.BINARY_CODEC)
+    db.discard_cache()
+    assert db['numbers'] == [1, 2, 3]
+    db.wipe_everything()
@@ -0,0 +1,27 @@
+from ..harness import EventTimelineRecorder, TimelineEventSource, axis, load_timeline, press
+import pygame
+import pytest
+import time
+
+
+def test_timeline_events_arrive_on_time():
+    source = TimelineEventSource([axis(0.03, 1, -1.0)] + press(0.0, 0, hold=0.02), linger=0.05, source=lambda: [])
+    assert [event.type for event in source()] == [pygame.JOYBUTTONDOWN]
+    time.sleep(0.06)
+    assert [event.type for event in source()] == [pygame.JOYBUTTONUP, pygame.JOYAXISMOTION]
+    # Once the timeline is over and the linger time has passed, the run ends
+    time.sleep(0.06)
+    with pytest.raises(SystemExit):
+        source()
+
+
+def test_recorded_timeline_round_trip(tmp_path):
+    events = [pygame.event.Event(pygame.JOYBUTTONDOWN, button=3, joy=0, instance_id=0),
+              pygame.event.Event(pygame.JOYHATMOTION, hat=0, value=(0, -1), joy=0, instance_id=0),
+              pygame.event.Event(pygame.WINDOWEXPOSED)]
+    recorder = EventTimelineRecorder(tmp_path / "session.jsonl", source=lambda: events)
+    assert recorder() == events
+    recorder.file.close()
+    timeline = load_timeline(tmp_path / "session.jsonl")
+    # Only controller and keyboard events are kept
+    assert [event for _, event in timeline] == events[:2]
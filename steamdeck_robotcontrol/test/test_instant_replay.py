@@ -0,0 +1,28 @@
+from ..instant_replay import FrameRing
+
+
+def test_ring_is_bounded_in_bytes():
+    ring = FrameRing(max_bytes=10)
+    message = b"F" + b"123456"
+    # Frames are kept as given, so a view into a received message isn't copied
+    ring.add(1.0, memoryview(message)[1:])
+    ring.add(2.0, b"abcd")
+    assert ring.size == 10
+    ring.add(3.0, b"xy")
+    assert [when for when, _ in ring.snapshot()] == [2.0, 3.0]
+    assert ring.size == 6
+    # A frame bigger than the whole ring still replaces everything else
+    ring.add(4.0, b"0123456789ab")
+    assert [when for when, _ in ring.snapshot()] == [4.0]
+
+
+def test_save_mjpeg(tmp_path):
+    ring = FrameRing()
+    ring.add(1.0, b"\xff\xd8one\xff\xd9")
+    ring.add(1.1, b"\xff\xd8two\xff\xd9")
+    saving = ring.save(tmp_path / "replays" / "clip.mjpeg")
+    # Frames added after saving started, even before it finished, aren't in the clip
+    ring.add(1.2, b"\xff\xd8three\xff\xd9")
+    path = saving.result(timeout=2)
+    assert path.read_bytes() == b"\xff\xd8one\xff\xd9\xff\xd8two\xff\xd9"
+    assert len(ring.snapshot()) == 3
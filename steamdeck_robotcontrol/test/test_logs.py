@@ -0,0 +1,47 @@
+from ..logs import RECENT, RateLimitFilter, setup_logging, shutdown_logging
+import io
+import logging
+import threading
+
+
+def make_record(lineno):
+    return logging.LogRecord("test", logging.INFO, "control.py", lineno, "Sent %s", ([1, 2],), None)
+
+
+def test_rate_limit_per_call_site():
+    rate_limit = RateLimitFilter(burst=2, interval=60)
+    assert [rate_limit.filter(make_record(10)) for _ in range(5)] == [True, True, False, False, False]
+    # Other call sites have limits of their own
+    assert rate_limit.filter(make_record(11))
+
+    rate_limit.interval = 0
+    record = make_record(10)
+    assert rate_limit.filter(record)
+    assert record.suppressed == 3
+
+
+class SlowStream(io.StringIO):
+    """A terminal that takes its time, until it's allowed to go on."""
+    def __init__(self):
+        super().__init__()
+        self.may_write = threading.Event()
+
+    def write(self, text):
+        self.may_write.wait()
+        return super().write(text)
+
+
+def test_logging_does_not_wait_for_output():
+    stream = SlowStream()
+    setup_logging("DEBUG", loggers=("test_logs",), stream=stream)
+    try:
+        log = logging.getLogger("test_logs")
+        # If this waited for the stream, it would never return
+        log.info("Connected to %s", "robot")
+        log.debug("Sent %s", [1, 2])
+        stream.may_write.set()
+    finally:
+        shutdown_logging()
+    assert "INFO MainThread test_logs: Connected to robot" in stream.getvalue()
+    assert RECENT.lines(2) == ["INFO test_logs: Connected to robot", "DEBUG test_logs: Sent [1, 2]"]
+    assert logging.getLogger("test_logs").propagate
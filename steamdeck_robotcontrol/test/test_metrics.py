@@ -0,0 +1,54 @@
+from ..metrics import Registry
+import csv
+import json
+import pytest
+
+
+def test_counter_and_gauge():
+    registry = Registry()
+    sent = registry.counter("sent")
+    sent.inc()
+    sent.inc(10)
+    assert registry.counter("sent") is sent
+    assert sent.value == 11
+
+    depth = registry.gauge("depth")
+    depth.set(5)
+    depth.set(2)
+    assert (depth.value, depth.max) == (2, 5)
+
+
+def test_histogram_percentiles():
+    registry = Registry()
+    histogram = registry.histogram("latency", buckets=(1, 2, 4, 8))
+    for value in [0.5] * 90 + [3] * 9 + [20]:
+        histogram.observe(value)
+    assert histogram.count == 100
+    assert histogram.percentile(0.5) == 1
+    assert histogram.percentile(0.95) == 4
+    # Beyond the last bucket, the maximum is the best estimate there is
+    assert histogram.percentile(1.0) == 20
+    assert histogram.mean == pytest.approx((45 + 27 + 20) / 100)
+
+
+def test_metric_kind_mismatch():
+    registry = Registry()
+    registry.counter("frames")
+    with pytest.raises(TypeError):
+        registry.gauge("frames")
+
+
+def test_metrics_export(tmp_path):
+    registry = Registry()
+    registry.counter("messages.sent").inc(3)
+    registry.histogram("frame.flip").observe(0.003)
+    json_path, csv_path = registry.export(tmp_path / "metrics", "session")
+
+    report = json.loads(json_path.read_text())
+    assert report["metrics"]["messages.sent"] == {"kind": "counter", "value": 3}
+    assert report["metrics"]["frame.flip"]["count"] == 1
+
+    with csv_path.open() as f:
+        rows = {row["name"]: row for row in csv.DictReader(f)}
+    assert rows["messages.sent"]["value"] == "3"
+    assert rows["frame.flip"]["kind"] == "histogram"
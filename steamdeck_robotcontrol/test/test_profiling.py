@@ -0,0 +1,64 @@
+from ..profiling import CHORD_BUTTONS, SessionProfiler, StackSampler, parse_modes
+import pstats
+import pygame
+import pytest
+import threading
+
+
+def test_parse_modes():
+    assert parse_modes(None) == ()
+    assert parse_modes("0") == ()
+    assert parse_modes("all") == ("cprofile", "sample")
+    assert parse_modes("sample") == ("sample",)
+    with pytest.raises(ValueError):
+        parse_modes("perf")
+
+
+def test_stack_sampler_sees_other_threads():
+    stop = threading.Event()
+
+    def receive_worker():
+        stop.wait()
+
+    thread = threading.Thread(target=receive_worker, name="video receive")
+    thread.start()
+    sampler = StackSampler()
+    try:
+        sampler.sample()
+    finally:
+        stop.set()
+        thread.join()
+    stacks = [stack for stack in sampler.stacks if stack[0] == "video receive"]
+    assert len(stacks) == 1
+    assert any(frame.startswith("receive_worker ") for frame in stacks[0])
+    # The thread that the sampler was made on (the main loop's) is left to cProfile
+    assert not any(stack[0] == threading.current_thread().name for stack in sampler.stacks)
+
+
+def test_session_profiler_chord(tmp_path):
+    profiler = SessionProfiler(("cprofile", "sample"), tmp_path)
+    profiler.start()
+    sum(range(1000))
+    # Pressing the chord's buttons one after another only toggles on the last one;
+    # the screen gets the first press, but none of the others, nor their releases
+    first, *middle, last = CHORD_BUTTONS
+    assert not profiler.handle_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=first))
+    assert all(profiler.handle_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=button)) for button in middle)
+    assert profiler.capturing
+    assert profiler.handle_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=last))
+    assert not profiler.capturing
+    assert sorted(path.suffix for path in tmp_path.iterdir()) == [".folded", ".prof"]
+    assert pstats.Stats(str(next(tmp_path.glob("*.prof")))).total_calls > 0
+
+    # Pressing the last button again, while holding the others, starts a new capture
+    assert profiler.handle_event(pygame.event.Event(pygame.JOYBUTTONUP, button=last))
+    assert profiler.handle_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=last))
+    assert profiler.capturing and profiler.captures == 2
+    profiler.stop()
+    assert len(list(tmp_path.glob("*capture2*"))) == 2
+
+    # Once the chord is let go, the buttons go to the screen again
+    assert profiler.handle_event(pygame.event.Event(pygame.JOYBUTTONUP, button=last))
+    assert not profiler.handle_event(pygame.event.Event(pygame.JOYBUTTONUP, button=first))
+    assert not profiler.handle_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=last))
+    assert not profiler.capturing
@@ -0,0 +1,80 @@
+from ..recording import CONTROL, RECEIVED, SENT, VIDEO, Recorder, RecordingReader, RecordingSocket, index_path_for
+from ..server.replay import ReplayServer
+from .. import protocol
+import threading
+import websockets.sync.client
+
+
+class FakeSocket:
+    def __init__(self, incoming):
+        self.incoming = list(incoming)
+        self.sent = []
+        self.closed = False
+
+    def recv(self):
+        return self.incoming.pop(0)
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def close(self):
+        self.closed = True
+
+
+def record_session(path):
+    recorder = Recorder(path)
+    video = RecordingSocket(FakeSocket([protocol.pack_video_frame(1.0, b"jpeg 1"), protocol.pack_video_frame(2.0, b"jpeg 2")]), recorder, VIDEO)
+    control = RecordingSocket(FakeSocket(["telemetry"]), recorder, CONTROL)
+    video.recv()
+    control.send(bytearray(b"!"))
+    control.recv()
+    video.recv()
+    video.close()
+    video.close()
+    # The recording is written out once every socket sharing it is closed
+    assert recorder.thread.is_alive()
+    control.close()
+    assert not recorder.thread.is_alive()
+
+
+def test_recording_round_trip(tmp_path):
+    path = tmp_path / "session.rcrec"
+    record_session(path)
+    reader = RecordingReader(path)
+    assert [(r.channel, r.direction, r.message) for r in reader] == [
+        (VIDEO, RECEIVED, protocol.pack_video_frame(1.0, b"jpeg 1")),
+        (CONTROL, SENT, b"!"),
+        (CONTROL, RECEIVED, "telemetry"),
+        (VIDEO, RECEIVED, protocol.pack_video_frame(2.0, b"jpeg 2")),
+    ]
+    assert reader.index_at(reader.times[2]) == 2
+    reader.close()
+
+
+def test_recording_survives_cut_off_writes(tmp_path):
+    path = tmp_path / "session.rcrec"
+    record_session(path)
+    # As if the app died while writing: the index lost its last entries, and the last record was cut short
+    index_path = index_path_for(path)
+    index_path.write_bytes(index_path.read_bytes()[:20])
+    path.write_bytes(path.read_bytes()[:-3])
+    reader = RecordingReader(path)
+    assert [r.message for r in reader] == [protocol.pack_video_frame(1.0, b"jpeg 1"), b"!", "telemetry"]
+    reader.close()
+
+
+def test_replay_server(tmp_path):
+    path = tmp_path / "session.rcrec"
+    record_session(path)
+    server = ReplayServer(path, speed=0).serve(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        port = server.socket.getsockname()[1]
+        with websockets.sync.client.connect(f"ws://127.0.0.1:{port}{protocol.VIDEO_PATH}") as video:
+            frames = [protocol.unpack_video_frame(video.recv(timeout=2))[1].tobytes() for _ in range(2)]
+        assert frames == [b"jpeg 1", b"jpeg 2"]
+        with websockets.sync.client.connect(f"ws://127.0.0.1:{port}{protocol.CONTROL_PATH}") as control:
+            control.send(protocol.EMERGENCY_STOP)
+            assert control.recv(timeout=2) == "telemetry"
+    finally:
+        server.shutdown()
@@ -1,6 +1,234 @@
 from ..screen import *
+from ..screens.control import RobotControlScreen
+from .. import protocol
+import pygame
+import threading
+import time
+import websockets.exceptions
 
 def test_matching_result():
     match ContinueExecution.value:
         case ContinueExecution(): assert True
-        case _: assert False
\ No newline at end of file
+        case _: assert False
+
+class FakeWebsocket:
+    """Stands in for a websocket connection; recv blocks until the socket is closed."""
+    def __init__(self):
+        self.sent = []
+        self.closed = threading.Event()
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def recv(self):
+        self.closed.wait()
+        raise websockets.exceptions.ConnectionClosedOK(None, None)
+
+    def close(self):
+        self.closed.set()
+
+
+class QueuedWebsocket(FakeWebsocket):
+    """Hands out the given messages, and then waits to be closed."""
+    def __init__(self, *messages):
+        super().__init__()
+        self.messages = list(messages)
+        self.ready = threading.Event()
+        self.ready.set()
+
+    def recv(self):
+        self.ready.wait()
+        if self.messages:
+            return self.messages.pop(0)
+        return super().recv()
+
+
+def test_commands_use_control_channel():
+    pygame.font.init()
+    video, control = FakeWebsocket(), FakeWebsocket()
+    control_screen = RobotControlScreen(video, control)
+    control_screen.handle_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=9))
+    assert control.sent == [b'!']
+    assert video.sent == []
+
+    # The control channel closing ends the session, and closes the video channel too
+    control.close()
+    control_screen.control_recv_thread.join(timeout=1)
+    assert control_screen.closing
+    assert video.closed.is_set()
+
+
+def test_traced_commands(monkeypatch, tmp_path):
+    from .. import tracing
+    monkeypatch.setenv(tracing.TRACE_ENV, "1")
+    monkeypatch.setenv("ROBOTCONTROL_DATA_DIR", str(tmp_path))
+    pygame.font.init()
+    video, control = FakeWebsocket(), FakeWebsocket()
+    control_screen = RobotControlScreen(video, control)
+    control_screen.handle_event(pygame.event.Event(pygame.JOYAXISMOTION, axis=1, value=-1.0))
+    control_screen.last_send_time = 0
+    time.sleep(0.02)
+    control_screen.should_render_frame()
+    control_screen.handle_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=9))
+    control.close()
+    control_screen.control_recv_thread.join(timeout=1)
+    control_screen.run_frame(pygame.Surface((320, 200)))
+
+    offsets, stop = control.sent
+    assert protocol.unpack_wheel_values(offsets)[1][0] == 1
+    assert protocol.unpack_trace(stop, 1)[0] == 2
+    spans = tracing.read_spans(next((tmp_path / "traces").glob("client-spans-*.jsonl")))
+    assert [(span["seq"], span["kind"]) for span in spans] == [(1, "T"), (2, "!")]
+    assert spans[0]["input"] < spans[0]["integrated"] <= spans[0]["sent"]
+
+
+def test_startup_screen():
+    from ..startup import StartupScreen
+    from ..screens.menu import VerticalMenuScreen
+    pygame.font.init()
+    display = pygame.Surface((320, 200))
+    warmed_up = threading.Event()
+    background_done = threading.Event()
+    menu = VerticalMenuScreen([(1, 'One'), (2, 'Two')])
+    startup_screen = StartupScreen(lambda: menu if warmed_up.is_set() else None, tasks=[warmed_up.set], font_sizes=[24],
+                                   background_tasks=[lambda: background_done.wait(timeout=5)])
+
+    # The first frame is shown without waiting for anything
+    assert startup_screen.run_frame(display) == ContinueExecution.value
+    for thread in startup_screen.threads:
+        thread.join(timeout=1)
+    results = [startup_screen.run_frame(display) for _ in range(2)]
+    # The next screen is only made after the warm-up tasks and font preloading are done, but not the background tasks
+    assert results[0] == ContinueExecution.value
+    assert results[1] == CallAnother(menu)
+    assert not background_done.is_set()
+    background_done.set()
+    assert not startup_screen.should_render_frame()
+
+    startup_screen.receive_data(menu, 2)
+    assert startup_screen.should_render_frame()
+    assert startup_screen.run_frame(display) == ReturnToCaller(2)
+
+
+def test_coroutine_screen():
+    from ..screens.coroutine_screen import CoroutineScreen, call, events, next_frame, run_in_thread, sleep, wait
+    display = pygame.Surface((320, 200))
+    log = []
+    other_screen = FakeWebsocket()  # Any object will do, since it's only passed along
+
+    async def flow():
+        drawn_on = await next_frame()
+        log.append(drawn_on is display)
+        received = await events()
+        log.append([event.button for event in received])
+        await sleep(0.01)
+        log.append(await call(other_screen))
+        log.append(await wait(run_in_thread(lambda: 42)))
+        return 'done'
+
+    coroutine_screen = CoroutineScreen(flow())
+    assert coroutine_screen.should_render_frame()
+    assert coroutine_screen.run_frame(display) == ContinueExecution.value
+    assert log == [True]
+
+    # While waiting for events, no frames are needed
+    assert not coroutine_screen.should_render_frame()
+    coroutine_screen.handle_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=0))
+    coroutine_screen.handle_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=1))
+    assert not coroutine_screen.should_render_frame()  # Now sleeping
+    assert log == [True, [0, 1]]
+    time.sleep(0.02)
+    assert coroutine_screen.should_render_frame()
+    assert coroutine_screen.run_frame(display) == CallAnother(other_screen)
+    coroutine_screen.receive_data(other_screen, 'returned')
+    assert log[2] == 'returned'
+
+    deadline = time.perf_counter() + 1
+    while not coroutine_screen.should_render_frame():
+        assert time.perf_counter() < deadline
+    assert log[3] == 42
+    assert coroutine_screen.run_frame(display) == ReturnToCaller('done')
+
+
+def test_connection_error_can_be_given_up():
+    from ..screens.control import robot_control_wrapper
+    from ..screens.coroutine_screen import CoroutineScreen, _Events
+    pygame.font.init()
+    display = pygame.Surface((320, 200))
+    # Nothing listens on port 1, so the connection is refused right away
+    control_screen = CoroutineScreen(robot_control_wrapper('127.0.0.1:1'))
+    deadline = time.perf_counter() + 5
+    result = ContinueExecution.value
+    pressed = False
+    while result == ContinueExecution.value:
+        assert time.perf_counter() < deadline
+        if control_screen.should_render_frame():
+            result = control_screen.run_frame(display)
+        elif isinstance(control_screen.request, _Events) and control_screen.request.until is None and not pressed:
+            # The error is shown, and the screen waits for a button: give up
+            control_screen.handle_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=1))
+            pressed = True
+        else:
+            time.sleep(0.01)
+    assert result == ReturnToCaller(None)
+
+
+def test_metrics_overlay():
+    from ..metrics import Registry
+    from ..overlay import MetricsOverlay, TOGGLE_BUTTON
+    pygame.font.init()
+    registry = Registry()
+    registry.histogram("frame.flip").observe(0.002)
+    registry.counter("messages.sent").inc()
+    overlay = MetricsOverlay(registry)
+    display = pygame.Surface((320, 200))
+
+    # Hidden until toggled, and other events are left for the screen
+    overlay.draw(display)
+    assert display.get_at((0, 0)) == (0, 0, 0, 255)
+    assert not overlay.handle_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=0))
+    assert overlay.handle_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=TOGGLE_BUTTON))
+
+    display.fill("white")
+    overlay.draw(display)
+    assert display.get_at((0, 0)) != (255, 255, 255, 255)
+    assert overlay.lines()[0].startswith("frame.flip: n=1")
+
+
+def test_video_frame_timings():
+    from ..server.standin import synthetic_frames
+    pygame.font.init()
+
+    captured = time.time()
+    video = QueuedWebsocket(protocol.pack_video_frame(captured, synthetic_frames(64, 48, 80, count=1)[0]))
+    control_screen = RobotControlScreen(video, FakeWebsocket(), frame_timings=[])
+    deadline = time.perf_counter() + 2
+    while control_screen.latest_video_frame.get_size() != (64, 48):
+        assert time.perf_counter() < deadline
+        time.sleep(0.01)
+    video.close()
+    control_screen.video_recv_thread.join(timeout=1)
+    [(when_captured, received, decode, convert, ready)] = control_screen.frame_timings
+    assert when_captured == captured <= received <= ready
+    assert decode > 0 and convert > 0
+
+
+def test_emergency_stop_round_trip():
+    from ..session_archive import SessionRecorder
+    pygame.font.init()
+    control = QueuedWebsocket(protocol.EMERGENCY_STOP_ACKNOWLEDGED)
+    # The acknowledgement only arrives once the stop has been sent
+    control.ready.clear()
+    session = SessionRecorder("robot:5555")
+    control_screen = RobotControlScreen(FakeWebsocket(), control, session=session)
+    control_screen.handle_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=9))
+    control.ready.set()
+    deadline = time.perf_counter() + 2
+    while not session.emergency_stop_rtts:
+        assert time.perf_counter() < deadline
+        time.sleep(0.01)
+    assert control_screen.emergency_stop_sent_at is None
+    assert 0 < session.emergency_stop_rtts[0] < 2
+    assert len(session.command_times) == 1
+    control.close()
+    control_screen.control_recv_thread.join(timeout=1)
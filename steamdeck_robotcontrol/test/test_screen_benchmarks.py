@@ -0,0 +1,32 @@
+from benchmarks import screens
+
+
+def results(calibration, **medians):
+    """Benchmark results with the given run_frame medians, and a handle_event that never changes."""
+    return {"calibration_seconds": calibration, "results": {
+        name: {"run_frame": {"p50": median}, "handle_event": {"p50": 2e-6}} for name, median in medians.items()
+    }}
+
+
+def test_doubled_frame_time_is_a_regression():
+    baseline = results(1.0, menu=0.004, text_input=0.001)
+    regressions = screens.compare(baseline, results(1.0, menu=0.008, text_input=0.0011))
+    assert [line.split(":")[0] for line in regressions] == ["menu run_frame"]
+
+
+def test_baselines_scale_with_the_calibration():
+    baseline = results(1.0, menu=0.004)
+    # Twice as slow, on a machine that draws twice as slowly
+    assert screens.compare(baseline, results(2.0, menu=0.008)) == []
+    assert screens.compare(baseline, results(0.5, menu=0.004)) != []
+
+
+def test_tiny_differences_are_not_regressions():
+    # Three times slower, but by less than the timer noise
+    assert screens.compare(results(1.0, menu=2e-6), results(1.0, menu=6e-6)) == []
+
+
+def test_check_uses_given_results():
+    baseline = results(1.0, menu=0.004)
+    assert screens.check(baseline, frames=0, attempts=1, current=results(1.0, menu=0.005)) == []
+    assert screens.check(baseline, frames=0, attempts=1, current=results(1.0, menu=0.009)) != []
@@ -0,0 +1,120 @@
+from ..server import ClientQueue, ControlArbiter, FrameBroadcaster
+from .. import protocol
+import threading
+import time
+
+
+class FakeSocket:
+    """Records what was sent to it, optionally waiting for permission before each send."""
+    def __init__(self, blocked=False):
+        self.sent = []
+        self.may_send = threading.Event()
+        if not blocked:
+            self.may_send.set()
+
+    def send(self, data):
+        self.may_send.wait()
+        self.sent.append(data)
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError
+        time.sleep(0.001)
+
+
+def test_video_frame_roundtrip():
+    msg = protocol.pack_video_frame(1234.5, b'jpeg data')
+    when, data = protocol.unpack_video_frame(msg)
+    assert when == 1234.5
+    assert bytes(data) == b'jpeg data'
+
+
+def test_trace_trailer_is_optional():
+    msg = protocol.pack_wheel_values(protocol.WHEEL_PAIR_OFFSETS, (1, -2, 3, -4))
+    assert protocol.unpack_wheel_values(msg) == ((1, -2, 3, -4), None)
+    msg = protocol.pack_wheel_values(protocol.WHEEL_PAIR_OFFSETS, (1, -2, 3, -4), (7, 1234.5))
+    assert protocol.unpack_wheel_values(msg) == ((1, -2, 3, -4), (7, 1234.5))
+    assert protocol.unpack_trace(protocol.pack_emergency_stop(), 1) is None
+    assert protocol.unpack_trace(protocol.pack_emergency_stop((8, 1235.0)), 1) == (8, 1235.0)
+
+
+def test_broadcast_reaches_every_client():
+    broadcaster = FrameBroadcaster()
+    sockets = [FakeSocket() for _ in range(3)]
+    for socket in sockets:
+        broadcaster.add_client(socket)
+
+    frame = b'F' + bytes(100)
+    broadcaster.broadcast(frame)
+    for socket in sockets:
+        wait_until(lambda: socket.sent)
+        # The very same object is sent everywhere, so it was only built once
+        assert socket.sent[0] is frame
+
+
+def test_slow_client_drops_frames_without_stalling_others():
+    broadcaster = FrameBroadcaster(queue_size=2)
+    slow = FakeSocket(blocked=True)
+    fast = FakeSocket()
+    slow_client = broadcaster.add_client(slow)
+    broadcaster.add_client(fast)
+
+    for i in range(10):
+        broadcaster.broadcast(bytes([i]))
+        wait_until(lambda: len(fast.sent) == i + 1)
+
+    # The slow client holds at most one frame in flight, plus the queue;
+    # the rest was dropped, keeping the newest.
+    assert slow_client.dropped >= 10 - 1 - 2
+    slow.may_send.set()
+    wait_until(lambda: slow.sent and slow.sent[-1] == bytes([9]))
+    assert len(slow.sent) <= 3
+
+
+def test_removed_client_stops_receiving():
+    broadcaster = FrameBroadcaster()
+    socket = FakeSocket()
+    client = broadcaster.add_client(socket)
+    broadcaster.remove_client(client)
+    broadcaster.broadcast(b'F')
+    assert not broadcaster.has_clients()
+    client.sender_thread.join(timeout=1)
+    assert socket.sent == []
+
+
+def test_messages_are_not_dropped_and_go_first():
+    socket = FakeSocket(blocked=True)
+    client = ClientQueue(socket, maxsize=2)
+    client.offer(b'F0')
+    # The sending thread is now stuck sending the first frame
+    wait_until(lambda: not client.frames)
+    for i in range(1, 5):
+        client.offer(f'F{i}'.encode())
+    client.send(b'A')
+    socket.may_send.set()
+    wait_until(lambda: len(socket.sent) == 4)
+    assert socket.sent == [b'F0', b'A', b'F3', b'F4']
+
+
+def test_failing_client_closes_itself():
+    class BrokenSocket:
+        def send(self, data):
+            raise ConnectionError
+    client = ClientQueue(BrokenSocket())
+    client.offer(b'F')
+    client.sender_thread.join(timeout=1)
+    assert client.closed
+
+
+def test_only_one_client_has_control():
+    arbiter = ControlArbiter()
+    first, second = object(), object()
+    assert arbiter.try_acquire(first)
+    assert not arbiter.try_acquire(second)
+    assert not arbiter.release(second)
+    assert arbiter.release(first)
+    assert arbiter.try_acquire(second)
+    assert arbiter.has_control(second)
@@ -0,0 +1,82 @@
+from .. import session_archive
+from ..screen import ReturnToCaller
+from ..screens.history import SessionHistoryScreen
+import math
+import pygame
+
+
+def recorded_session(server, latency, days_ago):
+    recorder = session_archive.SessionRecorder(server)
+    # As if the session started a minute ago, and a frame arrived every second since then
+    recorder.started -= 60 + days_ago * 86400
+    recorder.started_clock -= 60
+    recorder.frame_times.extend(float(t) for t in range(60))
+    recorder.frame_latencies.extend([latency] * 60)
+    recorder.draw_times.extend(float(t) for t in range(60))
+    recorder.command_times.extend([10.2, 10.6])
+    recorder.emergency_stop_acknowledged(0.02)
+    recorder.reconnects = 1
+    return recorder
+
+
+def test_sessions_are_archived_by_server():
+    recorder = recorded_session("robot.local:5555", 0.03, 2)
+    key = recorder.save()
+    recorded_session("robot.local:5555", 0.05, 1).save()
+    recorded_session("other:5555", 0.01, 1).save()
+    # A connection attempt without video isn't a session
+    assert session_archive.SessionRecorder("robot.local:5555").save() is None
+
+    sessions = session_archive.load("robot.local:5555")
+    assert [session["summary"]["latency_p50"] for session in sessions] == [0.03, 0.05]
+    assert [session["summary"]["server"] for session in session_archive.load("other:5555")] == ["other:5555"]
+    summary = sessions[0]["summary"]
+    assert summary["frames_received"] == 60 and summary["reconnects"] == 1 and summary["emergency_stop_rtt"] == 0.02
+    assert math.isclose(summary["fps"], 1.0, rel_tol=0.05)
+    series = sessions[0]["series"]
+    assert len(series["t"]) == len(series["latency_p50"]) == 60
+    assert series["latency_p50"][0] == 0.03 and math.isclose(series["command_rate"][10], 2.0, rel_tol=0.01)
+
+    # The series are stored as packed arrays
+    archive = session_archive.open_archive()
+    row = archive.run_query(lambda conn: conn.execute(f"SELECT codec, length(value_json) FROM {archive.table} WHERE key=?", (key,)).fetchone())
+    assert row[0] == "binary" and row[1] < 5 * 60 * 8 + 1000
+
+
+def test_old_sessions_are_pruned(monkeypatch):
+    monkeypatch.setattr(session_archive, "MAX_SESSIONS_PER_SERVER", 3)
+    recorded_session("pruned:5555", 0.01, session_archive.MAX_AGE_DAYS + 1).save()
+    for days_ago in (5, 4, 3, 2):
+        recorded_session("pruned:5555", days_ago / 100, days_ago).save()
+    recorded_session("pruned:55555", 0.01, 1).save()
+    # Only the latest three are kept, and a server whose address starts the same is left alone
+    assert [session["summary"]["latency_p50"] for session in session_archive.load("pruned:5555")] == [0.04, 0.03, 0.02]
+    assert len(session_archive.load("pruned:55555")) == 1
+
+    monkeypatch.setattr(session_archive, "MAX_SESSIONS_PER_SERVER", 10)
+    recorded_session("expired:5555", 0.01, session_archive.MAX_AGE_DAYS + 1).save()
+    assert session_archive.load("expired:5555") == []
+
+
+def loaded(history_screen):
+    history_screen.loading.result(timeout=5)
+    return history_screen
+
+
+def test_history_screen():
+    pygame.font.init()
+    recorded_session("history:5555", 0.03, 2).save()
+    recorded_session("history:5555", 0.04, 1).save()
+    display = pygame.Surface((1280, 800))
+    history_screen = loaded(SessionHistoryScreen("History", "history:5555"))
+    assert history_screen.should_render_frame()
+    history_screen.run_frame(display)
+    assert history_screen.selected == 1
+    assert history_screen.handle_event(pygame.event.Event(pygame.JOYHATMOTION, hat=0, value=(-1, 0)))
+    assert history_screen.selected == 0 and history_screen.should_render_frame()
+    history_screen.run_frame(display)
+
+    empty_screen = loaded(SessionHistoryScreen("Nothing", "nothing:5555"))
+    empty_screen.run_frame(display)
+    empty_screen.handle_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=1))
+    assert empty_screen.run_frame(display) == ReturnToCaller(None)
@@ -0,0 +1,26 @@
+from ..tracing import SpanLog, join_spans, read_spans, stage_breakdown
+import pytest
+
+
+def test_span_log_round_trip(tmp_path):
+    span_log = SpanLog(tmp_path / "client-spans.jsonl")
+    assert [span_log.next_sequence() for _ in range(2)] == [1, 2]
+    span_log.record({"seq": 1, "kind": "!"})
+    span_log.close()
+    assert read_spans(tmp_path / "client-spans.jsonl") == [{"seq": 1, "kind": "!"}]
+
+
+def test_join_and_breakdown():
+    client = [
+        {"seq": 1, "kind": "T", "input": 10.0, "integrated": 10.004, "send_start": 10.005, "client_sent": 10.005, "sent": 10.006},
+        # Held joystick, no new input event; and the server never got it
+        {"seq": 2, "kind": "T", "input": None, "integrated": 10.1, "send_start": 10.1, "client_sent": 10.1, "sent": 10.101},
+    ]
+    # The server's clock is 2 seconds ahead
+    server = [{"seq": 1, "kind": "T", "client_sent": 10.005, "received": 12.015, "parsed": 12.016, "serial_written": 12.018}]
+    joined = join_spans(client, server, clock_offset=2.0)
+    assert len(joined) == 1
+    durations = stage_breakdown(joined)
+    assert durations["network"] == [pytest.approx(0.010)]
+    assert durations["serial write"] == [pytest.approx(0.002)]
+    assert durations["total"] == [pytest.approx(0.018)]
@@ -0,0 +1,84 @@
+from ..udp_video import FrameReassembler, LossyDatagramSocket, UDPVideoClient, UDPVideoReceiver, fragment_frame
+from .. import protocol
+import pytest
+import socket
+import threading
+import time
+
+
+def make_frame(i, size=5000):
+    return protocol.pack_video_frame(float(i), bytes([i % 256]) * size)
+
+
+def test_fragments_reassemble():
+    frame = make_frame(1)
+    datagrams = fragment_frame(1, frame, max_payload=1000)
+    assert len(datagrams) == 6
+    reassembler = FrameReassembler()
+    # Order of arrival doesn't matter
+    for datagram in reversed(datagrams[1:]):
+        assert reassembler.add(datagram) is None
+    assert reassembler.add(datagrams[0]) == frame
+    assert reassembler.frames_lost == 0
+
+
+def test_incomplete_frames_are_dropped_and_counted():
+    reassembler = FrameReassembler()
+    first = fragment_frame(1, make_frame(1), max_payload=1000)
+    second = fragment_frame(2, make_frame(2), max_payload=1000)
+    third = fragment_frame(3, make_frame(3), max_payload=1000)
+    for datagram in first:
+        reassembler.add(datagram)
+    # The second frame loses a fragment, and the third one overtakes it
+    for datagram in second[:-1]:
+        reassembler.add(datagram)
+    results = [reassembler.add(d) for d in third]
+    assert results[-1] == make_frame(3)
+    assert reassembler.frames_lost == 1
+    assert not reassembler.pending
+    # The missing fragment turning up late is not useful any more
+    assert reassembler.add(second[-1]) is None
+
+
+def test_loopback_with_loss():
+    receiver = UDPVideoReceiver(("127.0.0.1", 0))
+    sender_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    lossy = LossyDatagramSocket(sender_socket, loss=0.05, seed=1)
+    client = UDPVideoClient(lossy, ("127.0.0.1", receiver.port))
+
+    received = []
+    def receive():
+        try:
+            while True:
+                received.append(receiver.recv())
+        except ConnectionAbortedError:
+            pass
+    thread = threading.Thread(target=receive, daemon=True)
+    thread.start()
+
+    frames = [make_frame(i) for i in range(100)]
+    for frame in frames:
+        client.send(frame)
+    # An intact last frame, so that everything before it is accounted for
+    client.sock = sender_socket
+    client.send(make_frame(100))
+
+    deadline = time.perf_counter() + 2
+    while not (received and received[-1] == make_frame(100)) and time.perf_counter() < deadline:
+        time.sleep(0.001)
+    receiver.close()
+    thread.join(timeout=1)
+
+    assert lossy.dropped > 0
+    assert received[-1] == make_frame(100)
+    # Every frame that arrived is intact and in order, and the rest were counted as lost
+    assert all(frame in frames for frame in received[:-1])
+    assert received[:-1] == sorted(received[:-1], key=frames.index)
+    assert len(received) + receiver.frames_lost == 101
+
+
+def test_closed_receiver_raises():
+    receiver = UDPVideoReceiver(("127.0.0.1", 0), poll_interval=0.01)
+    receiver.close()
+    with pytest.raises(ConnectionAbortedError):
+        receiver.recv()
@@ -0,0 +1,155 @@
+"""
+Tracing of commands from the joystick to the serial port, for a per-stage breakdown of input-to-motion latency.
+
+When ROBOTCONTROL_TRACE is set (to anything but 0), the app appends a trace trailer to the S, T and ! messages it sends:
+a sequence number and the time it sent the message (see PROTOCOL.md). Both sides write a span log,
+one JSON object per line for each traced message, with the times (from time.time()) that the message reached each stage:
+
+    client: input (the first joystick event it answers, if any), integrated, send_start, client_sent, sent
+    server: client_sent (from the trailer), received, parsed, serial_written (if anything was written)
+
+The client writes into the `traces` folder of the data directory, the server (demo_server.py) into `./traces`.
+Records are written on a thread of their own, so tracing doesn't hold up the loops it measures.
+
+The logs of the two sides are joined on the sequence number and the client's send time, and summarized with:
+
+    python -m steamdeck_robotcontrol.tracing client-spans.jsonl server-spans.jsonl [--clock-offset SECONDS]
+
+The network stage compares clocks of two machines, so it is only as good as their synchronization;
+--clock-offset (the server's clock minus the client's) corrects a known offset.
+"""
+import argparse
+import json
+import os
+import pathlib
+import queue
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TRACE_ENV = "ROBOTCONTROL_TRACE"
+
+# Each stage, as the span fields it is measured between, in the order a command goes through them
+STAGES = [
+    ("input to integration", "input", "integrated"),
+    ("integration to send", "integrated", "send_start"),
+    ("websocket send", "send_start", "sent"),
+    ("network", "client_sent", "received"),
+    ("server parse", "received", "parsed"),
+    ("serial write", "parsed", "serial_written"),
+]
+# Fields that were recorded by the server's clock
+SERVER_FIELDS = {"received", "parsed", "serial_written"}
+
+_STOP = object()
+
+
+class SpanLog:
+    """Writes span records as JSON lines into a file, from a background thread."""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.sequence = 0
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, daemon=True, name="span log writer")
+        self.thread.start()
+
+    def next_sequence(self) -> int:
+        self.sequence = (self.sequence + 1) % 2**32
+        return self.sequence
+
+    def record(self, span: dict):
+        self.queue.put(span)
+
+    def run(self):
+        with self.path.open("a") as f:
+            while True:
+                span = self.queue.get()
+                if span is _STOP:
+                    return
+                f.write(json.dumps(span) + "\n")
+                if self.queue.empty():
+                    f.flush()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join()
+
+
+def from_environment(side: str, directory: pathlib.Path) -> Optional[SpanLog]:
+    """A span log for this side of the connection in the directory, if tracing is enabled, otherwise None."""
+    if os.environ.get(TRACE_ENV, "0") in ("", "0"):
+        return None
+    return SpanLog(directory / f"{side}-spans-{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+
+
+def read_spans(path: pathlib.Path) -> List[dict]:
+    with path.open() as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def join_spans(client_spans: Iterable[dict], server_spans: Iterable[dict], clock_offset: float = 0.0) -> List[dict]:
+    """
+    Merge the client's and the server's record of each message, moving the server's times onto the client's clock.
+    Messages that only one side recorded are left out.
+    """
+    server_by_key: Dict[Tuple[int, float], dict] = {(span["seq"], span["client_sent"]): span for span in server_spans}
+    joined = []
+    for span in client_spans:
+        server_span = server_by_key.get((span["seq"], span["client_sent"]))
+        if server_span is None:
+            continue
+        merged = dict(span)
+        for field in SERVER_FIELDS:
+            if server_span.get(field) is not None:
+                merged[field] = server_span[field] - clock_offset
+        joined.append(merged)
+    return joined
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def stage_breakdown(spans: Iterable[dict]) -> Dict[str, List[float]]:
+    """The durations of each stage (and of the whole way, from the first recorded stage to the last), in seconds."""
+    durations: Dict[str, List[float]] = {name: [] for name, _, _ in STAGES}
+    durations["total"] = []
+    order = [field for _, field, _ in STAGES] + [STAGES[-1][2]]
+    for span in spans:
+        for name, start, end in STAGES:
+            if span.get(start) is not None and span.get(end) is not None:
+                durations[name].append(span[end] - span[start])
+        recorded = [span[field] for field in order if span.get(field) is not None]
+        if len(recorded) >= 2:
+            durations["total"].append(recorded[-1] - recorded[0])
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("client", type=pathlib.Path, help="The client's span log")
+    parser.add_argument("server", type=pathlib.Path, help="The server's span log")
+    parser.add_argument("--clock-offset", type=float, default=0.0, help="How far the server's clock is ahead of the client's, in seconds")
+    parser.add_argument("--kind", help="Only include messages of this kind (S, T or !)")
+    args = parser.parse_args()
+
+    client_spans = read_spans(args.client)
+    if args.kind:
+        client_spans = [span for span in client_spans if span["kind"] == args.kind]
+    joined = join_spans(client_spans, read_spans(args.server), args.clock_offset)
+    print(f"{len(joined)} of {len(client_spans)} traced messages were recorded by both sides")
+    print(f"{'stage':<22} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for name, values in stage_breakdown(joined).items():
+        if values:
+            print(f"{name:<22} {len(values):>6} {percentile(values, 0.5) * 1000:>9.2f} {percentile(values, 0.95) * 1000:>9.2f} {max(values) * 1000:>9.2f}")
+    network = stage_breakdown(joined)["network"]
+    if network and min(network) < 0:
+        print("Some network times are negative: the clocks are out of sync, try --clock-offset")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Video transport over UDP datagrams, as an alternative to the video websocket.
+
+Each video frame message (the same bytes as would be sent over the websocket) is split into fragments
+that fit into a datagram. The receiver puts them back together, and if any fragment of a frame is lost,
+the whole frame is dropped instead of delaying the frames after it.
+See PROTOCOL.md for the datagram layout.
+"""
+import random
+import socket
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+UDP_VIDEO_FRAGMENT = b"V"
+FRAGMENT_HEADER = struct.Struct(">IHH")  # frame sequence number, fragment index, fragment count
+FRAGMENT_HEADER_SIZE = 1 + FRAGMENT_HEADER.size
+MAX_FRAGMENT_PAYLOAD = 1200  # Keeps datagrams below the usual Ethernet/Wi-Fi MTU, so the IP layer doesn't fragment them
+
+
+def fragment_frame(sequence: int, frame: bytes, max_payload: int = MAX_FRAGMENT_PAYLOAD) -> List[bytes]:
+    """Split a frame into datagrams, each one carrying the fragment header."""
+    view = memoryview(frame)
+    count = max(1, -(-len(frame) // max_payload))
+    if count > 0xFFFF:
+        raise ValueError(f"Frame of {len(frame)} bytes needs too many fragments")
+    datagrams = []
+    for index in range(count):
+        datagram = bytearray(FRAGMENT_HEADER_SIZE)
+        datagram[0:1] = UDP_VIDEO_FRAGMENT
+        FRAGMENT_HEADER.pack_into(datagram, 1, sequence & 0xFFFFFFFF, index, count)
+        datagram.extend(view[index * max_payload:(index + 1) * max_payload])
+        datagrams.append(bytes(datagram))
+    return datagrams
+
+
+class FrameReassembler:
+    """
+    Collects fragments into complete frames.
+
+    Only frames newer than the last one delivered are kept.
+    When a frame is completed, every older incomplete frame is given up on and counted as lost,
+    as are frames from which not a single fragment arrived.
+    """
+
+    def __init__(self, max_pending: int = 4):
+        self.max_pending = max_pending
+        # Sequence number -> [number of missing fragments, fragment payloads]
+        self.pending: Dict[int, list] = dict()
+        self.last_delivered: Optional[int] = None
+        self.frames_delivered = 0
+        self.frames_lost = 0
+        self.datagrams_received = 0
+        self.datagrams_ignored = 0
+
+    def add(self, datagram: bytes) -> Optional[bytes]:
+        """Accept a datagram, returning the frame if this datagram completed one."""
+        self.datagrams_received += 1
+        if len(datagram) < FRAGMENT_HEADER_SIZE or datagram[0:1] != UDP_VIDEO_FRAGMENT:
+            self.datagrams_ignored += 1
+            return None
+        sequence, index, count = FRAGMENT_HEADER.unpack_from(datagram, 1)
+        if self.last_delivered is not None and sequence <= self.last_delivered:
+            # Arrived after a newer frame was shown; too late to be useful
+            self.datagrams_ignored += 1
+            return None
+
+        entry = self.pending.get(sequence)
+        if entry is None:
+            entry = [count, [None] * count]
+            self.pending[sequence] = entry
+        parts = entry[1]
+        if index >= len(parts):
+            self.datagrams_ignored += 1
+            return None
+        if parts[index] is None:
+            parts[index] = datagram[FRAGMENT_HEADER_SIZE:]
+            entry[0] -= 1
+
+        if entry[0] == 0:
+            del self.pending[sequence]
+            for older in [s for s in self.pending if s < sequence]:
+                del self.pending[older]
+            if self.last_delivered is not None:
+                self.frames_lost += sequence - self.last_delivered - 1
+            self.last_delivered = sequence
+            self.frames_delivered += 1
+            return b"".join(parts)
+
+        # Keep memory bounded if fragments keep getting lost;
+        # the dropped frames will be counted as lost when a newer one completes.
+        while len(self.pending) > self.max_pending:
+            del self.pending[min(self.pending)]
+        return None
+
+
+class UDPVideoClient:
+    """
+    Server-side handle for a client that receives video over UDP.
+
+    Has the same send() method as a websocket connection, so it can be registered with a FrameBroadcaster.
+    """
+
+    def __init__(self, sock: socket.socket, address: Tuple[str, int], max_payload: int = MAX_FRAGMENT_PAYLOAD):
+        self.sock = sock
+        self.address = address
+        self.max_payload = max_payload
+        self.sequence = 0
+
+    def send(self, frame: bytes):
+        self.sequence += 1
+        for datagram in fragment_frame(self.sequence, frame, self.max_payload):
+            self.sock.sendto(datagram, self.address)
+
+
+class UDPVideoReceiver:
+    """
+    Client-side receiver that binds a UDP socket and returns complete frames.
+
+    Has the same recv() and close() methods as a websocket connection, so it can be used as the video source
+    of a RobotControlScreen. After closing, recv() raises ConnectionAbortedError.
+    """
+
+    def __init__(self, bind_address: Tuple[str, int] = ("0.0.0.0", 0), poll_interval: float = 0.25):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # A bigger receive buffer lets a whole burst of fragments of a frame wait while we're busy decoding
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.sock.bind(bind_address)
+        # Closing a socket from another thread does not wake up a blocked recvfrom, so we poll instead.
+        self.sock.settimeout(poll_interval)
+        self.reassembler = FrameReassembler()
+        self.closed = threading.Event()
+
+    @property
+    def port(self) -> int:
+        return self.sock.getsockname()[1]
+
+    @property
+    def frames_lost(self) -> int:
+        return self.reassembler.frames_lost
+
+    def recv(self) -> bytes:
+        while True:
+            if self.closed.is_set():
+                raise ConnectionAbortedError("UDP video receiver was closed")
+            try:
+                datagram, _ = self.sock.recvfrom(65536)
+            except TimeoutError:
+                continue
+            except OSError:
+                if self.closed.is_set():
+                    raise ConnectionAbortedError("UDP video receiver was closed")
+                raise
+            frame = self.reassembler.add(datagram)
+            if frame is not None:
+                return frame
+
+    def close(self):
+        if not self.closed.is_set():
+            self.closed.set()
+            self.sock.close()
+
+
+class LossyDatagramSocket:
+    """
+    Wraps a UDP socket, dropping some of the datagrams sent through it.
+    Used for testing how the video transport copes with packet loss.
+    """
+
+    def __init__(self, sock: socket.socket, loss: float, seed: Optional[int] = None):
+        self.sock = sock
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.dropped = 0
+
+    def sendto(self, data: bytes, address):
+        if self.random.random() < self.loss:
+            self.dropped += 1
+            return len(data)
+        return self.sock.sendto(data, address)